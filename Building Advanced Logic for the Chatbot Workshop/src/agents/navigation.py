@@ -1,16 +1,23 @@
+from agents.plan import PlanExecutor, PlanResult
+from tools.results import GeocodeHit, PlaceList, Route
+from utils.executor import ExecutorSaturated
 from utils.prompt import SYSTEM_PROMPT
+from utils.tracing import propagate, tracer
+import asyncio
+import functools
 import yaml
 import re
 from langchain.prompts import PromptTemplate
 from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
-from typing import Optional, Tuple, Dict
+from typing import Any, Callable, List, Optional, Tuple, Dict, Union
 
 
 class GeocodingResult(BaseModel):
     address: str
     latitude: float
     longitude: float
+    title: Optional[str] = None
 
 
 class RoutingResult(BaseModel):
@@ -20,14 +27,23 @@ class RoutingResult(BaseModel):
     duration_hours: float
 
 
+class PlaceResult(BaseModel):
+    title: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
 class DiscoverResult(BaseModel):
     query: str
-    results: str
+    results: List[PlaceResult]
 
 
 class AutosuggestResult(BaseModel):
     query: str
-    suggestions: str
+    suggestions: List[PlaceResult]
+
+
+ToolResult = Union[GeocodingResult, RoutingResult, DiscoverResult, AutosuggestResult]
 
 
 class NavigationResult(BaseModel):
@@ -36,83 +52,267 @@ class NavigationResult(BaseModel):
     routing_result: Optional[RoutingResult] = None
     discover_result: Optional[DiscoverResult] = None
     autosuggest_result: Optional[AutosuggestResult] = None
+    plan_result: Optional[PlanResult] = None
+    params: Optional[Dict[str, Any]] = Field(None, description="The tool parameters the action was run with")
+    here_response: Optional[Any] = Field(None, description="The raw HERE response, kept only in debug mode")
     raw_response: str = Field(..., description="The raw response from the model")
 
 
+ACTIONS = ("geocode", "route", "discover", "autosuggest")
+
+_LAT_LON = re.compile(r"^\s*-?\d+(?:\.\d+)?\s*,\s*-?\d+(?:\.\d+)?\s*$")
+
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+
+def _emit(on_event: Optional[EventCallback], event: str, **data):
+    if on_event is not None:
+        on_event(event, data)
+
+
 class NavigationAgent:
-    def __init__(self, llm, geocode_tool, route_tool, discover_tool, autosuggest_tool):
+    def __init__(self, llm, geocode_tool, route_tool, discover_tool, autosuggest_tool, executor=None, router=None,
+                 plan_executor=None):
         self.llm = llm
+        self.executor = executor
+        self.router = router
+        self.plan_executor = plan_executor or PlanExecutor(ACTIONS)
         self.geocode_tool = geocode_tool
         self.route_tool = route_tool
         self.discover_tool = discover_tool
         self.autosuggest_tool = autosuggest_tool
         self.output_parser = PydanticOutputParser(pydantic_object=NavigationResult)
 
+        # Everything before {query} is identical across calls, so the model
+        # layer can keep its KV state instead of re-evaluating it.
+        self.prompt_prefix = SYSTEM_PROMPT + "\n\nUser query: "
         self.prompt = PromptTemplate(
-            template=SYSTEM_PROMPT + "\n\nUser query: {query}\n\nResponse:",
+            template=self.prompt_prefix + "{query}\n\nResponse:",
             input_variables=["query"]
         )
 
-    def run(self, query: str):
+    def run(self, query: str, on_event: Optional[EventCallback] = None):
+        try:
+            action, params, raw_output = self._decide(query, on_event)
+        except Exception as e:
+            return self._error_result(e)
+        return self.execute(action, params, raw_output, on_event)
+
+    async def arun(self, query: str, on_event: Optional[EventCallback] = None):
         try:
-            _input = self.prompt.format(query=query)
-            raw_output = self.llm.invoke(_input)
+            action, params, raw_output = await self._adecide(query, on_event)
+        except ExecutorSaturated:
+            raise
+        except Exception as e:
+            return self._error_result(e)
+        return await self.aexecute(action, params, raw_output, on_event)
 
-            action, params = self._parse_raw_output(raw_output)
+    def execute(self, action: str, params: Dict[str, str], raw_output: str = "",
+                on_event: Optional[EventCallback] = None):
+        try:
+            with tracer.span("agent.execute", action=action):
+                if action == "plan":
+                    return self._execute_plan(params, raw_output, on_event)
+                if action == "route":
+                    _emit(on_event, "status", message="Geocoding origin…")
+                    origin = self._position(params["origin"])
+                    _emit(on_event, "status", message="Geocoding destination…")
+                    destination = self._position(params["destination"])
+                    _emit(on_event, "status", message="Calculating route…")
+                    record = self.route_tool._run({"origin": origin, "destination": destination})
+                else:
+                    _emit(on_event, "status", message=self._status_message(action))
+                    record = self._get_tool(action)._run(self._tool_input(action, params))
 
-            if action == "geocode":
-                tool_result = self.geocode_tool._run({"address": params["address"]})
-                lat, lon = self._extract_coordinates(tool_result)
-                result = NavigationResult(
-                    action="geocode",
-                    geocoding_result=GeocodingResult(address=params["address"], latitude=lat, longitude=lon),
-                    raw_response=raw_output
-                )
-            elif action == "route":
-                origin_geocode = self.geocode_tool.run(params["origin"])
-                destination_geocode = self.geocode_tool.run(params["destination"])
-
-                origin_lat, origin_lon = self._extract_coordinates(origin_geocode)
-                destination_lat, destination_lon = self._extract_coordinates(destination_geocode)
-
-                tool_input = {"tool_input": {"origin": f"{origin_lat},{origin_lon}",
-                                             "destination": f"{destination_lat},{destination_lon}"}
-                              }
-                tool_result = self.route_tool.run(tool_input)
-                distance, duration = self._extract_route_info(tool_result)
-                result = NavigationResult(
-                    action="route",
-                    routing_result=RoutingResult(
-                        origin=params["origin"],
-                        destination=params["destination"],
-                        distance_km=distance,
-                        duration_hours=duration
-                    ),
-                    raw_response=raw_output
-                )
-            elif action == "discover":
-                tool_result = self.discover_tool._run(params)
-                result = NavigationResult(
-                    action="discover",
-                    discover_result=DiscoverResult(query=params["q"], results=tool_result),
-                    raw_response=raw_output
-                )
-            elif action == "autosuggest":
-                tool_result = self.autosuggest_tool._run(params)
-                result = NavigationResult(
-                    action="autosuggest",
-                    autosuggest_result=AutosuggestResult(query=params["q"], suggestions=tool_result),
-                    raw_response=raw_output
-                )
-            else:
-                raise ValueError(f"Unknown action: {action}")
+                result = self._build_result(action, params, record, raw_output)
+                _emit(on_event, "tool_result", action=action, result=self._result_model(action, params, record))
+                return result
+        except Exception as e:
+            return self._error_result(e)
+
+    async def aexecute(self, action: str, params: Dict[str, str], raw_output: str = "",
+                       on_event: Optional[EventCallback] = None):
+        try:
+            with tracer.span("agent.execute", action=action):
+                if action == "plan":
+                    return await self._aexecute_plan(params, raw_output, on_event)
+                if action == "route":
+                    _emit(on_event, "status", message="Geocoding origin and destination…")
+                    origin, destination = await asyncio.gather(
+                        self._aposition(params["origin"]),
+                        self._aposition(params["destination"]),
+                    )
+                    _emit(on_event, "status", message="Calculating route…")
+                    record = await self.route_tool._arun({"origin": origin, "destination": destination})
+                else:
+                    _emit(on_event, "status", message=self._status_message(action))
+                    record = await self._get_tool(action)._arun(self._tool_input(action, params))
 
-            return result
+                result = self._build_result(action, params, record, raw_output)
+                _emit(on_event, "tool_result", action=action, result=self._result_model(action, params, record))
+                return result
         except Exception as e:
-            return NavigationResult(
-                action="error",
-                raw_response=f"An error occurred: {str(e)}. Please try rephrasing your query."
+            return self._error_result(e)
+
+    def _execute_plan(self, params: Dict[str, Any], raw_output: str,
+                      on_event: Optional[EventCallback] = None) -> NavigationResult:
+        steps = self.plan_executor.parse(params["steps"])
+        _emit(on_event, "status", message=f"Running a plan of {len(steps)} steps…")
+        plan_result = self.plan_executor.run(steps, self._run_step)
+        return self._plan_result(params, plan_result, raw_output, on_event)
+
+    async def _aexecute_plan(self, params: Dict[str, Any], raw_output: str,
+                             on_event: Optional[EventCallback] = None) -> NavigationResult:
+        steps = self.plan_executor.parse(params["steps"])
+        _emit(on_event, "status", message=f"Running a plan of {len(steps)} steps…")
+        plan_result = await self.plan_executor.arun(steps, self._arun_step)
+        return self._plan_result(params, plan_result, raw_output, on_event)
+
+    def _plan_result(self, params: Dict[str, Any], plan_result: PlanResult, raw_output: str,
+                     on_event: Optional[EventCallback] = None) -> NavigationResult:
+        for step in plan_result.steps:
+            if step.output is not None:
+                step.output = self._result_model(step.action, step.params, step.output)
+        _emit(on_event, "tool_result", action="plan", result=plan_result)
+        return NavigationResult(action="plan", params=params, plan_result=plan_result, raw_response=raw_output)
+
+    def _run_step(self, action: str, params: Dict[str, str]):
+        if action == "route":
+            return self.route_tool._run({"origin": self._position(params["origin"]),
+                                         "destination": self._position(params["destination"])})
+        return self._get_tool(action)._run(self._tool_input(action, params))
+
+    async def _arun_step(self, action: str, params: Dict[str, str]):
+        if action == "route":
+            origin, destination = await asyncio.gather(
+                self._aposition(params["origin"]),
+                self._aposition(params["destination"]),
             )
+            return await self.route_tool._arun({"origin": origin, "destination": destination})
+        return await self._get_tool(action)._arun(self._tool_input(action, params))
+
+    def _position(self, place: str) -> str:
+        # Plan steps often pass coordinates found by an earlier step.
+        if _LAT_LON.match(place):
+            return place.replace(" ", "")
+        return self.geocode_tool._run(place).position
+
+    async def _aposition(self, place: str) -> str:
+        if _LAT_LON.match(place):
+            return place.replace(" ", "")
+        return (await self.geocode_tool._arun(place)).position
+
+    def _decide(self, query: str, on_event: Optional[EventCallback] = None) -> Tuple[str, Dict[str, str], str]:
+        with tracer.span("agent.decide") as span:
+            decision = self._route(query, span)
+            if decision is not None:
+                _emit(on_event, "decision", action=decision.action, params=decision.params, source=decision.tier)
+                return decision.action, decision.params, decision.raw_output()
+            with tracer.span("agent.prompt"):
+                _input = self.prompt.format(query=query)
+            raw_output = self._llm_call(_input, on_event)()
+            action, params = self._parse_llm_output(query, raw_output)
+            span.set(action=action)
+            _emit(on_event, "decision", action=action, params=params, source="llm")
+            return action, params, raw_output
+
+    async def _adecide(self, query: str, on_event: Optional[EventCallback] = None) -> Tuple[str, Dict[str, str], str]:
+        with tracer.span("agent.decide") as span:
+            decision = self._route(query, span)
+            if decision is not None:
+                _emit(on_event, "decision", action=decision.action, params=decision.params, source=decision.tier)
+                return decision.action, decision.params, decision.raw_output()
+            with tracer.span("agent.prompt"):
+                _input = self.prompt.format(query=query)
+            llm_call = self._llm_call(_input, on_event)
+            if self.executor is not None:
+                raw_output = await self.executor.run(llm_call)
+            else:
+                raw_output = await asyncio.get_running_loop().run_in_executor(None, llm_call)
+            action, params = self._parse_llm_output(query, raw_output)
+            span.set(action=action)
+            _emit(on_event, "decision", action=action, params=params, source="llm")
+            return action, params, raw_output
+
+    def _route(self, query: str, span):
+        decision = self.router.route(query) if self.router else None
+        span.set(source=decision.tier if decision is not None else "llm")
+        if decision is not None:
+            span.set(action=decision.action)
+        return decision
+
+    def _llm_call(self, _input: str, on_event: Optional[EventCallback] = None):
+        # The call runs on an inference thread; propagate keeps its span
+        # under this request's trace.
+        if on_event is None:
+            return propagate(functools.partial(self.llm.invoke, _input))
+        return propagate(functools.partial(self.llm.invoke, _input,
+                                           on_token=lambda token: _emit(on_event, "token", text=token)))
+
+    def _status_message(self, action: str) -> str:
+        return {
+            "geocode": "Geocoding address…",
+            "discover": "Searching places…",
+            "autosuggest": "Fetching suggestions…",
+        }.get(action, f"Running {action}…")
+
+    def _get_tool(self, action: str):
+        tools = {
+            "geocode": self.geocode_tool,
+            "discover": self.discover_tool,
+            "autosuggest": self.autosuggest_tool,
+        }
+        if action not in tools:
+            raise ValueError(f"Unknown action: {action}")
+        return tools[action]
+
+    def _tool_input(self, action: str, params: Dict[str, str]):
+        if action == "geocode":
+            return params["address"]
+        return params
+
+    def _build_result(self, action: str, params: Dict[str, str], record, raw_output: str) -> NavigationResult:
+        model = self._result_model(action, params, record)
+        field = {
+            "geocode": "geocoding_result",
+            "route": "routing_result",
+            "discover": "discover_result",
+            "autosuggest": "autosuggest_result",
+        }[action]
+        return NavigationResult(action=action, params=params, raw_response=raw_output,
+                                here_response=record.raw, **{field: model})
+
+    def _result_model(self, action: str, params: Dict[str, str], record) -> ToolResult:
+        if isinstance(record, GeocodeHit):
+            return GeocodingResult(address=record.address, title=record.title,
+                                   latitude=record.lat, longitude=record.lng)
+        if isinstance(record, Route):
+            return RoutingResult(
+                origin=params.get("origin", record.origin),
+                destination=params.get("destination", record.destination),
+                distance_km=record.length_m / 1000,
+                duration_hours=record.duration_s / 3600,
+            )
+        if isinstance(record, PlaceList):
+            places = [PlaceResult(title=place.title, latitude=place.lat, longitude=place.lng)
+                      for place in record.places]
+            if action == "autosuggest":
+                return AutosuggestResult(query=record.query, suggestions=places)
+            return DiscoverResult(query=record.query, results=places)
+        raise ValueError(f"Unknown action: {action}")
+
+    def _error_result(self, error: Exception) -> NavigationResult:
+        return NavigationResult(
+            action="error",
+            raw_response=f"An error occurred: {str(error)}. Please try rephrasing your query."
+        )
+
+    def _parse_llm_output(self, query: str, raw_output: str) -> Tuple[str, Dict[str, str]]:
+        with tracer.span("agent.parse", output_chars=len(raw_output)):
+            action, params = self._parse_raw_output(raw_output)
+        if self.router is not None:
+            self.router.record(query, action, params)
+        return action, params
 
     def _parse_raw_output(self, raw_output: str) -> Tuple[str, Dict[str, str]]:
         cleaned_output = re.sub(r'```yaml\n|```\n?', '', raw_output).strip()
@@ -123,6 +323,10 @@ class NavigationAgent:
                 raise ValueError("Parsed output is not a dictionary")
 
             action = parsed.get('action')
+            if action == 'plan':
+                if not parsed.get('steps'):
+                    raise ValueError("Missing 'steps' in plan")
+                return action, {'steps': parsed['steps']}
             params = parsed.get('params', {})
 
             if not action or not params:
@@ -131,16 +335,3 @@ class NavigationAgent:
             return action, params
         except yaml.YAMLError as e:
             raise ValueError(f"Failed to parse YAML: {e}")
-
-    def _extract_coordinates(self, geocode_result: str) -> Tuple[float, float]:
-        match = re.search(r"Latitude ([-\d.]+), Longitude ([-\d.]+)", geocode_result)
-        if match:
-            return float(match.group(1)), float(match.group(2))
-        raise ValueError("Could not extract coordinates from geocode result")
-
-    def _extract_route_info(self, route_result: str) -> Tuple[float, float]:
-        distance_match = re.search(r"Distance ([\d.]+) km", route_result)
-        duration_match = re.search(r"Duration ([\d.]+) hours", route_result)
-        if distance_match and duration_match:
-            return float(distance_match.group(1)), float(duration_match.group(1))
-        raise ValueError("Could not extract route info from result")
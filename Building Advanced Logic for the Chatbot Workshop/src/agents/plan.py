@@ -0,0 +1,187 @@
+import asyncio
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple
+
+from pydantic import BaseModel
+
+from tools.results import GeocodeHit, Place, PlaceList
+from utils.tracing import propagate, tracer
+
+# "$hotel" is the first place a step found, "$museums.2" the third and
+# "$museums.2.title" its name instead of its coordinates.
+_REFERENCE = re.compile(r"\$([A-Za-z_]\w*)(?:\.(\d+))?(?:\.(title|position))?")
+
+
+class PlanStep(NamedTuple):
+    id: str
+    action: str
+    params: Dict[str, str]
+    depends_on: List[str]
+
+
+class PlanStepResult(BaseModel):
+    id: str
+    action: str
+    params: Dict[str, Any]
+    status: str  # "ok", "error", "timeout" or "skipped"
+    output: Any = None
+    message: str = ""
+    elapsed_ms: float = 0.0
+
+
+class PlanResult(BaseModel):
+    steps: List[PlanStepResult]
+
+
+class PlanExecutor:
+    """Runs the steps of a tool plan as a DAG: each step starts as soon as the
+    steps it references have finished, so independent steps run concurrently.
+
+    A step that fails or exceeds ``step_timeout`` seconds does not stop the
+    plan; only the steps that depend on it are skipped.
+    """
+
+    def __init__(self, actions: Iterable[str], step_timeout: float = 10.0, max_steps: int = 8):
+        self.actions = set(actions)
+        self.step_timeout = step_timeout
+        self.max_steps = max_steps
+
+    def parse(self, steps: Any) -> List[PlanStep]:
+        """Validates the LLM's steps: known actions, unique ids and references
+        to existing steps without cycles."""
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("A plan needs a non-empty list of steps")
+        if len(steps) > self.max_steps:
+            raise ValueError(f"A plan can have at most {self.max_steps} steps, got {len(steps)}")
+
+        parsed: Dict[str, PlanStep] = {}
+        for index, step in enumerate(steps):
+            if not isinstance(step, dict) or not isinstance(step.get("params"), dict):
+                raise ValueError(f"Plan step {index} needs 'id', 'action' and 'params'")
+            step_id = str(step.get("id") or f"step{index}")
+            if step_id in parsed:
+                raise ValueError(f"Duplicate plan step id: {step_id}")
+            if step.get("action") not in self.actions:
+                raise ValueError(f"Unknown action in plan step {step_id}: {step.get('action')}")
+            params = {key: str(value) for key, value in step["params"].items() if value is not None}
+            depends_on = sorted({match.group(1) for value in params.values() for match in _REFERENCE.finditer(value)})
+            parsed[step_id] = PlanStep(step_id, step["action"], params, depends_on)
+
+        for step in parsed.values():
+            for dependency in step.depends_on:
+                if dependency not in parsed:
+                    raise ValueError(f"Plan step {step.id} refers to unknown step ${dependency}")
+        _topological_order(parsed.values())
+        return list(parsed.values())
+
+    def run(self, steps: List[PlanStep], run_step: Callable[[str, Dict[str, str]], Any]) -> PlanResult:
+        step_pool = ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="plan-step")
+        # Tool calls get their own pool so a step can stop waiting on one
+        # that overran its timeout.
+        call_pool = ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="plan-call")
+        futures: Dict[str, Future] = {}
+
+        def execute(step: PlanStep) -> PlanStepResult:
+            done = {dependency: futures[dependency].result() for dependency in step.depends_on}
+            params, skipped = self._resolve(step, done)
+            if skipped is not None:
+                return skipped
+            started = time.perf_counter()
+            try:
+                with tracer.span("plan.step", step=step.id, action=step.action):
+                    call = call_pool.submit(propagate(run_step), step.action, params)
+                    result = call.result(timeout=self.step_timeout)
+                return self._result(step, params, "ok", started, output=result)
+            except FutureTimeoutError:
+                return self._result(step, params, "timeout", started, message=f"Timed out after {self.step_timeout:g}s")
+            except Exception as e:
+                return self._result(step, params, "error", started, message=str(e))
+
+        try:
+            # Submitting in dependency order means every future a step waits
+            # on already exists.
+            for step in _topological_order(steps):
+                futures[step.id] = step_pool.submit(propagate(execute), step)
+            return PlanResult(steps=[futures[step.id].result() for step in steps])
+        finally:
+            step_pool.shutdown(wait=False)
+            call_pool.shutdown(wait=False)
+
+    async def arun(self, steps: List[PlanStep],
+                   run_step: Callable[[str, Dict[str, str]], Awaitable[Any]]) -> PlanResult:
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def execute(step: PlanStep) -> PlanStepResult:
+            done = {dependency: await tasks[dependency] for dependency in step.depends_on}
+            params, skipped = self._resolve(step, done)
+            if skipped is not None:
+                return skipped
+            started = time.perf_counter()
+            try:
+                with tracer.span("plan.step", step=step.id, action=step.action):
+                    result = await asyncio.wait_for(run_step(step.action, params), self.step_timeout)
+                return self._result(step, params, "ok", started, output=result)
+            except asyncio.TimeoutError:
+                return self._result(step, params, "timeout", started, message=f"Timed out after {self.step_timeout:g}s")
+            except Exception as e:
+                return self._result(step, params, "error", started, message=str(e))
+
+        for step in steps:
+            tasks[step.id] = asyncio.ensure_future(execute(step))
+        return PlanResult(steps=list(await asyncio.gather(*(tasks[step.id] for step in steps))))
+
+    def _resolve(self, step: PlanStep, done: Dict[str, PlanStepResult]):
+        failed = [dependency for dependency, result in done.items() if result.status != "ok"]
+        if failed:
+            return None, PlanStepResult(id=step.id, action=step.action, params=step.params, status="skipped",
+                                        message=f"Depends on failed step(s): {', '.join(failed)}")
+        try:
+            return {key: _substitute(value, done) for key, value in step.params.items()}, None
+        except ValueError as e:
+            return None, PlanStepResult(id=step.id, action=step.action, params=step.params, status="skipped",
+                                        message=str(e))
+
+    def _result(self, step: PlanStep, params: Dict[str, str], status: str, started: float,
+                output: Any = None, message: str = "") -> PlanStepResult:
+        return PlanStepResult(id=step.id, action=step.action, params=params, status=status, output=output,
+                              message=message, elapsed_ms=(time.perf_counter() - started) * 1000)
+
+
+def _topological_order(steps: Iterable[PlanStep]) -> List[PlanStep]:
+    ordered: List[PlanStep] = []
+    placed = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [step for step in remaining if all(dependency in placed for dependency in step.depends_on)]
+        if not ready:
+            raise ValueError(f"Plan steps have circular references: {', '.join(step.id for step in remaining)}")
+        for step in ready:
+            ordered.append(step)
+            placed.add(step.id)
+        remaining = [step for step in remaining if step.id not in placed]
+    return ordered
+
+
+def _places(result: PlanStepResult) -> List[Place]:
+    if isinstance(result.output, GeocodeHit):
+        return [Place(result.output.address, result.output.lat, result.output.lng)]
+    if isinstance(result.output, PlaceList):
+        return list(result.output.places)
+    return []
+
+
+def _substitute(value: str, done: Dict[str, PlanStepResult]) -> str:
+    def replace(match) -> str:
+        step_id, index, field = match.group(1), int(match.group(2) or 0), match.group(3)
+        places = _places(done[step_id])
+        if index >= len(places):
+            raise ValueError(f"Step {step_id} has no result #{index}")
+        place = places[index]
+        if field == "title" or place.position is None:
+            return place.title
+        return place.position
+    return _REFERENCE.sub(replace, value)
+
@@ -0,0 +1,182 @@
+import json
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+import yaml
+
+
+class RouterDecision(NamedTuple):
+    action: str
+    params: Dict[str, str]
+    confidence: float
+    tier: str
+
+    def raw_output(self) -> str:
+        return yaml.safe_dump(
+            {"action": self.action, "params": self.params,
+             "explanation": f"Matched by the {self.tier} router tier."},
+            sort_keys=False,
+        )
+
+
+class RouterTier(ABC):
+    name = "base"
+
+    @abstractmethod
+    def classify(self, query: str) -> Optional[RouterDecision]:
+        pass
+
+
+# A single place: it may not itself contain routing words, so multi-leg
+# ("A to B and then to C", "via") and search ("jobs near X") phrasings do
+# not match and go to the LLM, nor travel modes and times ("by train",
+# "tomorrow at 5pm") that a route request would silently drop.
+_PLACE = (r"(?:(?!\b(?:to|from|via|then|near|around|close\s+to|by|at|on|in|before|after|until|during|"
+          r"today|tonight|tomorrow|now|with|without|avoiding|using)\b).)+?")
+# Times and other bare numbers: "from 9 to 5" is not a route.
+_NOT_A_PLACE = re.compile(r"[\d:.\s]+(?:am|pm|h)?", re.I)
+
+# Route patterns come first: "from X to Y" would otherwise look like a place
+# search. Discover is only served with a position to search around, so it
+# needs coordinates in the query; the LLM handles the rest.
+_DEFAULT_PATTERNS: List[Tuple[str, float, Pattern]] = [
+    ("route", 0.95, re.compile(
+        rf"^how\s+(?:far|long)\s+is\s+it\s+from\s+(?P<origin>{_PLACE})\s+to\s+(?P<destination>{_PLACE})$", re.I)),
+    ("route", 0.95, re.compile(
+        rf"^how\s+far\s+is\s+(?P<destination>{_PLACE})\s+from\s+(?P<origin>{_PLACE})$", re.I)),
+    ("route", 0.95, re.compile(
+        rf"^how\s+(?:do|can)\s+i\s+(?:get|drive|go)\s+from\s+(?P<origin>{_PLACE})\s+to\s+(?P<destination>{_PLACE})$",
+        re.I)),
+    ("route", 0.95, re.compile(
+        r"^(?:(?:show|give|get|find|calculate|plan)\s+(?:me\s+)?)?(?:the\s+|a\s+)?"
+        rf"(?:route|directions|driving\s+directions|drive)\s+(?:from\s+)?(?P<origin>{_PLACE})\s+to\s+"
+        rf"(?P<destination>{_PLACE})$", re.I)),
+    ("route", 0.95, re.compile(
+        rf"^from\s+(?P<origin>{_PLACE})\s+to\s+(?P<destination>{_PLACE})$", re.I)),
+    ("geocode", 0.95, re.compile(
+        r"^(?:what\s+are\s+|what\s+is\s+|give\s+me\s+|get\s+|find\s+)?(?:the\s+)?(?:gps\s+)?"
+        r"(?:coordinates|coords|lat(?:itude)?\s*(?:and|/|,)?\s*(?:lon|lng|longitude))\s+(?:of|for)\s+(?P<address>.+)$", re.I)),
+    ("geocode", 0.95, re.compile(r"^geocode\s+(?P<address>.+)$", re.I)),
+    ("autosuggest", 0.95, re.compile(
+        r"^(?:suggest|autocomplete|complete)\s+(?:\w+\s+)?(?:starting|beginning)\s+with\s+(?P<q>.+)$", re.I)),
+    ("autosuggest", 0.95, re.compile(r"^(?:autocomplete|complete)\s+(?P<q>.+)$", re.I)),
+    ("discover", 0.9, re.compile(
+        r"^(?!.*\b(?:from|route|directions|how\s+far|how\s+long)\b)"
+        r"(?:find|show(?:\s+me)?|search(?:\s+for)?|list|are\s+there(?:\s+any)?)?\s*"
+        r"(?P<q>\S.*?)\s+(?:near|around|close\s+to|at)\s+(?P<at>-?\d+(?:\.\d+)?,\s*-?\d+(?:\.\d+)?)$", re.I)),
+]
+
+
+class RegexTier(RouterTier):
+    name = "regex"
+
+    def __init__(self, patterns: List[Tuple[str, float, Pattern]] = None):
+        self.patterns = patterns or _DEFAULT_PATTERNS
+
+    def classify(self, query: str) -> Optional[RouterDecision]:
+        query = query.strip().rstrip("?!. ")
+        for action, confidence, pattern in self.patterns:
+            match = pattern.match(query)
+            if match:
+                params = {key: _clean(value) for key, value in match.groupdict().items()}
+                if "at" in params:
+                    params["at"] = "".join(params["at"].split())
+                places = [params[key] for key in ("origin", "destination") if key in params]
+                if all(params.values()) and not any(_NOT_A_PLACE.fullmatch(place) for place in places):
+                    return RouterDecision(action, params, confidence, self.name)
+        return None
+
+
+def _clean(value: str) -> str:
+    return value.strip().strip("'\"").strip()
+
+
+class IntentRouter:
+    """Runs cheap tiers in order ahead of the LLM; the first decision at or
+    above ``threshold`` is used, otherwise the query falls back to the LLM.
+
+    LLM decisions can be appended to ``log_path`` (JSON lines) and replayed
+    through :meth:`evaluate` to check the router's accuracy.
+    """
+
+    def __init__(self, tiers: List[RouterTier], threshold: float = 0.9, log_path: Optional[str] = None):
+        self.tiers = tiers
+        self.threshold = threshold
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._queries = 0
+        self._served = Counter()
+
+    def route(self, query: str) -> Optional[RouterDecision]:
+        decision = self._classify(query)
+        with self._lock:
+            self._queries += 1
+            if decision is not None:
+                self._served[decision.tier] += 1
+        return decision
+
+    def _classify(self, query: str) -> Optional[RouterDecision]:
+        for tier in self.tiers:
+            decision = tier.classify(query)
+            if decision is not None and decision.confidence >= self.threshold:
+                return decision
+        return None
+
+    def record(self, query: str, action: str, params: Dict[str, str]):
+        if not self.log_path:
+            return
+        line = json.dumps({"query": query, "action": action, "params": params})
+        with self._lock:
+            with open(self.log_path, "a") as f:
+                f.write(line + "\n")
+
+    def evaluate(self, log_path: str) -> Dict[str, float]:
+        decisions = served = action_matches = exact_matches = 0
+        with open(log_path) as f:
+            for line in f:
+                logged = json.loads(line)
+                decisions += 1
+                decision = self._classify(logged["query"])
+                if decision is None:
+                    continue
+                served += 1
+                if decision.action == logged["action"]:
+                    action_matches += 1
+                    if _normalize(decision.params) == _normalize(logged["params"]):
+                        exact_matches += 1
+        return {
+            "decisions": decisions,
+            "served": served,
+            "coverage": served / decisions if decisions else 0.0,
+            "action_accuracy": action_matches / served if served else 0.0,
+            "params_accuracy": exact_matches / served if served else 0.0,
+        }
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            served = sum(self._served.values())
+            return {
+                "queries": self._queries,
+                "served": served,
+                "served_fraction": served / self._queries if self._queries else 0.0,
+                "by_tier": dict(self._served),
+            }
+
+
+def _normalize(params: Dict[str, str]) -> Dict[str, str]:
+    return {key: " ".join(str(value).lower().split()) for key, value in params.items() if value}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the intent router against logged LLM decisions.")
+    parser.add_argument("log_path")
+    parser.add_argument("--threshold", type=float, default=0.9)
+    args = parser.parse_args()
+
+    router = IntentRouter([RegexTier()], threshold=args.threshold)
+    print(json.dumps(router.evaluate(args.log_path), indent=2))
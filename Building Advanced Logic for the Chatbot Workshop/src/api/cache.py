@@ -0,0 +1,107 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, Optional
+
+
+class ResultCache:
+    """Two-tier TTL cache for HERE responses: an in-memory LRU in front of an
+    optional SQLite file that survives restarts."""
+
+    def __init__(self, ttls: Dict[str, float], max_size: int = 1024, path: Optional[str] = None):
+        self.ttls = ttls
+        self.max_size = max_size
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, endpoint TEXT, value TEXT, expires_at REAL)"
+            )
+            self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def enabled(self, endpoint: str) -> bool:
+        return self.ttls.get(endpoint, 0) > 0
+
+    def get(self, endpoint: str, key: str) -> Optional[Dict[str, Any]]:
+        key = f"{endpoint}:{key}"
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats[endpoint]["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = json.loads(row[0]), row[1]
+                    if expires_at > now:
+                        self._remember(key, expires_at, value)
+                        self._stats[endpoint]["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._stats[endpoint]["misses"] += 1
+            return None
+
+    def set(self, endpoint: str, key: str, value: Dict[str, Any]):
+        if not self.enabled(endpoint):
+            return
+        key = f"{endpoint}:{key}"
+        expires_at = time.time() + self.ttls[endpoint]
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, endpoint, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, endpoint, json.dumps(value), expires_at),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, expires_at: float, value: Dict[str, Any]):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {endpoint: dict(counts) for endpoint, counts in self._stats.items()}
+            size = len(self._memory)
+        hits = sum(c["memory_hits"] + c["disk_hits"] for c in endpoints.values())
+        lookups = hits + sum(c["misses"] for c in endpoints.values())
+        return {
+            "size": size,
+            "max_size": self.max_size,
+            "persistent": self._db is not None,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "endpoints": endpoints,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+                self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,37 +1,92 @@
+import asyncio
+import hashlib
+import httpx
+import numpy as np
 import requests
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Any, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+from api.cache import ResultCache
+from api.poi_index import PoiIndex
+from api.rate_limit import RateLimiter
 from utils.config import Config
+from utils.tracing import propagate, tracer
+
+
+class RouteMatrix(NamedTuple):
+    """Travel times (seconds) and distances (metres), one row per origin and
+    one column per destination; NaN where no route was found."""
+    durations: np.ndarray
+    distances: np.ndarray
 
 
 class HereAPI:
-    def __init__(self):
-        self.api_key = "API_KEY"
-        self.geocode_url = "https://geocode.search.hereapi.com/v1/geocode"
-        self.route_url = "https://router.hereapi.com/v8/routes"
-        self.discover_url = "https://discover.search.hereapi.com/v1/discover"
-        self.autosuggest_url = "https://autosuggest.search.hereapi.com/v1/autosuggest"
+    def __init__(
+        self,
+        api_key: str = Config.HERE_API_KEY,
+        geocode_url: str = Config.HERE_GEOCODE_URL,
+        route_url: str = Config.HERE_ROUTE_URL,
+        discover_url: str = Config.HERE_DISCOVER_URL,
+        autosuggest_url: str = Config.HERE_AUTOSUGGEST_URL,
+        matrix_url: str = Config.HERE_MATRIX_URL,
+        matrix_max_origins: int = Config.HERE_MATRIX_MAX_ORIGINS,
+        matrix_max_destinations: int = Config.HERE_MATRIX_MAX_DESTINATIONS,
+        timeout: float = Config.HERE_TIMEOUT,
+        max_connections: int = Config.HERE_MAX_CONNECTIONS,
+        max_connections_per_host: int = Config.HERE_MAX_CONNECTIONS_PER_HOST,
+        cache: Optional[ResultCache] = None,
+        coord_precision: int = Config.HERE_CACHE_COORD_PRECISION,
+        rate_limit: float = Config.HERE_RATE_LIMIT,
+        local_index: Optional[PoiIndex] = None,
+    ):
+        self.api_key = api_key
+        self.geocode_url = geocode_url
+        self.route_url = route_url
+        self.discover_url = discover_url
+        self.autosuggest_url = autosuggest_url
+        self.matrix_url = matrix_url
+        self.matrix_max_origins = matrix_max_origins
+        self.matrix_max_destinations = matrix_max_destinations
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.cache = cache
+        self.coord_precision = coord_precision
+        # Optional offline POI index; discover/autosuggest only go to HERE
+        # when it has no match.
+        self.local_index = local_index
 
-    def geocode(self, address: str) -> Dict[str, Any]:
-        params = {
+        # Sync callers (Streamlit) share one keep-alive session.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections_per_host)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Async callers (FastAPI) share one pooled client, created on first use
+        # so it binds to the running event loop.
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._rate_limiter = RateLimiter(rate_limit) if rate_limit > 0 else None
+        # Identical requests already on the wire are shared instead of re-sent.
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _geocode_params(self, address: str) -> Dict[str, Any]:
+        return {
             "q": address,
             "apiKey": self.api_key
         }
-        response = requests.get(self.geocode_url, params=params)
-        return response.json()
 
-    def calculate_route(self, origin: str, destination: str) -> Dict[str, Any]:
-        params = {
+    def _route_params(self, origin: str, destination: str) -> Dict[str, Any]:
+        return {
             "transportMode": "car",
             "origin": origin,
             "destination": destination,
             "return": "summary",
             "apiKey": self.api_key
         }
-        response = requests.get(self.route_url, params=params)
-        return response.json()
-
-    def discover(self, query: str, at: str = None, limit: int = 20) -> Dict[str, Any]:
 
+    def _search_params(self, query: str, at: str = None, limit: int = 20) -> Dict[str, Any]:
         params = {
             "q": query,
             "limit": limit,
@@ -39,16 +94,338 @@ class HereAPI:
         }
         if at:
             params["at"] = at
-        response = requests.get(self.discover_url, params=params)
-        return response.json()
+        return params
 
-    def autosuggest(self, query: str, at: str = None, limit: int = 20) -> Dict[str, Any]:
-        params = {
-            "q": query,
-            "limit": limit,
+    def _matrix_params(self) -> Dict[str, Any]:
+        return {
+            "async": "false",
             "apiKey": self.api_key
         }
-        if at:
-            params["at"] = at
-        response = requests.get(self.autosuggest_url, params=params)
-        return response.json()
+
+    def _matrix_body(self, origins: List[str], destinations: List[str]) -> Dict[str, Any]:
+        return {
+            "origins": [_lat_lng(position) for position in origins],
+            "destinations": [_lat_lng(position) for position in destinations],
+            "regionDefinition": {"type": "world"},
+            "matrixAttributes": ["travelTimes", "distances"],
+            "transportMode": "car",
+        }
+
+    def _matrix_key(self, origins: List[str], destinations: List[str]) -> str:
+        key = ";".join(origins) + ">" + ";".join(destinations)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _normalize_address(self, address: str) -> str:
+        return " ".join(address.lower().split())
+
+    def _normalize_position(self, position: str) -> str:
+        try:
+            lat, lon = (float(part) for part in position.split(","))
+        except ValueError:
+            return self._normalize_address(position)
+        return f"{round(lat, self.coord_precision)},{round(lon, self.coord_precision)}"
+
+    def _search_key(self, query: str, at: str = None, limit: int = 20) -> str:
+        at = self._normalize_position(at) if at else ""
+        return f"{self._normalize_address(query)}|{at}|{limit}"
+
+    def _cache_get(self, endpoint: str, key: str) -> Optional[Dict[str, Any]]:
+        if self.cache is None or not self.cache.enabled(endpoint):
+            return None
+        return self.cache.get(endpoint, key)
+
+    def _cache_set(self, endpoint: str, key: str, status_code: int, result: Dict[str, Any]):
+        if self.cache is not None and status_code == 200:
+            self.cache.set(endpoint, key, result)
+
+    def _get(self, endpoint: str, key: str, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        with tracer.span(f"here.{endpoint}") as span:
+            cached = self._cache_get(endpoint, key)
+            if cached is not None:
+                span.set(cache="hit")
+                return cached
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            span.set(cache="miss", status_code=response.status_code)
+            result = response.json()
+            self._cache_set(endpoint, key, response.status_code, result)
+            return result
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+            self._host_limits = {}
+            self._inflight = {}
+            if self._rate_limiter is not None:
+                self._rate_limiter.reset()
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_limits[host]
+
+    async def _aget(self, endpoint: str, key: str, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        with tracer.span(f"here.{endpoint}") as span:
+            cached = self._cache_get(endpoint, key)
+            if cached is not None:
+                span.set(cache="hit")
+                return cached
+            client = self._get_client()
+            inflight_key = f"{endpoint}:{key}"
+            future = self._inflight.get(inflight_key)
+            if future is None:
+                span.set(cache="miss")
+                future = asyncio.ensure_future(self._fetch(client, endpoint, key, url, params))
+                self._inflight[inflight_key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+            else:
+                span.set(cache="inflight")
+            return await asyncio.shield(future)
+
+    async def _fetch(self, client: httpx.AsyncClient, endpoint: str, key: str, url: str,
+                     params: Dict[str, Any]) -> Dict[str, Any]:
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire()
+        async with self._host_limit(url):
+            with tracer.span("here.http", endpoint=endpoint) as span:
+                response = await client.get(url, params=params)
+                span.set(status_code=response.status_code)
+        result = response.json()
+        self._cache_set(endpoint, key, response.status_code, result)
+        return result
+
+    def _post_matrix(self, origins: List[str], destinations: List[str]) -> Optional[Dict[str, Any]]:
+        with tracer.span("here.matrix", origins=len(origins), destinations=len(destinations)) as span:
+            key = self._matrix_key(origins, destinations)
+            cached = self._cache_get("matrix", key)
+            if cached is not None:
+                span.set(cache="hit")
+                return cached
+            response = self.session.post(self.matrix_url, params=self._matrix_params(),
+                                         json=self._matrix_body(origins, destinations), timeout=self.timeout)
+            span.set(cache="miss", status_code=response.status_code)
+            if response.status_code != 200:
+                return None
+            result = response.json()
+            self._cache_set("matrix", key, response.status_code, result)
+            return result
+
+    async def _apost_matrix(self, origins: List[str], destinations: List[str]) -> Optional[Dict[str, Any]]:
+        with tracer.span("here.matrix", origins=len(origins), destinations=len(destinations)) as span:
+            key = self._matrix_key(origins, destinations)
+            cached = self._cache_get("matrix", key)
+            if cached is not None:
+                span.set(cache="hit")
+                return cached
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire()
+            client = self._get_client()
+            async with self._host_limit(self.matrix_url):
+                response = await client.post(self.matrix_url, params=self._matrix_params(),
+                                             json=self._matrix_body(origins, destinations))
+            span.set(cache="miss", status_code=response.status_code)
+            if response.status_code != 200:
+                return None
+            result = response.json()
+            self._cache_set("matrix", key, response.status_code, result)
+            return result
+
+    def _matrix_blocks(self, n_origins: int, n_destinations: int) -> List[Tuple[slice, slice]]:
+        return [
+            (slice(i, i + self.matrix_max_origins), slice(j, j + self.matrix_max_destinations))
+            for i in range(0, n_origins, self.matrix_max_origins)
+            for j in range(0, n_destinations, self.matrix_max_destinations)
+        ]
+
+    def _pairs(self, origins: List[str], destinations: List[str], block: Tuple[slice, slice]):
+        rows, columns = block
+        return [
+            (i, j, origins[i], destinations[j])
+            for i in range(len(origins))[rows]
+            for j in range(len(destinations))[columns]
+            if origins[i] != destinations[j]
+        ]
+
+    def route_matrix(self, origins: List[str], destinations: List[str]) -> RouteMatrix:
+        """Routes every origin to every destination ("lat,lng" positions).
+
+        Uses the matrix endpoint in blocks of at most ``matrix_max_origins`` x
+        ``matrix_max_destinations``; without one (or if a block fails) the
+        block is filled from concurrent, cached single-route calls. Duplicate
+        positions are only routed once.
+        """
+        origins, origin_index = _unique(origins, self._normalize_position)
+        destinations, destination_index = _unique(destinations, self._normalize_position)
+        durations, distances = _empty_matrix(len(origins), len(destinations))
+        pending = []
+        for block in self._matrix_blocks(len(origins), len(destinations)):
+            result = _try(self._post_matrix, origins[block[0]], destinations[block[1]]) if self.matrix_url else None
+            if isinstance(result, Exception) or not _fill_block(durations, distances, block, result):
+                pending.extend(self._pairs(origins, destinations, block))
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_connections_per_host) as pool:
+                routes = list(pool.map(propagate(lambda pair: _try(self.calculate_route, pair[2], pair[3])), pending))
+            _fill_pairs(durations, distances, pending, routes)
+        _zero_identical(durations, distances, origins, destinations)
+        return _expand(durations, distances, origin_index, destination_index)
+
+    async def aroute_matrix(self, origins: List[str], destinations: List[str]) -> RouteMatrix:
+        origins, origin_index = _unique(origins, self._normalize_position)
+        destinations, destination_index = _unique(destinations, self._normalize_position)
+        durations, distances = _empty_matrix(len(origins), len(destinations))
+        blocks = self._matrix_blocks(len(origins), len(destinations))
+        if self.matrix_url:
+            results = await asyncio.gather(
+                *(self._apost_matrix(origins[rows], destinations[columns]) for rows, columns in blocks),
+                return_exceptions=True,
+            )
+        else:
+            results = [None] * len(blocks)
+        pending = []
+        for block, result in zip(blocks, results):
+            if isinstance(result, Exception) or not _fill_block(durations, distances, block, result):
+                pending.extend(self._pairs(origins, destinations, block))
+        if pending:
+            routes = await asyncio.gather(
+                *(self.acalculate_route(origin, destination) for _, _, origin, destination in pending),
+                return_exceptions=True,
+            )
+            _fill_pairs(durations, distances, pending, routes)
+        _zero_identical(durations, distances, origins, destinations)
+        return _expand(durations, distances, origin_index, destination_index)
+
+    def geocode(self, address: str) -> Dict[str, Any]:
+        return self._get("geocode", self._normalize_address(address),
+                         self.geocode_url, self._geocode_params(address))
+
+    def calculate_route(self, origin: str, destination: str) -> Dict[str, Any]:
+        key = f"{self._normalize_position(origin)}|{self._normalize_position(destination)}"
+        return self._get("route", key, self.route_url, self._route_params(origin, destination))
+
+    def _local(self, endpoint: str, query: str, at: str, limit: int) -> Optional[Dict[str, Any]]:
+        if self.local_index is None:
+            return None
+        with tracer.span(f"poi_index.{endpoint}") as span:
+            result = getattr(self.local_index, endpoint)(query, at=at, limit=limit)
+            span.set(hit=result is not None)
+            return result
+
+    def discover(self, query: str, at: str = None, limit: int = 20) -> Dict[str, Any]:
+        local = self._local("discover", query, at, limit)
+        if local is not None:
+            return local
+        return self._get("discover", self._search_key(query, at, limit),
+                         self.discover_url, self._search_params(query, at, limit))
+
+    def autosuggest(self, query: str, at: str = None, limit: int = 20) -> Dict[str, Any]:
+        local = self._local("autosuggest", query, at, limit)
+        if local is not None:
+            return local
+        return self._get("autosuggest", self._search_key(query, at, limit),
+                         self.autosuggest_url, self._search_params(query, at, limit))
+
+    async def ageocode(self, address: str) -> Dict[str, Any]:
+        return await self._aget("geocode", self._normalize_address(address),
+                                self.geocode_url, self._geocode_params(address))
+
+    async def acalculate_route(self, origin: str, destination: str) -> Dict[str, Any]:
+        key = f"{self._normalize_position(origin)}|{self._normalize_position(destination)}"
+        return await self._aget("route", key, self.route_url, self._route_params(origin, destination))
+
+    async def adiscover(self, query: str, at: str = None, limit: int = 20) -> Dict[str, Any]:
+        local = self._local("discover", query, at, limit)
+        if local is not None:
+            return local
+        return await self._aget("discover", self._search_key(query, at, limit),
+                                self.discover_url, self._search_params(query, at, limit))
+
+    async def aautosuggest(self, query: str, at: str = None, limit: int = 20) -> Dict[str, Any]:
+        local = self._local("autosuggest", query, at, limit)
+        if local is not None:
+            return local
+        return await self._aget("autosuggest", self._search_key(query, at, limit),
+                                self.autosuggest_url, self._search_params(query, at, limit))
+
+    def cache_stats(self) -> Dict[str, Any]:
+        if self.cache is None:
+            return {}
+        return self.cache.stats()
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.close()
+
+
+def _lat_lng(position: str) -> Dict[str, float]:
+    lat, lng = (float(part) for part in position.split(","))
+    return {"lat": lat, "lng": lng}
+
+
+def _unique(positions: List[str], normalize: Callable[[str], str]) -> Tuple[List[str], np.ndarray]:
+    unique: Dict[str, int] = {}
+    index = [unique.setdefault(normalize(position), len(unique)) for position in positions]
+    return list(unique), np.asarray(index, dtype=np.intp)
+
+
+def _empty_matrix(n_origins: int, n_destinations: int) -> Tuple[np.ndarray, np.ndarray]:
+    return (np.full((n_origins, n_destinations), np.nan, dtype=np.float32),
+            np.full((n_origins, n_destinations), np.nan, dtype=np.float32))
+
+
+def _fill_block(durations: np.ndarray, distances: np.ndarray, block: Tuple[slice, slice],
+                result: Optional[Dict[str, Any]]) -> bool:
+    if not result or "matrix" not in result:
+        return False
+    shape = durations[block].shape
+    matrix = result["matrix"]
+    block_durations = np.asarray(matrix["travelTimes"], dtype=np.float32).reshape(shape)
+    block_distances = np.asarray(matrix["distances"], dtype=np.float32).reshape(shape)
+    if matrix.get("errorCodes"):
+        failed = np.asarray(matrix["errorCodes"]).reshape(shape) != 0
+        block_durations[failed] = np.nan
+        block_distances[failed] = np.nan
+    durations[block] = block_durations
+    distances[block] = block_distances
+    return True
+
+
+def _try(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
+def _fill_pairs(durations: np.ndarray, distances: np.ndarray, pairs, routes):
+    for (i, j, _, _), result in zip(pairs, routes):
+        if isinstance(result, dict) and result.get("routes"):
+            summary = result["routes"][0]["sections"][0]["summary"]
+            durations[i, j] = summary["duration"]
+            distances[i, j] = summary["length"]
+
+
+def _zero_identical(durations: np.ndarray, distances: np.ndarray, origins: List[str], destinations: List[str]):
+    # Pairs with the same origin and destination are never sent pairwise.
+    same = np.equal.outer(np.asarray(origins, dtype=object), np.asarray(destinations, dtype=object))
+    durations[same & np.isnan(durations)] = 0
+    distances[same & np.isnan(distances)] = 0
+
+
+def _expand(durations: np.ndarray, distances: np.ndarray, origin_index: np.ndarray,
+            destination_index: np.ndarray) -> RouteMatrix:
+    rows = np.ix_(origin_index, destination_index)
+    return RouteMatrix(durations=durations[rows], distances=distances[rows])
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# Synthetic stand-in for the HERE endpoints HereAPI calls. Places are hashed
+# to stable points around CENTER and routes follow the great-circle distance,
+# so results are deterministic without network access or an API key.
+CENTER = (52.52, 13.405)
+ROAD_FACTOR = 1.3
+SPEED_KMH = 50.0
+
+
+def _position(name: str) -> Tuple[float, float]:
+    digest = hashlib.sha256(" ".join(name.lower().split()).encode("utf-8")).digest()
+    lat = CENTER[0] + (digest[0] * 256 + digest[1]) / 65535 - 0.5
+    lng = CENTER[1] + (digest[2] * 256 + digest[3]) / 65535 - 0.5
+    return round(lat, 6), round(lng, 6)
+
+
+def _parse_position(value: str) -> Tuple[float, float]:
+    try:
+        lat, lng = (float(part) for part in value.split(","))
+        return lat, lng
+    except ValueError:
+        return _position(value)
+
+
+def _route(origin: Tuple[float, float], destination: Tuple[float, float]) -> Tuple[int, int]:
+    lat1, lng1, lat2, lng2 = map(math.radians, (*origin, *destination))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    length = 2 * 6371000 * math.asin(math.sqrt(a)) * ROAD_FACTOR
+    return round(length / (SPEED_KMH / 3.6)), round(length)
+
+
+def _places(query: str, at: str, limit: int) -> List[Dict]:
+    center = _parse_position(at) if at else CENTER
+    items = []
+    for i in range(limit):
+        title = f"{query.title()} {i + 1}"
+        lat, lng = _position(f"{query}|{at}|{i}")
+        # Keep results within ~5 km of the search centre.
+        items.append({"title": title, "position": {"lat": round(center[0] + (lat - CENTER[0]) / 10, 6),
+                                                   "lng": round(center[1] + (lng - CENTER[1]) / 10, 6)}})
+    return items
+
+
+class MockHereHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        self.server.counts[endpoint] += 1
+        if endpoint == "geocode":
+            lat, lng = _position(query.get("q", ""))
+            body = {"items": [{"title": query.get("q", ""), "position": {"lat": lat, "lng": lng}}]}
+        elif endpoint == "routes":
+            duration, length = _route(_parse_position(query["origin"]), _parse_position(query["destination"]))
+            body = {"routes": [{"sections": [{"summary": {"duration": duration, "length": length}}]}]}
+        elif endpoint in ("discover", "autosuggest"):
+            body = {"items": _places(query.get("q", ""), query.get("at"), int(query.get("limit", 5)))}
+        elif endpoint == "stats":
+            body = dict(self.server.counts)
+        else:
+            return self._send(404, {"error": f"Unknown endpoint: {url.path}"})
+        self._send(200, body)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        if endpoint != "matrix":
+            return self._send(404, {"error": f"Unknown endpoint: {url.path}"})
+        self.server.counts[endpoint] += 1
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        origins = [(p["lat"], p["lng"]) for p in request["origins"]]
+        destinations = [(p["lat"], p["lng"]) for p in request["destinations"]]
+        if len(origins) > self.server.matrix_max_origins:
+            return self._send(400, {"error": "Too many origins"})
+        routes = [_route(origin, destination) for origin in origins for destination in destinations]
+        self._send(200, {"matrix": {
+            "numOrigins": len(origins),
+            "numDestinations": len(destinations),
+            "travelTimes": [duration for duration, _ in routes],
+            "distances": [length for _, length in routes],
+        }})
+
+    def _send(self, status: int, body: Dict):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+          matrix_max_origins: int = 15) -> ThreadingHTTPServer:
+    """Serves the mock in a background thread; ``server_port`` has the port."""
+    server = ThreadingHTTPServer((host, port), MockHereHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.matrix_max_origins = matrix_max_origins
+    server.counts = Counter()
+    threading.Thread(target=server.serve_forever, name="mock-here", daemon=True).start()
+    return server
+
+
+def urls(server: ThreadingHTTPServer) -> Dict[str, str]:
+    """HereAPI keyword arguments pointing every endpoint at ``server``."""
+    base = f"http://{server.server_address[0]}:{server.server_port}"
+    return {
+        "geocode_url": f"{base}/v1/geocode",
+        "route_url": f"{base}/v8/routes",
+        "discover_url": f"{base}/v1/discover",
+        "autosuggest_url": f"{base}/v1/autosuggest",
+        "matrix_url": f"{base}/v8/matrix",
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local HERE mock with synthetic geocodes and routes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start(args.host, args.port, latency=args.latency_ms / 1000)
+    for name, url in urls(server).items():
+        print(f"export HERE_{name[:-4].upper()}_URL={url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,358 @@
+import csv
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_WIDTH = 24
+CELL_SIZE = 0.01  # degrees, roughly 1 km
+POSTINGS_PER_CELL = 128  # Distances computed in the time one grid cell takes to search
+_GRID_COLUMNS = int(360 / CELL_SIZE) + 1
+_TOKEN = re.compile(r"\w+")
+_NEAR = re.compile(r"\s+(?:near|around|close\s+to|next\s+to|in)\s+.*$", re.I)
+_STOPWORDS = {"a", "an", "the", "find", "show", "me", "for", "search", "list", "any", "some", "best"}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN.findall(_normalize(text))
+
+
+def _cell(lat: np.ndarray, lng: np.ndarray) -> np.ndarray:
+    rows = np.floor((np.asarray(lat, dtype=np.float64) + 90) / CELL_SIZE).astype(np.int64)
+    columns = np.floor((np.asarray(lng, dtype=np.float64) + 180) / CELL_SIZE).astype(np.int64)
+    return rows * _GRID_COLUMNS + columns
+
+
+def _pack(strings: List[str], path: str):
+    data = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in data], out=offsets[1:])
+    with open(path + ".bin", "wb") as f:
+        f.write(b"".join(data))
+    np.save(path + ".offsets.npy", offsets)
+
+
+def read_pois(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields {"title", "lat", "lng", "category"} from a CSV, GeoJSON or
+    Parquet dump. Column names follow the usual variants (name/title,
+    lat/latitude, lng/lon/longitude, category/categories)."""
+    if path.endswith((".geojson", ".json")):
+        with open(path) as f:
+            features = json.load(f)["features"]
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") != "Point":
+                continue
+            lng, lat = geometry["coordinates"][:2]
+            yield _poi(dict(feature.get("properties") or {}, lat=lat, lng=lng))
+    elif path.endswith(".parquet"):
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("Reading Parquet POI dumps needs pandas and pyarrow: pip install pandas pyarrow")
+        for row in pd.read_parquet(path).to_dict("records"):
+            yield _poi(row)
+    else:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                yield _poi(row)
+
+
+def _poi(row: Dict[str, Any]) -> Dict[str, Any]:
+    def first(*names):
+        for name in names:
+            if row.get(name) not in (None, ""):
+                return row[name]
+        return None
+    return {
+        "title": str(first("title", "name") or ""),
+        "lat": float(first("lat", "latitude")),
+        "lng": float(first("lng", "lon", "longitude")),
+        "category": str(first("category", "categories", "amenity") or ""),
+    }
+
+
+def build_index(source: str, out_dir: str) -> int:
+    """Writes the arrays PoiIndex memory-maps; returns the number of POIs."""
+    pois = [poi for poi in read_pois(source) if poi["title"]]
+    os.makedirs(out_dir, exist_ok=True)
+
+    coordinates = np.array([(poi["lat"], poi["lng"]) for poi in pois], dtype=np.float64).reshape(-1, 2)
+    np.save(os.path.join(out_dir, "coordinates.npy"), coordinates)
+    _pack([poi["title"] for poi in pois], os.path.join(out_dir, "titles"))
+    _pack([poi["category"] for poi in pois], os.path.join(out_dir, "categories"))
+
+    # Every title/category token points back at its POI. Sorted by token,
+    # a prefix is one contiguous range found by binary search (a flat trie);
+    # within a token the shortest titles come first.
+    keys, owners = [], []
+    for i, poi in enumerate(pois):
+        for token in set(_tokens(poi["title"]) + _tokens(poi["category"])):
+            keys.append(token.encode("utf-8")[:TOKEN_WIDTH])
+            owners.append(i)
+    keys = np.array(keys, dtype=f"S{TOKEN_WIDTH}")
+    owners = np.array(owners, dtype=np.int32)
+    title_lengths = np.array([len(poi["title"]) for poi in pois], dtype=np.int32)
+    order = np.lexsort((owners, title_lengths[owners], keys))
+    np.save(os.path.join(out_dir, "token_keys.npy"), keys[order])
+    np.save(os.path.join(out_dir, "token_pois.npy"), owners[order])
+
+    # The same tokens grouped by grid cell (a fixed-size geohash), so "near
+    # at" lookups only touch the cells around the position.
+    cells = _cell(coordinates[:, 0], coordinates[:, 1])[owners] if len(owners) else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((keys, cells))
+    np.save(os.path.join(out_dir, "cell_ids.npy"), cells[order])
+    np.save(os.path.join(out_dir, "cell_keys.npy"), keys[order])
+    np.save(os.path.join(out_dir, "cell_pois.npy"), owners[order])
+    return len(pois)
+
+
+class PoiIndex:
+    """Read-only POI index loaded from :func:`build_index` output.
+
+    All arrays are memory-mapped, so several workers share one copy in the
+    page cache. ``discover`` and ``autosuggest`` return HERE-shaped
+    responses, or ``None`` when nothing matches locally.
+    """
+
+    def __init__(self, path: str, max_radius_km: float = 50.0):
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        self.path = path
+        self.max_radius_m = max_radius_km * 1000
+        self.max_rings = max(1, int(max_radius_km / 111 / CELL_SIZE))
+        self.coordinates = load("coordinates.npy")
+        self._titles = _blob(os.path.join(path, "titles.bin"))
+        self._title_offsets = load("titles.offsets.npy")
+        self._categories = _blob(os.path.join(path, "categories.bin"))
+        self._category_offsets = load("categories.offsets.npy")
+        self.token_keys = load("token_keys.npy")
+        self.token_pois = load("token_pois.npy")
+        self.cell_ids = load("cell_ids.npy")
+        self.cell_keys = load("cell_keys.npy")
+        self.cell_pois = load("cell_pois.npy")
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "misses": 0}
+        self._lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    def _string(self, blob: np.ndarray, offsets: np.ndarray, i: int) -> str:
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def _range(self, keys: np.ndarray, prefix: bytes, lo: int = 0, hi: Optional[int] = None) -> Tuple[int, int]:
+        hi = len(keys) if hi is None else hi
+        start = lo + int(np.searchsorted(keys[lo:hi], prefix, side="left"))
+        end = lo + int(np.searchsorted(keys[lo:hi], prefix + b"\xff", side="left"))
+        return start, end
+
+    def _matches(self, i: int, tokens: List[str]) -> bool:
+        if not tokens:
+            return True
+        text = self._string(self._titles, self._title_offsets, i) + " " + \
+            self._string(self._categories, self._category_offsets, i)
+        words = _tokens(text)
+        return all(any(word.startswith(token) for word in words) for token in tokens)
+
+    def _pick(self, ids: np.ndarray, tokens: List[str], limit: int) -> List[int]:
+        picked, seen = [], set()
+        for i in ids:
+            i = int(i)
+            if i not in seen and self._matches(i, tokens):
+                picked.append(i)
+                if len(picked) == limit:
+                    break
+            seen.add(i)
+        return picked
+
+    def _distances(self, ids: np.ndarray, at: Tuple[float, float]) -> np.ndarray:
+        lat, lng = np.radians(self.coordinates[ids]).T
+        lat0, lng0 = math.radians(at[0]), math.radians(at[1])
+        a = np.sin((lat - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lat) * np.sin((lng - lng0) / 2) ** 2
+        return 2 * 6371000 * np.arcsin(np.sqrt(a))
+
+    def _closest(self, ids: np.ndarray, tokens: List[str], at: Tuple[float, float], limit: int) -> List[int]:
+        # Nothing within the radius is a miss, left to HERE. A bounding box
+        # around the radius is cheap to test, so exact distances are only
+        # computed inside it.
+        coordinates = self.coordinates[ids]
+        lat_span = self.max_radius_m / 111000
+        cos_edge = math.cos(math.radians(min(abs(at[0]) + lat_span, 90)))
+        lng_span = lat_span / cos_edge if cos_edge > 1e-6 else 360
+        ids = ids[(np.abs(coordinates[:, 0] - at[0]) <= lat_span) &
+                  (np.abs((coordinates[:, 1] - at[1] + 180) % 360 - 180) <= lng_span)]
+        distances = self._distances(ids, at)
+        inside = distances <= self.max_radius_m
+        ids, distances = ids[inside], distances[inside]
+        return self._pick(ids[np.argsort(distances, kind="stable")], tokens, limit)
+
+    def _near(self, prefix: bytes, tokens: List[str], at: Tuple[float, float], limit: int,
+              max_cells: int) -> Optional[List[int]]:
+        # Widen square rings of cells around ``at`` until enough matches are
+        # found, then one more ring so nothing closer is missed at the edge.
+        # Gives up with None after ``max_cells`` cells, e.g. far from any match.
+        row, column = divmod(int(_cell(at[0], at[1])), _GRID_COLUMNS)
+        found: List[np.ndarray] = []
+        count, last_ring = 0, self.max_rings
+        for ring in range(self.max_rings + 1):
+            if (2 * ring + 1) ** 2 > max_cells:
+                return None
+            for dr in range(-ring, ring + 1):
+                for dc in range(-ring, ring + 1):
+                    if max(abs(dr), abs(dc)) != ring:
+                        continue
+                    cell = (row + dr) * _GRID_COLUMNS + column + dc
+                    lo = int(np.searchsorted(self.cell_ids, cell, side="left"))
+                    hi = int(np.searchsorted(self.cell_ids, cell, side="right"))
+                    if hi > lo:
+                        start, end = self._range(self.cell_keys, prefix, lo, hi)
+                        if end > start:
+                            found.append(self.cell_pois[start:end])
+                            count += end - start
+            if count >= limit and last_ring == self.max_rings:
+                last_ring = min(ring + 1, self.max_rings)
+            if ring >= last_ring:
+                break
+        if not found:
+            return []
+        return self._closest(np.concatenate(found), tokens, at, limit)
+
+    def _shortest(self, lo: int, hi: int, tokens: List[str], limit: int) -> List[int]:
+        ids = self.token_pois[lo:hi]
+        if self.token_keys[lo] != self.token_keys[hi - 1]:
+            # The prefix spans several tokens, each ordered by title length
+            # on its own; merge them.
+            lengths = self._title_offsets[ids + 1] - self._title_offsets[ids]
+            ids = ids[np.argsort(lengths, kind="stable")]
+        return self._pick(ids, tokens, limit)
+
+    def _items(self, ids: np.ndarray, at: Optional[Tuple[float, float]]) -> List[Dict[str, Any]]:
+        items = []
+        distances = self._distances(ids, at) if at is not None else None
+        for n, i in enumerate(ids):
+            item = {
+                "title": self._string(self._titles, self._title_offsets, i),
+                "position": {"lat": float(self.coordinates[i, 0]), "lng": float(self.coordinates[i, 1])},
+            }
+            category = self._string(self._categories, self._category_offsets, i)
+            if category:
+                item["categories"] = [{"name": category}]
+            if distances is not None:
+                item["distance"] = int(distances[n])
+            items.append(item)
+        return items
+
+    def _search(self, tokens: List[str], at: Optional[str], limit: int) -> Optional[Dict[str, Any]]:
+        started = time.perf_counter()
+        ids: List[int] = []
+        position = _parse_at(at)
+        if tokens:
+            # Look up the most selective token and check the rest against
+            # the few POIs it yields.
+            prefixes = [token.encode("utf-8")[:TOKEN_WIDTH - 1] for token in tokens]
+            ranges = [self._range(self.token_keys, prefix) for prefix in prefixes]
+            best = min(range(len(tokens)), key=lambda k: ranges[k][1] - ranges[k][0])
+            lo, hi = ranges[best]
+            if hi > lo:
+                if position is None:
+                    ids = self._shortest(lo, hi, tokens, limit)
+                else:
+                    # Walking the grid beats measuring the distance to every
+                    # POI with the token only while it visits few cells.
+                    ids = None
+                    if hi - lo > 4096:
+                        ids = self._near(prefixes[best], tokens, position, limit,
+                                         max_cells=(hi - lo) // POSTINGS_PER_CELL)
+                    if ids is None:
+                        ids = self._closest(self.token_pois[lo:hi], tokens, position, limit)
+        result = {"items": self._items(np.asarray(ids, dtype=np.int64), position)} if ids else None
+        with self._lock:
+            self._counts["hits" if result else "misses"] += 1
+            self._lookup_seconds += time.perf_counter() - started
+        return result
+
+    def discover(self, query: str, at: Optional[str] = None, limit: int = 20) -> Optional[Dict[str, Any]]:
+        # "cafes near the station" with a position: the position already says
+        # where, so only "cafes" has to match.
+        if at:
+            query = _NEAR.sub("", query)
+        tokens = [token[:-1] if len(token) > 3 and token.endswith("s") else token
+                  for token in _tokens(query) if token not in _STOPWORDS]
+        return self._search(tokens, at, limit)
+
+    def autosuggest(self, query: str, at: Optional[str] = None, limit: int = 20) -> Optional[Dict[str, Any]]:
+        return self._search(_tokens(query), at, limit)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["misses"]
+            return {
+                "pois": len(self),
+                "lookups": lookups,
+                "hits": self._counts["hits"],
+                "misses": self._counts["misses"],
+                "avg_lookup_us": self._lookup_seconds / lookups * 1e6 if lookups else 0.0,
+            }
+
+
+def _blob(path: str) -> np.ndarray:
+    # np.memmap refuses empty files.
+    if not os.path.getsize(path):
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def _parse_at(at: Optional[str]) -> Optional[Tuple[float, float]]:
+    if not at:
+        return None
+    try:
+        lat, lng = (float(part) for part in at.split(","))
+    except ValueError:
+        return None
+    return lat, lng
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or query the offline POI index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Index a CSV, GeoJSON or Parquet POI dump")
+    build.add_argument("source")
+    build.add_argument("out_dir")
+    query = subparsers.add_parser("query", help="Run a lookup and time it")
+    query.add_argument("index_dir")
+    query.add_argument("q")
+    query.add_argument("--at")
+    query.add_argument("--autosuggest", action="store_true")
+    query.add_argument("--limit", type=int, default=5)
+    query.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        count = build_index(args.source, args.out_dir)
+        print(f"Indexed {count} POIs into {args.out_dir} in {time.perf_counter() - started:.1f}s")
+    else:
+        index = PoiIndex(args.index_dir)
+        lookup = index.autosuggest if args.autosuggest else index.discover
+        result = lookup(args.q, at=args.at, limit=args.limit)
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            lookup(args.q, at=args.at, limit=args.limit)
+        elapsed = (time.perf_counter() - started) / args.repeat
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        print(f"{elapsed * 1e6:.1f} µs per lookup over {len(index)} POIs")
@@ -1,11 +1,60 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import secrets
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from batch import BatchRunner
 from main import NavigationApp
 from utils.config import Config
+from utils.executor import ExecutorSaturated
+from utils.metrics import REGISTRY
+from utils.tracing import tracer
 
 app = FastAPI()
 
-navigation_app = NavigationApp(Config.MODEL_PATH)
+navigation_app: Optional[NavigationApp] = None
+startup_state: Dict[str, Any] = {"phase": "loading", "error": None}
+
+async def _start():
+    global navigation_app
+    loop = asyncio.get_running_loop()
+    try:
+        navigation_app = await loop.run_in_executor(None, NavigationApp, Config.MODEL_PATH)
+        if Config.WARMUP_ENABLED:
+            startup_state["phase"] = "warming_up"
+            await loop.run_in_executor(None, navigation_app.warm_up)
+        startup_state["phase"] = "ready"
+    except Exception as e:
+        startup_state.update(phase="failed", error=str(e))
+    print(f"Startup {startup_state['phase']}: {json.dumps(_startup_timings())}")
+
+def _startup_timings() -> Dict[str, float]:
+    if navigation_app is None:
+        return {}
+    return {phase: round(seconds, 3) for phase, seconds in navigation_app.startup_timings.items()}
+
+def _require_app() -> NavigationApp:
+    if startup_state["phase"] != "ready":
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service is not ready ({startup_state['phase']})",
+            headers={"Retry-After": str(Config.INFERENCE_RETRY_AFTER)},
+        )
+    return navigation_app
+
+@app.on_event("startup")
+async def startup():
+    # The model loads in the background so the server accepts /live probes
+    # straight away; /ready flips once loading and warm-up are done.
+    app.state.startup_task = asyncio.ensure_future(_start())
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.startup_task.cancel()
+    if navigation_app is not None:
+        await navigation_app.aclose()
 
 class QueryRequest(BaseModel):
     query: str
@@ -13,14 +62,146 @@ class QueryRequest(BaseModel):
 class QueryResponse(BaseModel):
     response: str
 
+class ModelRequest(BaseModel):
+    backend: Optional[str] = None
+    model_path: Optional[str] = None
+    quantization: Optional[str] = None
+    n_ctx: Optional[int] = None
+    n_threads: Optional[int] = None
+    n_batch: Optional[int] = None
+    n_gpu_layers: Optional[int] = None
+    n_slots: Optional[int] = None
+    warm_up: bool = True
+
+class BatchRequest(BaseModel):
+    records: List[Dict[str, Any]]
+    concurrency: Optional[int] = None
+
 @app.post("/query", response_model=QueryResponse)
 async def process_query(request: QueryRequest):
+    navigation_app = _require_app()
     try:
-        response = navigation_app.process_query(request.query)
+        response = await navigation_app.aprocess_query(request.query)
         return QueryResponse(response=response)
+    except ExecutorSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(Config.INFERENCE_RETRY_AFTER)},
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/query/stream")
+async def stream_query(request: QueryRequest):
+    navigation_app = _require_app()
+
+    async def events():
+        stream = navigation_app.astream_query(request.query)
+        try:
+            async for event in stream:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except ExecutorSaturated as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e), 'status': 503})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e), 'status': 500})}\n\n"
+        finally:
+            # Closing the stream cancels its query when the client disconnects.
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/query/batch")
+async def batch_query(request: BatchRequest):
+    navigation_app = _require_app()
+    runner = BatchRunner(navigation_app, concurrency=request.concurrency or Config.BATCH_CONCURRENCY)
+
+    async def lines():
+        async for line in runner.run(request.records):
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/live")
+async def live():
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def ready():
+    body = {"status": startup_state["phase"], "startup_timings": _startup_timings()}
+    if startup_state["error"]:
+        body["error"] = startup_state["error"]
+    if startup_state["phase"] != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/metrics")
+async def metrics():
+    # Served before the app is ready so scrapes never fail.
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces(trace_id: Optional[str] = None):
+    """Recent spans as an OTLP/JSON export request."""
+    return tracer.export(tracer.recent(trace_id))
+
+@app.get("/model")
+async def current_model():
+    navigation_app = _require_app()
+    return navigation_app.model_spec._asdict()
+
+def _require_admin(authorization: Optional[str]):
+    if not Config.MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model swapping is disabled; set MODEL_ADMIN_TOKEN to enable it")
+    if not secrets.compare_digest(authorization or "", f"Bearer {Config.MODEL_ADMIN_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+@app.post("/model")
+async def swap_model(request: ModelRequest, authorization: Optional[str] = Header(None)):
+    """Hot-swaps the model; unset fields keep their current value. Needs
+    ``Authorization: Bearer <MODEL_ADMIN_TOKEN>``."""
+    _require_admin(authorization)
+    navigation_app = _require_app()
+    overrides = request.dict(exclude={"warm_up"}, exclude_none=True)
+    spec = navigation_app.model_spec._replace(**overrides)
+    loop = asyncio.get_running_loop()
+    try:
+        timings = await loop.run_in_executor(None, navigation_app.swap_model, spec, request.warm_up)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Model swap failed, still serving the previous model: {e}")
+    return {"model": spec._asdict(), "timings": {phase: round(seconds, 3) for phase, seconds in timings.items()}}
+
+@app.get("/inference/stats")
+async def inference_stats():
+    navigation_app = _require_app()
+    stats = navigation_app.executor.stats()
+    stats["batching"] = navigation_app.model.scheduler.stats()
+    if navigation_app.model.prefix_cache is not None:
+        stats["prefix_cache"] = navigation_app.model.prefix_cache.stats()
+    return stats
+
+@app.get("/router/stats")
+async def router_stats():
+    navigation_app = _require_app()
+    if navigation_app.router is None:
+        return {}
+    return navigation_app.router.stats()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    navigation_app = _require_app()
+    stats = {"here": navigation_app.here_api.cache_stats()}
+    if navigation_app.here_api.local_index is not None:
+        stats["poi"] = navigation_app.here_api.local_index.stats()
+    if navigation_app.semantic_cache is not None:
+        stats["semantic"] = navigation_app.semantic_cache.stats()
+    return stats
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,149 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, Optional, Set
+
+from utils.config import Config
+from utils.executor import ExecutorSaturated
+
+# Records carrying one of these actions skip the LLM and go straight to the tool.
+STRUCTURED_PARAMS = {
+    "geocode": ("address",),
+    "route": ("origin", "destination"),
+    "discover": ("q", "at"),
+    "autosuggest": ("q", "at"),
+}
+
+
+def record_id(index: int, record: Dict[str, Any]) -> str:
+    return str(record.get("id") or index)
+
+
+def _normalize(value: Any) -> str:
+    return " ".join(str(value).lower().split())
+
+
+class BatchRunner:
+    def __init__(self, app, concurrency: int = Config.BATCH_CONCURRENCY):
+        self.app = app
+        self.concurrency = concurrency
+
+    async def run(self, records: Iterable[Dict[str, Any]], skip_ids: Optional[Set[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Yields one result line per record, in completion order.
+
+        Identical records (same query, or same action and params) are
+        resolved once and share the result.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        shared: Dict[str, asyncio.Future] = {}
+        tasks = []
+        for index, record in enumerate(records):
+            rid = record_id(index, record)
+            if skip_ids and rid in skip_ids:
+                continue
+            tasks.append(asyncio.ensure_future(self._process(rid, record, semaphore, shared)))
+
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+    async def _process(self, record_id: str, record: Dict[str, Any], semaphore: asyncio.Semaphore,
+                       shared: Dict[str, asyncio.Future]) -> Dict[str, Any]:
+        try:
+            key = self._key(record)
+            if key not in shared:
+                shared[key] = asyncio.ensure_future(self._resolve(record, semaphore))
+            result = await asyncio.shield(shared[key])
+        except Exception as e:
+            return {"id": record_id, "error": str(e)}
+        if result.action == "error":
+            return {"id": record_id, "error": result.raw_response}
+        return {"id": record_id, **result.dict(exclude={"raw_response"}, exclude_none=True)}
+
+    def _key(self, record: Dict[str, Any]) -> str:
+        action = record.get("action")
+        if action:
+            if action not in STRUCTURED_PARAMS:
+                raise ValueError(f"Unknown action: {action}")
+            params = self._params(record)
+            return json.dumps([action, {name: _normalize(value) for name, value in params.items()}], sort_keys=True)
+        if not record.get("query"):
+            raise ValueError("Record needs either 'query' or 'action' with its params")
+        return json.dumps(["query", _normalize(record["query"])])
+
+    def _params(self, record: Dict[str, Any]) -> Dict[str, str]:
+        return {name: record[name] for name in STRUCTURED_PARAMS[record["action"]] if record.get(name)}
+
+    async def _resolve(self, record: Dict[str, Any], semaphore: asyncio.Semaphore):
+        async with semaphore:
+            if record.get("action"):
+                return await self.app.agent.aexecute(record["action"], self._params(record))
+            while True:
+                try:
+                    return await self.app.aresolve(record["query"])
+                except ExecutorSaturated:
+                    await asyncio.sleep(1)
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if value not in (None, "")}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def completed_ids(path: str) -> Set[str]:
+    if not os.path.exists(path):
+        return set()
+    ids = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                ids.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                # A line cut short by a crash; that record is simply redone.
+                continue
+    return ids
+
+
+async def main(args):
+    from main import NavigationApp
+
+    app = NavigationApp(Config.MODEL_PATH)
+    records = list(read_records(args.input))
+    skip_ids = completed_ids(args.output) if args.resume else set()
+    runner = BatchRunner(app, concurrency=args.concurrency)
+
+    total = sum(record_id(index, record) not in skip_ids for index, record in enumerate(records))
+    done = errors = 0
+    started = time.monotonic()
+    with open(args.output, "a" if args.resume else "w") as out:
+        async for line in runner.run(records, skip_ids):
+            out.write(json.dumps(line) + "\n")
+            out.flush()
+            done += 1
+            errors += "error" in line
+            if done % args.progress_every == 0 or done == total:
+                rate = done / (time.monotonic() - started)
+                print(f"{done}/{total} records, {errors} errors, {rate:.1f} records/s", file=sys.stderr)
+    await app.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Resolve many navigation queries or structured geocode/route records to NDJSON."
+    )
+    parser.add_argument("input", help="CSV or JSON-lines file; records have 'query' or 'action' plus its params")
+    parser.add_argument("-o", "--output", default="results.ndjson")
+    parser.add_argument("--concurrency", type=int, default=Config.BATCH_CONCURRENCY)
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Overwrite the output instead of skipping records already in it")
+    parser.add_argument("--progress-every", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
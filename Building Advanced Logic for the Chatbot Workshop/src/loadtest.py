@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import httpx
+import numpy as np
+
+# Offline load test for app.py: the service runs with the stub LLM
+# (models/stub.py) against the HERE mock (api/mock_here.py), both started
+# as subprocesses, and is driven with a weighted mix of query types.
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PLACES = [
+    "Berlin", "Munich", "Hamburg", "Cologne", "Frankfurt", "Stuttgart", "Leipzig", "Dresden", "Hanover",
+    "Nuremberg", "Bremen", "Essen", "Potsdam", "Heidelberg", "Alexanderplatz", "Brandenburg Gate",
+    "Museum Island", "Checkpoint Charlie", "Tempelhof Field", "Charlottenburg Palace",
+]
+CATEGORIES = ["cafe", "museum", "pharmacy", "hotel", "restaurant", "parking", "bakery", "cinema"]
+
+DEFAULT_MIX = "geocode=4,route=3,discover=2,autosuggest=1"
+
+
+class Sample(NamedTuple):
+    action: str
+    latency: float
+    status: int
+    error: Optional[str]
+
+
+def _yaml(action: str, **params) -> str:
+    lines = [f"action: {action}", "params:"]
+    lines.extend(f"    {key}: {json.dumps(value)}" for key, value in params.items())
+    return "\n".join(lines) + "\n"
+
+
+def _query(action: str, rng: random.Random) -> Tuple[str, str]:
+    if action == "geocode":
+        place = rng.choice(PLACES)
+        return f"What are the coordinates of {place}?", _yaml("geocode", address=place)
+    if action == "route":
+        origin, destination = rng.sample(PLACES, 2)
+        return f"How do I get from {origin} to {destination}?", _yaml("route", origin=origin, destination=destination)
+    if action == "discover":
+        category, place = rng.choice(CATEGORIES), rng.choice(PLACES)
+        return f"Find a {category} in {place}", _yaml("discover", q=f"{category} in {place}")
+    if action == "autosuggest":
+        prefix = rng.choice(PLACES)[:rng.randint(3, 5)]
+        return f"Suggest places starting with {prefix}", _yaml("autosuggest", q=prefix)
+    raise ValueError(f"Unknown action in mix: {action}")
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        action, _, weight = part.partition("=")
+        weights[action.strip()] = float(weight or 1)
+    return weights
+
+
+def build_scenario(mix: Dict[str, float], n_requests: int, distinct: int,
+                   seed: int) -> Tuple[List[Tuple[str, str]], Dict[str, str]]:
+    """The request sequence as (action, query) pairs, drawn from ``distinct``
+    queries per action, and the canned LLM response for every query."""
+    rng = random.Random(seed)
+    pools: Dict[str, List[str]] = {}
+    responses: Dict[str, str] = {}
+    for action in mix:
+        pool = pools[action] = []
+        for _ in range(distinct * 20):
+            if len(pool) == distinct:
+                break
+            query, response = _query(action, rng)
+            if query not in responses:
+                pool.append(query)
+                responses[query] = response
+    actions = rng.choices(list(mix), weights=list(mix.values()), k=n_requests)
+    return [(action, rng.choice(pools[action])) for action in actions], responses
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, process: subprocess.Popen, timeout: float, ready=lambda response: True):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            if ready(httpx.get(url, timeout=1)):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout:g}s")
+
+
+@contextmanager
+def _process(args: List[str], env: Dict[str, str]) -> Iterator[subprocess.Popen]:
+    process = subprocess.Popen([sys.executable, *args], cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+@contextmanager
+def offline_service(args, responses: Dict[str, str]) -> Iterator[str]:
+    """Starts the HERE mock and the service with the stub LLM; yields the
+    service URL once /ready reports ready."""
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(responses, f)
+    here_port, service_port = _free_port(), _free_port()
+    here = f"http://127.0.0.1:{here_port}"
+    env = dict(
+        os.environ,
+        HERE_API_KEY="offline",
+        HERE_GEOCODE_URL=f"{here}/v1/geocode",
+        HERE_ROUTE_URL=f"{here}/v8/routes",
+        HERE_DISCOVER_URL=f"{here}/v1/discover",
+        HERE_AUTOSUGGEST_URL=f"{here}/v1/autosuggest",
+        HERE_MATRIX_URL=f"{here}/v8/matrix",
+        HERE_CACHE_PATH="",
+        POI_INDEX_PATH="",
+        LLM_BACKEND="stub",
+        STUB_LLM_RESPONSES=f.name,
+        STUB_LLM_DELAY_MS=str(args.llm_delay_ms),
+        ROUTER_ENABLED="1" if args.router else "0",
+        SEMANTIC_CACHE_ENABLED="1" if args.semantic_cache else "0",
+        TRACE_EXPORT_PATH="",
+        TRACE_OTLP_ENDPOINT="",
+        HF_HUB_OFFLINE="1",
+    )
+    if not args.here_cache:
+        env.update({f"HERE_CACHE_TTL_{endpoint}": "0"
+                    for endpoint in ("GEOCODE", "ROUTE", "MATRIX", "DISCOVER", "AUTOSUGGEST")})
+    try:
+        with _process(["-m", "api.mock_here", "--port", str(here_port),
+                       "--latency-ms", str(args.here_latency_ms)], env) as mock:
+            _wait_for(f"{here}/v1/stats", mock, timeout=30)
+            with _process(["-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(service_port),
+                           "--log-level", "warning"], env) as service:
+                url = f"http://127.0.0.1:{service_port}"
+                _wait_for(f"{url}/ready", service, timeout=args.startup_timeout,
+                          ready=lambda response: response.status_code == 200)
+                yield url
+    finally:
+        os.unlink(f.name)
+
+
+async def drive(url: str, requests: List[Tuple[str, str]], concurrency: int, timeout: float) -> List[Sample]:
+    """Sends ``requests`` to /query from ``concurrency`` closed-loop workers."""
+    samples: List[Sample] = []
+    pending = iter(requests)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def worker(client: httpx.AsyncClient):
+        for action, query in pending:
+            started = time.perf_counter()
+            status, error = 0, None
+            try:
+                response = await client.post(f"{url}/query", json={"query": query})
+                status = response.status_code
+                if status != 200:
+                    error = f"HTTP {status}"
+                elif response.json()["response"].startswith("Error or unexpected result"):
+                    error = "agent error"
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            samples.append(Sample(action, time.perf_counter() - started, status, error))
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return samples
+
+
+def _latency(samples: List[Sample]) -> Dict[str, float]:
+    latencies = np.array([sample.latency for sample in samples]) * 1000
+    if not len(latencies):
+        return {}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3),
+            "mean": round(float(latencies.mean()), 3), "max": round(float(latencies.max()), 3)}
+
+
+def _summary(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    errors = sum(sample.error is not None for sample in samples)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(samples) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": _latency(samples),
+    }
+
+
+_SPAN_SERIES = re.compile(r'^navigation_span_duration_seconds_(sum|count)\{span="([^"]+)",status="ok"\} (\S+)$')
+
+
+def stage_means(metrics: str) -> Dict[str, float]:
+    """Mean duration in ms of every traced stage, from the /metrics text."""
+    series: Dict[str, Dict[str, float]] = {}
+    for line in metrics.splitlines():
+        match = _SPAN_SERIES.match(line)
+        if match:
+            series.setdefault(match.group(2), {})[match.group(1)] = float(match.group(3))
+    return {span: round(values["sum"] / values["count"] * 1000, 3)
+            for span, values in sorted(series.items()) if values.get("count")}
+
+
+def _commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=SRC_DIR, capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+async def run(args, url: str, requests: List[Tuple[str, str]]) -> Dict[str, Any]:
+    if args.warmup:
+        await drive(url, requests[:args.warmup], args.concurrency, args.timeout)
+    started = time.perf_counter()
+    samples = await drive(url, requests[args.warmup:], args.concurrency, args.timeout)
+    elapsed = time.perf_counter() - started
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        inference = (await client.get(f"{url}/inference/stats")).json()
+        metrics = (await client.get(f"{url}/metrics")).text
+    errors: Dict[str, int] = {}
+    for sample in samples:
+        if sample.error is not None:
+            errors[sample.error] = errors.get(sample.error, 0) + 1
+    return {
+        "meta": {
+            "commit": _commit(),
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "url": url,
+            "args": vars(args),
+        },
+        "overall": _summary(samples, elapsed),
+        "by_action": {action: _summary([sample for sample in samples if sample.action == action], elapsed)
+                      for action in parse_mix(args.mix)},
+        "errors": errors,
+        "server": {"stage_ms": stage_means(metrics), "inference": inference},
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of ``result`` against ``baseline``: latency percentiles or
+    error rate up, or throughput down, by more than ``tolerance``."""
+    regressions = []
+    groups = [("overall", result["overall"], baseline["overall"])]
+    groups += [(action, summary, baseline["by_action"][action])
+               for action, summary in result["by_action"].items() if action in baseline.get("by_action", {})]
+    for name, current, previous in groups:
+        for percentile in ("p50", "p95", "p99"):
+            now, before = current["latency_ms"].get(percentile), previous["latency_ms"].get(percentile)
+            if now is not None and before and now > before * (1 + tolerance):
+                regressions.append(f"{name} {percentile}: {before:.1f} ms -> {now:.1f} ms")
+        if current["error_rate"] > previous["error_rate"] + tolerance / 10:
+            regressions.append(f"{name} error rate: {previous['error_rate']:.2%} -> {current['error_rate']:.2%}")
+    now, before = result["overall"]["throughput_rps"], baseline["overall"]["throughput_rps"]
+    if before and now < before * (1 - tolerance):
+        regressions.append(f"throughput: {before:.1f} -> {now:.1f} req/s")
+    return regressions
+
+
+def _print_report(result: Dict[str, Any]):
+    rows = [("overall", result["overall"])] + list(result["by_action"].items())
+    print(f"{'':12} {'requests':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=sys.stderr)
+    for name, summary in rows:
+        latency = summary["latency_ms"]
+        print(f"{name:12} {summary['requests']:>8} {summary['error_rate']:>7.1%} {latency.get('p50', 0):>9.1f} "
+              f"{latency.get('p95', 0):>9.1f} {latency.get('p99', 0):>9.1f}", file=sys.stderr)
+    print(f"throughput: {result['overall']['throughput_rps']:.1f} req/s", file=sys.stderr)
+
+
+def main(args) -> int:
+    mix = parse_mix(args.mix)
+    requests, responses = build_scenario(mix, args.warmup + args.requests, args.distinct, args.seed)
+    if args.url:
+        result = asyncio.run(run(args, args.url.rstrip("/"), requests))
+    else:
+        with offline_service(args, responses) as url:
+            result = asyncio.run(run(args, url, requests))
+
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    _print_report(result)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline load test of the navigation service with a stub LLM and a mock HERE server."
+    )
+    parser.add_argument("--url", help="Drive an already running service instead of starting one "
+                                      "(its LLM and HERE setup are then up to you)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted query types, e.g. geocode=4,route=1")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent first and left out of the results")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct", type=int, default=50, help="Distinct queries per query type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--llm-delay-ms", type=float, default=200.0)
+    parser.add_argument("--here-latency-ms", type=float, default=20.0)
+    parser.add_argument("--no-here-cache", dest="here_cache", action="store_false")
+    parser.add_argument("--router", action="store_true", help="Let the regex router skip the LLM")
+    parser.add_argument("--semantic-cache", action="store_true", help="Needs the embedding model available locally")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("-o", "--output", default="loadtest-results.json")
+    parser.add_argument("--compare", help="Earlier results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Relative slowdown allowed before --compare reports a regression")
+    sys.exit(main(parser.parse_args()))
@@ -1,32 +1,265 @@
-from agents.navigation import NavigationAgent
+from agents.navigation import (ACTIONS, AutosuggestResult, DiscoverResult, GeocodingResult, NavigationAgent,
+                               RoutingResult)
+from agents.plan import PlanExecutor, PlanResult
+from agents.router import IntentRouter, RegexTier
+from api.cache import ResultCache
 from api.here import HereAPI
-from models.mistral import MistralModel
+from api.poi_index import PoiIndex
+from models.registry import HotSwapLLM, ModelSpec, create_model
 from tools.autosuggest_tool import AutosuggestTool
 from tools.discover_tool import DiscoverTool
 from tools.geocode_tool import GeocodeTool
 from tools.route_tool import RouteTool
+from utils.config import Config
+from utils.executor import InferenceExecutor
+from utils.grammar import NAVIGATION_GRAMMAR
+from utils.semantic_cache import SemanticCache, SentenceTransformerEmbedder
+from utils.tracing import tracer
 from os import getenv
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+import asyncio
+import queue
+import threading
+import time
 
 
 model_path = getenv('MODEL_PATH', '/app/models/Mistral-7B-Instruct-v0.3.Q8_0.gguf')
+
+
 class NavigationApp:
-    def __init__(self, model_path: str):
-        model = MistralModel(model_path)
-        here_api = HereAPI()
-        geocode_tool = GeocodeTool(api=here_api)
-        route_tool = RouteTool(api=here_api)
-        discover_tool = DiscoverTool(api=here_api)
-        autosuggest_tool = AutosuggestTool(api=here_api)
+    def __init__(self, model_path: str, model_spec: Optional[ModelSpec] = None):
+        self.startup_timings: Dict[str, float] = {}
+        self.model_spec = model_spec or ModelSpec.from_config(model_path)
+        self._swap_lock = threading.Lock()
+        started = time.perf_counter()
+        # The model and the embedding model dominate startup and do not depend
+        # on each other, so they load in the background while the cheap parts
+        # are built here.
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as pool:
+            model = pool.submit(self._timed, "model", create_model, self.model_spec)
+            semantic_cache = None
+            if Config.SEMANTIC_CACHE_ENABLED:
+                semantic_cache = pool.submit(self._timed, "semantic_cache", self._build_semantic_cache)
+            tools = self._timed("tools", self._build_tools)
+            self.model = model.result()
+            self.semantic_cache = semantic_cache.result() if semantic_cache else None
+
+        # The agent holds a handle rather than the model so swap_model can
+        # replace the model underneath it.
+        self.llm = HotSwapLLM(self.model)
         self.agent = NavigationAgent(
-            model.get_llm(),
-            geocode_tool,
-            route_tool,
-            discover_tool,
-            autosuggest_tool
+            self.llm,
+            *tools,
+            executor=self.executor,
+            router=self.router,
+            plan_executor=PlanExecutor(ACTIONS, step_timeout=Config.PLAN_STEP_TIMEOUT,
+                                       max_steps=Config.PLAN_MAX_STEPS),
+        )
+        self._timed("prefix_cache", self.model.cache_prefix, self.agent.prompt_prefix)
+        if Config.LLM_CONSTRAINED_DECODING:
+            self._timed("grammar", self.model.set_output_grammar, NAVIGATION_GRAMMAR)
+        self.startup_timings["total"] = time.perf_counter() - started
+
+    def _timed(self, phase: str, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - started
+
+    def _build_tools(self):
+        cache = ResultCache(
+            ttls=Config.HERE_CACHE_TTLS,
+            max_size=Config.HERE_CACHE_SIZE,
+            path=Config.HERE_CACHE_PATH or None,
+        )
+        local_index = PoiIndex(Config.POI_INDEX_PATH) if Config.POI_INDEX_PATH else None
+        self.here_api = HereAPI(cache=cache, local_index=local_index)
+        self.executor = InferenceExecutor(
+            max_workers=self._inference_workers(self.model_spec),
+            max_queue=Config.INFERENCE_QUEUE_SIZE,
+        )
+        self.router = None
+        if Config.ROUTER_ENABLED:
+            self.router = IntentRouter(
+                [RegexTier()],
+                threshold=Config.ROUTER_THRESHOLD,
+                log_path=Config.ROUTER_DECISION_LOG or None,
+            )
+        return (
+            GeocodeTool(api=self.here_api),
+            RouteTool(api=self.here_api),
+            DiscoverTool(api=self.here_api),
+            AutosuggestTool(api=self.here_api),
         )
 
+    @staticmethod
+    def _inference_workers(spec: ModelSpec) -> int:
+        return Config.INFERENCE_WORKERS or 4 * spec.n_slots
+
+    def _build_semantic_cache(self) -> SemanticCache:
+        return SemanticCache(
+            SentenceTransformerEmbedder(Config.SEMANTIC_CACHE_MODEL),
+            threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+            max_entries=Config.SEMANTIC_CACHE_SIZE,
+            result_ttl=Config.SEMANTIC_CACHE_RESULT_TTL,
+            parse=RegexTier().classify,
+        )
+
+    def swap_model(self, spec: ModelSpec, warm_up: bool = True) -> Dict[str, float]:
+        """Loads ``spec`` next to the running model and switches to it once it
+        is prepared; requests keep being served by the old model until then.
+        Needs memory for both models while the new one loads."""
+        with self._swap_lock:
+            timings: Dict[str, float] = {}
+            started = time.perf_counter()
+            model = create_model(spec)
+            timings["model"] = time.perf_counter() - started
+            model.cache_prefix(self.agent.prompt_prefix)
+            if Config.LLM_CONSTRAINED_DECODING:
+                model.set_output_grammar(NAVIGATION_GRAMMAR)
+            if warm_up:
+                model.warm_up(self.agent.prompt.format(query=Config.WARMUP_QUERY))
+            timings["prepare"] = time.perf_counter() - started - timings["model"]
+            old = self.llm.swap(model)
+            if self._inference_workers(spec) != self.executor.max_workers:
+                self.executor.resize(self._inference_workers(spec))
+            self.model, self.model_spec = model, spec
+            old.shutdown()
+            timings["total"] = time.perf_counter() - started
+            return timings
+
+    def warm_up(self):
+        """Runs one short generation per LLM slot (and one embedding) so the
+        first real query doesn't pay for paging in the weights."""
+        prompt = self.agent.prompt.format(query=Config.WARMUP_QUERY)
+        self._timed("warm_up", self.model.warm_up, prompt)
+        if self.semantic_cache is not None:
+            self._timed("warm_up_embedder", self.semantic_cache.embed, Config.WARMUP_QUERY)
+
     def process_query(self, query: str):
-        result = self.agent.run(query)
+        with tracer.span("app.query"):
+            result = self.resolve(query)
+            with tracer.span("app.format"):
+                return self._format_result(result)
+
+    async def aprocess_query(self, query: str):
+        with tracer.span("app.query"):
+            result = await self.aresolve(query)
+            with tracer.span("app.format"):
+                return self._format_result(result)
+
+    def stream_query(self, query: str) -> Iterator[Dict[str, Any]]:
+        events: "queue.Queue" = queue.Queue()
+        done = object()
+
+        def worker():
+            try:
+                result = self.resolve(query, on_event=lambda event, data: events.put(self._render_event(event, data)))
+                events.put({"event": "result", "data": {"action": result.action,
+                                                        "response": self._format_result(result)}})
+            except Exception as e:
+                events.put({"event": "error", "data": {"message": str(e)}})
+            finally:
+                events.put(done)
+
+        threading.Thread(target=worker, daemon=True).start()
+        while (event := events.get()) is not done:
+            yield event
+
+    async def astream_query(self, query: str) -> AsyncIterator[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        events: "asyncio.Queue" = asyncio.Queue()
+
+        # Token callbacks fire on inference threads, so hop back onto the loop.
+        def on_event(event: str, data: Dict[str, Any]):
+            loop.call_soon_threadsafe(events.put_nowait, self._render_event(event, data))
+
+        task = asyncio.ensure_future(self.aresolve(query, on_event=on_event))
+        try:
+            while not task.done() or not events.empty():
+                getter = asyncio.ensure_future(events.get())
+                try:
+                    await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                except asyncio.CancelledError:
+                    getter.cancel()
+                    raise
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+        finally:
+            # The consumer went away (e.g. the SSE client disconnected):
+            # stop the query so it frees its inference slot.
+            if not task.done():
+                task.cancel()
+        result = task.result()
+        yield {"event": "result", "data": {"action": result.action, "response": self._format_result(result)}}
+
+    def resolve(self, query: str, on_event=None):
+        with tracer.span("app.resolve", query_chars=len(query)) as span:
+            if self.semantic_cache is None:
+                return self.agent.run(query, on_event)
+            with tracer.span("semantic_cache.embed"):
+                embedding = self.semantic_cache.embed(query)
+            with tracer.span("semantic_cache.lookup"):
+                entry = self.semantic_cache.lookup(embedding, query)
+            if entry is not None:
+                if self.semantic_cache.is_fresh(entry):
+                    span.set(semantic_cache="hit")
+                    if on_event is not None:
+                        on_event("status", {"message": "Answered from cache"})
+                    return entry.result
+                span.set(semantic_cache="stale")
+                result = self.agent.execute(entry.action, entry.params, entry.raw_output, on_event)
+                if result.action != "error":
+                    self.semantic_cache.refresh(entry, result)
+                return result
+            span.set(semantic_cache="miss")
+            result = self.agent.run(query, on_event)
+            if result.action != "error":
+                self.semantic_cache.add(embedding, query, result)
+            return result
+
+    async def aresolve(self, query: str, on_event=None):
+        with tracer.span("app.resolve", query_chars=len(query)) as span:
+            if self.semantic_cache is None:
+                return await self.agent.arun(query, on_event)
+            loop = asyncio.get_running_loop()
+            with tracer.span("semantic_cache.embed"):
+                embedding = await loop.run_in_executor(None, self.semantic_cache.embed, query)
+            with tracer.span("semantic_cache.lookup"):
+                entry = self.semantic_cache.lookup(embedding, query)
+            if entry is not None:
+                if self.semantic_cache.is_fresh(entry):
+                    span.set(semantic_cache="hit")
+                    if on_event is not None:
+                        on_event("status", {"message": "Answered from cache"})
+                    return entry.result
+                span.set(semantic_cache="stale")
+                result = await self.agent.aexecute(entry.action, entry.params, entry.raw_output, on_event)
+                if result.action != "error":
+                    self.semantic_cache.refresh(entry, result)
+                return result
+            span.set(semantic_cache="miss")
+            result = await self.agent.arun(query, on_event)
+            if result.action != "error":
+                self.semantic_cache.add(embedding, query, result)
+            return result
+
+    async def aclose(self):
+        self.executor.shutdown(wait=False)
+        self.model.shutdown()
+        await self.here_api.aclose()
+        tracer.flush()
+
+    def _render_event(self, event: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        if event == "tool_result":
+            data = dict(data, result=_render_tool_result(data["result"]))
+        return {"event": event, "data": data}
+
+    def _format_result(self, result):
         if result.action == "geocode" and result.geocoding_result:
             return f"Geocoding result for '{result.geocoding_result.address}':\n" \
                    f"Latitude: {result.geocoding_result.latitude}\n" \
@@ -39,11 +272,48 @@ class NavigationApp:
                    f"Raw response: {result.raw_response}"
         elif result.action == "discover" and result.discover_result:
             return f"Discover results for '{result.discover_result.query}':\n" \
-                   f"{result.discover_result.results}\n\n" \
+                   f"{_render_places(result.discover_result.results)}\n\n" \
                    f"Raw response: {result.raw_response}"
         elif result.action == "autosuggest" and result.autosuggest_result:
             return f"Autosuggest results for '{result.autosuggest_result.query}':\n" \
-                   f"{result.autosuggest_result.suggestions}\n\n" \
+                   f"{_render_places(result.autosuggest_result.suggestions)}\n\n" \
+                   f"Raw response: {result.raw_response}"
+        elif result.action == "plan" and result.plan_result:
+            return f"Plan results:\n" \
+                   f"{_render_tool_result(result.plan_result)}\n\n" \
                    f"Raw response: {result.raw_response}"
         else:
             return f"Error or unexpected result: {result.raw_response}"
+
+
+def _render_places(places) -> str:
+    lines = []
+    for place in places:
+        if place.latitude is None:
+            lines.append(f"- {place.title}")
+        else:
+            lines.append(f"- {place.title}: Latitude {place.latitude}, Longitude {place.longitude}")
+    return "\n".join(lines)
+
+
+def _render_tool_result(result) -> str:
+    if isinstance(result, GeocodingResult):
+        return f"Coordinates for '{result.address}': Latitude {result.latitude}, Longitude {result.longitude}"
+    if isinstance(result, RoutingResult):
+        return f"Route from {result.origin} to {result.destination}: " \
+               f"Distance {result.distance_km:.2f} km, Duration {result.duration_hours:.2f} hours"
+    if isinstance(result, DiscoverResult):
+        if not result.results:
+            return f"Unable to find places matching: {result.query}"
+        return f"Discovered places for '{result.query}':\n{_render_places(result.results)}"
+    if isinstance(result, AutosuggestResult):
+        if not result.suggestions:
+            return f"Unable to generate suggestions for: {result.query}"
+        return f"Suggestions for '{result.query}':\n{_render_places(result.suggestions)}"
+    if isinstance(result, PlanResult):
+        return "\n".join(
+            f"[{step.id}] {step.action} ({step.status}): "
+            f"{_render_tool_result(step.output) if step.status == 'ok' else step.message}"
+            for step in result.steps
+        )
+    return str(result)
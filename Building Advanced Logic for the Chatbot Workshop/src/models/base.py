@@ -8,4 +8,13 @@ class BaseModel(ABC):
 
     @abstractmethod
     def get_llm(self) -> Any:
+        pass
+
+    def cache_prefix(self, prefix: str) -> None:
+        pass
+
+    def set_output_grammar(self, grammar: str) -> None:
+        pass
+
+    def warm_up(self, prompt: str) -> None:
         pass
\ No newline at end of file
@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Any, NamedTuple, Optional, Tuple, Union
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from utils.metrics import REGISTRY
+from utils.tracing import tracer
+
+_TOKENS = REGISTRY.counter("llm_tokens_total", "Prompt and completion tokens processed by the LLM.", ("type",))
+_PREFILL_SECONDS = REGISTRY.histogram("llm_prefill_seconds", "Time to the first generated token.")
+_DECODE_SECONDS = REGISTRY.histogram("llm_decode_seconds", "Time from the first to the last generated token.")
+_TOKENS_PER_SECOND = REGISTRY.histogram("llm_decode_tokens_per_second", "Decode speed per generation.",
+                                        buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+
+class Generation(NamedTuple):
+    """A completion plus the timings a backend measured while producing it."""
+    text: str
+    prompt_tokens: int
+    completion_tokens: int
+    prefill_s: float
+    decode_s: float
+
+    @property
+    def tokens_per_second(self) -> float:
+        # The first token comes out of prefill, the rest out of decode.
+        if self.completion_tokens < 2 or self.decode_s <= 0:
+            return 0.0
+        return (self.completion_tokens - 1) / self.decode_s
+
+
+class TokenCallbackHandler(BaseCallbackHandler):
+    def __init__(self, on_token: Callable[[str], None]):
+        self.on_token = on_token
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.on_token(token)
+
+
+class _Request:
+    """A queued prompt and every caller waiting on it."""
+    __slots__ = ("prompt", "waiters")
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.waiters: List[Tuple[Future, Optional[Callable[[str], None]]]] = []
+
+
+class BatchingScheduler:
+    """Continuous batching over ``n_slots`` generation slots.
+
+    Each prompt starts on the first slot that frees up and its callers'
+    futures resolve as soon as that one generation finishes, independent of
+    whatever else is running; a failing generation only fails its own
+    callers. ``generate_fn(prompt, on_token)`` runs on the slot's thread and
+    returns text or a ``Generation``; ``on_token`` reports tokens to every
+    caller of the prompt.
+    """
+
+    def __init__(self, generate_fn: Callable[[str, Optional[Callable[[str], None]]], Union[str, Generation]],
+                 n_slots: int = 1):
+        self.generate_fn = generate_fn
+        self.n_slots = n_slots
+        self._condition = threading.Condition()
+        self._queued: "OrderedDict[str, _Request]" = OrderedDict()
+        self._stopped = False
+        self._running = 0
+        self._prompts = 0
+        self._generations = 0
+        self._deduplicated = 0
+        self._threads = [threading.Thread(target=self._loop, name=f"llm-slot-{i}", daemon=True)
+                         for i in range(n_slots)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> Future:
+        future = Future()
+        with self._condition:
+            self._prompts += 1
+            # Identical prompts still waiting for a slot (client retries,
+            # repeated queries) are generated once. A prompt already running
+            # is not joined, as its earlier tokens could not be replayed.
+            request = self._queued.get(prompt)
+            if request is None:
+                request = self._queued[prompt] = _Request(prompt)
+                self._condition.notify()
+            else:
+                self._deduplicated += 1
+            request.waiters.append((future, on_token))
+        return future
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queued or self._stopped)
+                if not self._queued:
+                    return
+                _, request = self._queued.popitem(last=False)
+                self._running += 1
+            try:
+                self._generate(request)
+            finally:
+                with self._condition:
+                    self._running -= 1
+
+    def _generate(self, request: _Request):
+        waiters = [(future, on_token) for future, on_token in request.waiters
+                   if future.set_running_or_notify_cancel()]
+        if not waiters:
+            return
+        with self._condition:
+            self._generations += 1
+        try:
+            completion = self.generate_fn(request.prompt,
+                                          _fan_out([on_token for _, on_token in waiters if on_token is not None]))
+        except Exception as e:
+            for future, _ in waiters:
+                future.set_exception(e)
+            return
+        if isinstance(completion, Generation):
+            _observe(completion)
+        for future, _ in waiters:
+            future.set_result(completion)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "n_slots": self.n_slots,
+                "queued": len(self._queued),
+                "running": self._running,
+                "prompts": self._prompts,
+                "generations": self._generations,
+                "deduplicated": self._deduplicated,
+            }
+
+    def shutdown(self):
+        """Stops once the queued prompts have been generated."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+def _fan_out(callbacks: List[Callable[[str], None]]) -> Optional[Callable[[str], None]]:
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def on_token(token: str):
+        for callback in callbacks:
+            callback(token)
+    return on_token
+
+
+class BatchedLLM:
+    """Drop-in for the LangChain LLM handed to NavigationAgent: every call is
+    routed through the scheduler so concurrent callers share the slots."""
+
+    def __init__(self, scheduler: BatchingScheduler):
+        self.scheduler = scheduler
+
+    def invoke(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        with tracer.span("llm.generate", prompt_chars=len(prompt)) as span:
+            completion = self.scheduler.submit(prompt, on_token).result()
+            if not isinstance(completion, Generation):
+                return completion
+            span.set(prompt_tokens=completion.prompt_tokens, completion_tokens=completion.completion_tokens,
+                     prefill_ms=round(completion.prefill_s * 1000, 3), decode_ms=round(completion.decode_s * 1000, 3),
+                     tokens_per_second=round(completion.tokens_per_second, 2))
+            return completion.text
+
+    def __call__(self, prompt: str) -> str:
+        return self.invoke(prompt)
+
+
+def _observe(generation: Generation):
+    _TOKENS.inc(generation.prompt_tokens, type="prompt")
+    _TOKENS.inc(generation.completion_tokens, type="completion")
+    _PREFILL_SECONDS.observe(generation.prefill_s)
+    _DECODE_SECONDS.observe(generation.decode_s)
+    if generation.tokens_per_second:
+        _TOKENS_PER_SECOND.observe(generation.tokens_per_second)
+
+
+if __name__ == "__main__":
+    import argparse
+    from concurrent.futures import ThreadPoolExecutor
+    from models.mistral import MistralModel
+
+    parser = argparse.ArgumentParser(description="Compare generation throughput on one slot and on several.")
+    parser.add_argument("model_path")
+    parser.add_argument("--prompts", type=int, default=8)
+    parser.add_argument("--slots", type=int, default=2)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    prompts = [f"Name a city in country number {i}:" for i in range(args.prompts)]
+    for slots in (1, args.slots):
+        model = MistralModel(args.model_path, n_slots=slots, max_tokens=args.max_tokens)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+            list(pool.map(model.generate, prompts))
+        elapsed = time.perf_counter() - started
+        print(f"slots={slots}: {len(prompts) / elapsed:.2f} prompts/s {model.scheduler.stats()}")
+        model.shutdown()
@@ -0,0 +1,50 @@
+import time
+from typing import Any, Callable, Optional
+
+from models.base import BaseModel
+from models.batching import BatchingScheduler, BatchedLLM, Generation, TokenCallbackHandler
+
+
+class HostedModel(BaseModel):
+    """Any other LangChain LLM (Ollama, Bedrock, GPT4All) behind the same
+    batching scheduler as MistralModel; ``n_slots`` is how many prompts are
+    sent to it at once.
+
+    There is no grammar or prefix cache support, so tool selections are
+    generated as free text.
+    """
+
+    def __init__(self, llm: Any, n_slots: int = 1):
+        self.model = llm
+        self.prefix_cache = None
+        self.scheduler = BatchingScheduler(self._generate_on_slot, n_slots=n_slots)
+        self.llm = BatchedLLM(self.scheduler)
+
+    def _generate_on_slot(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> Generation:
+        started = time.perf_counter()
+        first_token_at = None
+        n_tokens = 0
+
+        def timed(token: str):
+            nonlocal first_token_at, n_tokens
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            n_tokens += 1
+            if on_token is not None:
+                on_token(token)
+
+        text = self.model(prompt, callbacks=[TokenCallbackHandler(timed)])
+        finished = time.perf_counter()
+        first_token_at = first_token_at or finished
+        # Token counts are estimated for backends that do not stream.
+        return Generation(text, len(prompt) // 4, n_tokens or len(text) // 4,
+                          first_token_at - started, finished - first_token_at)
+
+    def generate(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        return self.llm.invoke(prompt, on_token)
+
+    def get_llm(self) -> BatchedLLM:
+        return self.llm
+
+    def shutdown(self):
+        self.scheduler.shutdown()
@@ -1,41 +1,165 @@
 import os
+import queue
+import time
+from typing import Callable, Dict, Optional
 
 from huggingface_hub import hf_hub_download
-from langchain.llms import LlamaCpp, Bedrock, gpt4all, Ollama
+from llama_cpp import LlamaGrammar
+from langchain.llms import LlamaCpp
 from langchain.callbacks.manager import CallbackManager
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from models.base import BaseModel
+from models.batching import BatchingScheduler, BatchedLLM, Generation, TokenCallbackHandler
+from models.prefix_cache import PrefixCache
+from utils.config import Config
 
 
 class MistralModel(BaseModel):
-    def __init__(self, model_path: str):
-        callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
-        self.model = LlamaCpp(
-            model_path=model_path,
-            temperature=0.3,
-            max_tokens=8000,
-            n_ctx=8048,
-            callback_manager=callback_manager,
-            
-            n_gpu_layers=35,
-            verbose=True,
-        )
+    def __init__(
+        self,
+        model_path: str,
+        n_slots: int = Config.LLM_SLOTS,
+        max_tokens: int = Config.LLM_MAX_TOKENS,
+        n_ctx: int = Config.LLM_CONTEXT_LENGTH,
+        n_threads: int = Config.LLM_THREADS,
+        n_batch: int = Config.LLM_PROMPT_BATCH_SIZE,
+        n_gpu_layers: int = Config.LLM_GPU_LAYERS,
+        quantization: str = Config.LLM_QUANTIZATION,
+    ):
+        model_path = self._ensure_model(model_path, quantization)
+        self.model_path = model_path
+        self.n_ctx = n_ctx
+        self.prefix_cache = None
+        self.temperature = 0.3
+        self._grammars: Dict[int, LlamaGrammar] = {}
+        callback_manager = CallbackManager([StreamingStdOutCallbackHandler()] if Config.LLM_VERBOSE else [])
+        # Each slot is its own llama.cpp context; the GGUF weights are mmap'd
+        # so the slots share the CPU-resident ones and only the KV caches are
+        # duplicated, but each slot uploads its own copy of the n_gpu_layers
+        # offloaded to the GPU. The mapping is backed by the page cache, so
+        # uvicorn workers loading the same file share those pages too
+        # (use_mlock would pin a private copy).
+        n_threads = n_threads or max(1, (os.cpu_count() or 1) // n_slots)
+        self.slots = [
+            LlamaCpp(
+                model_path=model_path,
+                temperature=self.temperature,
+                max_tokens=max_tokens,
+                n_ctx=self.n_ctx,
+                n_threads=n_threads,
+                n_batch=n_batch,
+                use_mmap=True,
+                use_mlock=False,
+                callback_manager=callback_manager,
+
+                n_gpu_layers=n_gpu_layers,
+                verbose=Config.LLM_VERBOSE,
+            )
+            for _ in range(n_slots)
+        ]
+        self.model = self.slots[0]
+        self._free_slots: "queue.Queue[LlamaCpp]" = queue.Queue()
+        for slot in self.slots:
+            self._free_slots.put(slot)
+
+        self.scheduler = BatchingScheduler(self._generate_on_slot, n_slots=n_slots)
+        self.llm = BatchedLLM(self.scheduler)
 
-    def _ensure_model(self, model_path: str) -> str:
-        if os.path.exists(model_path):
+    def _ensure_model(self, model_path: str, quantization: str = "") -> str:
+        # An explicit quantization always comes from the Hugging Face repo
+        # (or its local cache); otherwise MODEL_PATH is used when it exists.
+        if not quantization and os.path.exists(model_path):
             return model_path
 
-        print(f"Model not found at {model_path}. Downloading from Hugging Face...")
-        repo_id = "MaziyarPanahi/Mistral-7B-Instruct-v0.3-GGUF"
-        filename = "Mistral-7B-Instruct-v0.3.Q8_0.gguf"
+        quantization = quantization or "Q8_0"
+        print(f"Model not found at {model_path}. Downloading {quantization} from Hugging Face...")
+        repo_id = Config.LLM_HF_REPO
+        filename = f"Mistral-7B-Instruct-v0.3.{quantization}.gguf"
 
         download_path = hf_hub_download(repo_id=repo_id, filename=filename)
         print(f"Model downloaded to {download_path}")
 
         return download_path
 
-    def generate(self, prompt: str) -> str:
-        return self.model(prompt)
+    def cache_prefix(self, prefix: str):
+        self.prefix_cache = PrefixCache(
+            prefix,
+            cache_dir=Config.LLM_PREFIX_CACHE_DIR or None,
+            key=f"{self.model_path}:{self.n_ctx}",
+        )
+        slots = [self._free_slots.get() for _ in self.slots]
+        try:
+            for slot in slots:
+                self.prefix_cache.warm(slot.client)
+        finally:
+            for slot in slots:
+                self._free_slots.put(slot)
+
+    def warm_up(self, prompt: str):
+        # A short generation on every slot faults in the mmap'd weights and
+        # allocates each context's compute buffers ahead of the first query.
+        slots = [self._free_slots.get() for _ in self.slots]
+        try:
+            for slot in slots:
+                if self.prefix_cache is not None:
+                    self.prefix_cache.prepare(slot.client, prompt)
+                slot.client(prompt, max_tokens=Config.WARMUP_MAX_TOKENS, temperature=self.temperature)
+        finally:
+            for slot in slots:
+                self._free_slots.put(slot)
+
+    def set_output_grammar(self, grammar: str):
+        # Grammar state advances while sampling, so each slot gets its own copy.
+        self._grammars = {
+            id(slot): LlamaGrammar.from_string(grammar, verbose=False)
+            for slot in self.slots
+        }
+
+    def _generate_on_slot(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> Generation:
+        # Always streamed, so the first token separates prefill from decode.
+        started = time.perf_counter()
+        first_token_at = None
+        n_tokens = 0
+
+        def timed(token: str):
+            nonlocal first_token_at, n_tokens
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            n_tokens += 1
+            if on_token is not None:
+                on_token(token)
+
+        slot = self._free_slots.get()
+        try:
+            if self.prefix_cache is not None:
+                self.prefix_cache.prepare(slot.client, prompt)
+            if self._grammars:
+                output = slot.client(
+                    prompt,
+                    grammar=self._grammars[id(slot)],
+                    max_tokens=Config.LLM_CONSTRAINED_MAX_TOKENS,
+                    temperature=self.temperature,
+                    stream=True,
+                )
+                text = ""
+                for chunk in output:
+                    token = chunk["choices"][0]["text"]
+                    text += token
+                    timed(token)
+            else:
+                text = slot(prompt, callbacks=[TokenCallbackHandler(timed)])
+            finished = time.perf_counter()
+            prompt_tokens = len(slot.client.tokenize(prompt.encode("utf-8")))
+        finally:
+            self._free_slots.put(slot)
+        first_token_at = first_token_at or finished
+        return Generation(text, prompt_tokens, n_tokens, first_token_at - started, finished - first_token_at)
+
+    def generate(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        return self.llm.invoke(prompt, on_token)
+
+    def get_llm(self) -> BatchedLLM:
+        return self.llm
 
-    def get_llm(self) -> LlamaCpp:
-        return self.model
+    def shutdown(self):
+        self.scheduler.shutdown()
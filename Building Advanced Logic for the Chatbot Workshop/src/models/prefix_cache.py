@@ -0,0 +1,77 @@
+import hashlib
+import os
+import pickle
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class PrefixCache:
+    """Keeps the llama.cpp KV state for a static prompt prefix.
+
+    The prefix is evaluated once (or loaded from ``cache_dir``) and restored
+    into a context before a prompt that starts with it. llama.cpp's own
+    prefix matching then only evaluates the per-query suffix.
+    """
+
+    def __init__(self, prefix: str, cache_dir: Optional[str] = None, key: str = ""):
+        self.prefix = prefix
+        self.cache_dir = cache_dir
+        self.key = hashlib.sha256((key + prefix).encode("utf-8")).hexdigest()[:16]
+        self._tokens: Optional[List[int]] = None
+        self._state = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._restores = 0
+
+    def _path(self) -> str:
+        return os.path.join(self.cache_dir, f"prefix-{self.key}.state")
+
+    def _load(self):
+        if not self.cache_dir or not os.path.exists(self._path()):
+            return None
+        with open(self._path(), "rb") as f:
+            return pickle.load(f)
+
+    def _save(self):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._path() + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self._state, f)
+        os.replace(tmp_path, self._path())
+
+    def warm(self, client: Any):
+        with self._lock:
+            self._tokens = client.tokenize(self.prefix.encode("utf-8"))
+            if self._state is None:
+                self._state = self._load()
+            if self._state is None:
+                client.reset()
+                client.eval(self._tokens)
+                self._state = client.save_state()
+                self._save()
+            else:
+                client.load_state(self._state)
+
+    def prepare(self, client: Any, prompt: str):
+        if self._state is None or not prompt.startswith(self.prefix):
+            return
+        n_tokens = len(self._tokens)
+        if client.n_tokens >= n_tokens and client.input_ids[:n_tokens].tolist() == self._tokens:
+            with self._lock:
+                self._hits += 1
+            return
+        client.load_state(self._state)
+        with self._lock:
+            self._restores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prefix_tokens": len(self._tokens) if self._tokens else 0,
+                "warm": self._state is not None,
+                "persistent": bool(self.cache_dir),
+                "hits": self._hits,
+                "restores": self._restores,
+            }
@@ -0,0 +1,229 @@
+import threading
+from typing import Callable, Dict, NamedTuple, Optional
+
+from models.base import BaseModel
+from utils.config import Config
+
+
+class ModelSpec(NamedTuple):
+    """Everything needed to build a model backend; ``from_config`` fills it
+    from the environment and ``_replace`` derives variants."""
+    backend: str
+    model_path: str
+    quantization: str = ""
+    n_ctx: int = 8048
+    n_threads: int = 0
+    n_batch: int = 512
+    n_gpu_layers: int = 0
+    n_slots: int = 1
+
+    @classmethod
+    def from_config(cls, model_path: str = Config.MODEL_PATH, **overrides) -> "ModelSpec":
+        spec = cls(
+            backend=Config.LLM_BACKEND,
+            model_path=model_path,
+            quantization=Config.LLM_QUANTIZATION,
+            n_ctx=Config.LLM_CONTEXT_LENGTH,
+            n_threads=Config.LLM_THREADS,
+            n_batch=Config.LLM_PROMPT_BATCH_SIZE,
+            n_gpu_layers=Config.LLM_GPU_LAYERS,
+            n_slots=Config.LLM_SLOTS,
+        )
+        return spec._replace(**overrides)
+
+
+MODEL_BACKENDS: Dict[str, Callable[[ModelSpec], BaseModel]] = {}
+
+
+def register_backend(name: str):
+    def register(factory: Callable[[ModelSpec], BaseModel]):
+        MODEL_BACKENDS[name] = factory
+        return factory
+    return register
+
+
+def create_model(spec: ModelSpec) -> BaseModel:
+    if spec.backend not in MODEL_BACKENDS:
+        raise ValueError(f"Unknown model backend: {spec.backend} (available: {', '.join(sorted(MODEL_BACKENDS))})")
+    return MODEL_BACKENDS[spec.backend](spec)
+
+
+# Backends import their runtime lazily, so e.g. the stub works without
+# llama-cpp-python installed.
+@register_backend("llama")
+def _llama(spec: ModelSpec) -> BaseModel:
+    from models.mistral import MistralModel
+
+    return MistralModel(spec.model_path, n_slots=spec.n_slots, n_ctx=spec.n_ctx, n_threads=spec.n_threads,
+                        n_batch=spec.n_batch, n_gpu_layers=spec.n_gpu_layers, quantization=spec.quantization)
+
+
+def _langchain_llm(name: str):
+    import langchain.llms
+
+    # Ollama and Bedrock are newer than the langchain in requirements.txt.
+    if not hasattr(langchain.llms, name):
+        raise ImportError(f"langchain {langchain.__version__} has no {name} LLM; install a newer langchain")
+    return getattr(langchain.llms, name)
+
+
+@register_backend("ollama")
+def _ollama(spec: ModelSpec) -> BaseModel:
+    from models.hosted import HostedModel
+
+    llm = _langchain_llm("Ollama")(base_url=Config.OLLAMA_BASE_URL, model=Config.OLLAMA_MODEL, temperature=0.3)
+    return HostedModel(llm, n_slots=spec.n_slots)
+
+
+@register_backend("bedrock")
+def _bedrock(spec: ModelSpec) -> BaseModel:
+    from models.hosted import HostedModel
+
+    llm = _langchain_llm("Bedrock")(model_id=Config.BEDROCK_MODEL_ID, region_name=Config.AWS_REGION, streaming=True,
+                                    model_kwargs={"temperature": 0.3})
+    return HostedModel(llm, n_slots=spec.n_slots)
+
+
+@register_backend("gpt4all")
+def _gpt4all(spec: ModelSpec) -> BaseModel:
+    from models.hosted import HostedModel
+
+    # One in-process model instance, which is not safe to call concurrently.
+    return HostedModel(_langchain_llm("GPT4All")(model=spec.model_path, temp=0.3, streaming=True), n_slots=1)
+
+
+@register_backend("stub")
+def _stub(spec: ModelSpec) -> BaseModel:
+    from models.stub import StubModel
+
+    return StubModel(spec.model_path, n_slots=spec.n_slots)
+
+
+class HotSwapLLM:
+    """The LLM handed to NavigationAgent, delegating to whichever model is
+    current. ``swap`` installs a new model and waits for calls still running
+    on the old one, so the caller can shut it down safely."""
+
+    def __init__(self, model: BaseModel):
+        self.model = model
+        self._condition = threading.Condition()
+        self._running: Dict[int, int] = {}
+
+    def invoke(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        with self._condition:
+            model = self.model
+            self._running[id(model)] = self._running.get(id(model), 0) + 1
+        try:
+            return model.get_llm().invoke(prompt, on_token)
+        finally:
+            with self._condition:
+                self._running[id(model)] -= 1
+                self._condition.notify_all()
+
+    def __call__(self, prompt: str) -> str:
+        return self.invoke(prompt)
+
+    def swap(self, model: BaseModel, drain_timeout: float = 60.0) -> BaseModel:
+        with self._condition:
+            old, self.model = self.model, model
+            self._condition.wait_for(lambda: not self._running.get(id(old)), timeout=drain_timeout)
+            self._running.pop(id(old), None)
+        return old
+
+
+def parse_spec(text: str, base: ModelSpec) -> ModelSpec:
+    """Reads "llama:Q4_K_M,n_threads=8" as ``base`` with that backend,
+    quantization and overrides."""
+    head, *overrides = text.split(",")
+    backend, _, quantization = head.partition(":")
+    fields = {"backend": backend, "quantization": quantization or base.quantization}
+    for override in overrides:
+        key, _, value = override.partition("=")
+        if key not in ModelSpec._fields:
+            raise ValueError(f"Unknown model setting: {key}")
+        fields[key] = int(value) if isinstance(getattr(base, key), int) else value
+    return base._replace(**fields)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    import numpy as np
+
+    from agents.navigation import NavigationAgent
+    from utils.grammar import NAVIGATION_GRAMMAR
+
+    parser = argparse.ArgumentParser(description="Benchmark model backends side by side on the same queries.")
+    parser.add_argument("queries", help="Text file with one query per line, or JSON lines with 'query' and "
+                                        "optionally the expected 'action' and 'params'")
+    parser.add_argument("--model", action="append", required=True, dest="models",
+                        help="backend[:quantization][,setting=value...], e.g. llama:Q4_K_M,n_threads=8; repeatable")
+    parser.add_argument("-o", "--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    with open(args.queries) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    cases = [json.loads(line) if line.startswith("{") else {"query": line} for line in lines]
+    agent = NavigationAgent(None, None, None, None, None)
+
+    def normalized(params):
+        return {key: " ".join(str(value).lower().split()) for key, value in (params or {}).items()}
+
+    results = []
+    reference = None
+    for text in args.models:
+        spec = parse_spec(text, ModelSpec.from_config())
+        started = time.perf_counter()
+        model = create_model(spec)
+        model.cache_prefix(agent.prompt_prefix)
+        if Config.LLM_CONSTRAINED_DECODING:
+            model.set_output_grammar(NAVIGATION_GRAMMAR)
+        model.warm_up(agent.prompt.format(query=Config.WARMUP_QUERY))
+        load_s = time.perf_counter() - started
+
+        latencies, generations, decisions = [], [], []
+        for case in cases:
+            started = time.perf_counter()
+            generation = model.scheduler.submit(agent.prompt.format(query=case["query"])).result()
+            latencies.append(time.perf_counter() - started)
+            generations.append(generation)
+            try:
+                decisions.append(agent._parse_raw_output(generation.text))
+            except ValueError:
+                decisions.append(None)
+        model.shutdown()
+
+        # Without expected answers, the first model is the reference.
+        if reference is None:
+            reference = [(case["action"], case.get("params")) if "action" in case else decision
+                         for case, decision in zip(cases, decisions)]
+        same_action = [expected is not None and decision is not None and decision[0] == expected[0]
+                       for decision, expected in zip(decisions, reference)]
+        same_params = [same and normalized(decision[1]) == normalized(expected[1])
+                       for same, decision, expected in zip(same_action, decisions, reference)]
+        latencies_ms = np.array(latencies) * 1000
+        speeds = [generation.tokens_per_second for generation in generations if generation.tokens_per_second]
+        results.append({
+            "model": text,
+            "spec": spec._asdict(),
+            "load_s": round(load_s, 2),
+            "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+            "prefill_ms": round(float(np.mean([generation.prefill_s for generation in generations])) * 1000, 1),
+            "decode_tokens_per_s": round(float(np.mean(speeds)), 1) if speeds else 0.0,
+            "parse_errors": sum(decision is None for decision in decisions),
+            "action_accuracy": round(sum(same_action) / len(cases), 3),
+            "params_accuracy": round(sum(same_params) / len(cases), 3),
+        })
+        print(json.dumps(results[-1]))
+
+    print(f"\n{'model':28} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'tok/s':>7} {'action':>7} {'params':>7}")
+    for result in results:
+        print(f"{result['model']:28} {result['load_s']:>7.1f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['decode_tokens_per_s']:>7.1f} {result['action_accuracy']:>7.1%} "
+              f"{result['params_accuracy']:>7.1%}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,62 @@
+import json
+import time
+from typing import Callable, Dict, Optional
+
+from models.base import BaseModel
+from models.batching import BatchingScheduler, BatchedLLM, Generation
+from utils.config import Config
+
+
+class StubModel(BaseModel):
+    """Offline stand-in for MistralModel used by the load tests.
+
+    Answers each prompt with canned YAML after ``delay`` seconds, spread over
+    the streamed tokens. ``responses`` maps user queries to their YAML;
+    unknown queries are geocoded as-is. Generation goes through the same
+    batching scheduler as the real model.
+    """
+
+    def __init__(
+        self,
+        model_path: str = "",
+        responses_path: str = Config.STUB_LLM_RESPONSES,
+        delay: float = Config.STUB_LLM_DELAY_MS / 1000,
+        n_slots: int = Config.LLM_SLOTS,
+    ):
+        self.delay = delay
+        self.prefix_cache = None
+        self.responses: Dict[str, str] = {}
+        if responses_path:
+            with open(responses_path) as f:
+                self.responses = json.load(f)
+        self.scheduler = BatchingScheduler(self._generate_on_slot, n_slots=n_slots)
+        self.llm = BatchedLLM(self.scheduler)
+
+    def respond(self, prompt: str) -> str:
+        query = prompt.rsplit("User query: ", 1)[-1].rsplit("\n\nResponse:", 1)[0].strip()
+        if query in self.responses:
+            return self.responses[query]
+        return f"action: geocode\nparams:\n    address: {json.dumps(query)}\n"
+
+    def _generate_on_slot(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> Generation:
+        started = time.perf_counter()
+        text = self.respond(prompt)
+        tokens = text.split(" ")
+        # A tenth of the delay stands in for prefill, the rest for decode.
+        time.sleep(self.delay / 10)
+        first_token_at = time.perf_counter()
+        for i, token in enumerate(tokens):
+            time.sleep(self.delay * 0.9 / len(tokens))
+            if on_token is not None:
+                on_token(token if i == len(tokens) - 1 else token + " ")
+        finished = time.perf_counter()
+        return Generation(text, len(prompt) // 4, len(tokens), first_token_at - started, finished - first_token_at)
+
+    def generate(self, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        return self.llm.invoke(prompt, on_token)
+
+    def get_llm(self) -> BatchedLLM:
+        return self.llm
+
+    def shutdown(self):
+        self.scheduler.shutdown()
@@ -32,9 +32,25 @@ def main():
         st.session_state.messages.append({"role": "user", "content": prompt})
 
         try:
-            response = app.process_query(prompt)
             with st.chat_message("assistant"):
-                st.markdown(response)
+                status = st.empty()
+                output = st.empty()
+                tokens = ""
+                response = ""
+                for event in app.stream_query(prompt):
+                    if event["event"] == "token":
+                        tokens += event["data"]["text"]
+                        output.code(tokens, language="yaml")
+                    elif event["event"] == "status":
+                        status.info(event["data"]["message"])
+                    elif event["event"] == "tool_result":
+                        output.markdown(event["data"]["result"])
+                    elif event["event"] == "result":
+                        response = event["data"]["response"]
+                    elif event["event"] == "error":
+                        raise RuntimeError(event["data"]["message"])
+                status.empty()
+                output.markdown(response)
             st.session_state.messages.append({"role": "assistant", "content": response})
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
@@ -1,7 +1,10 @@
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Type
 from api.here import HereAPI
+from tools.results import PlaceList, place_from_item
+from utils.config import Config
+from utils.tracing import tracer
 
 
 class AutosuggestInput(BaseModel):
@@ -12,28 +15,26 @@ class AutosuggestInput(BaseModel):
 class AutosuggestTool(BaseTool):
     name = "autosuggest"
     description = "Useful for suggesting places or addresses based on incomplete input."
-    args_schema = AutosuggestInput
+    args_schema: Type[BaseModel] = AutosuggestInput
     api: HereAPI
+    debug: bool = Config.DEBUG
 
-    def _run(self, tool_input: Dict[str, Any]) -> str:
+    def _run(self, tool_input: Dict[str, Any]) -> PlaceList:
         query = tool_input['q']
         at = tool_input.get('at')
 
-        params = {
-            "q": query,
-            "limit": 5
-        }
-        if at:
-            params["at"] = at
+        with tracer.span("tool.autosuggest", q=query, at=at):
+            result = self.api.autosuggest(query, at=at, limit=5)
+            return self._result(query, result)
 
-        result = self.api.autosuggest(params)
+    async def _arun(self, tool_input: Dict[str, Any]) -> PlaceList:
+        query = tool_input['q']
+        at = tool_input.get('at')
 
-        if result.get('items'):
-            output = f"Suggestions for '{query}':\n"
-            for item in result['items']:
-                output += f"- {item['title']}\n"
-            return output
-        return f"Unable to generate suggestions for: {query}"
+        with tracer.span("tool.autosuggest", q=query, at=at):
+            result = await self.api.aautosuggest(query, at=at, limit=5)
+            return self._result(query, result)
 
-    async def _arun(self, tool_input: Dict[str, Any]) -> str:
-        return self._run(tool_input)
\ No newline at end of file
+    def _result(self, query: str, result: Dict[str, Any]) -> PlaceList:
+        places = tuple(place_from_item(item) for item in result.get('items', []))
+        return PlaceList(query, places, result if self.debug else None)
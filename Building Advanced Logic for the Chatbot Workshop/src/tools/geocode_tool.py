@@ -1,8 +1,15 @@
+import logging
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Type
 from api.here import HereAPI
+from tools.results import GeocodeHit
+from utils.config import Config
+from utils.tracing import tracer
 from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
 class GeocodeInput(BaseModel):
     address: str = Field(..., description="The address to geocode")
 
@@ -12,20 +19,27 @@ class GeocodeInput(BaseModel):
 class GeocodeTool(BaseTool):
     name = "geocode"
     description = "Useful for converting an address into geographic coordinates (latitude and longitude)."
-    args_schema = GeocodeInput
+    args_schema: Type[BaseModel] = GeocodeInput
     api: HereAPI
+    debug: bool = Config.DEBUG
+
+    def _run(self, tool_input: Dict[str, Any]) -> GeocodeHit:
+        address = tool_input
+        with tracer.span("tool.geocode", address=address):
+            result = self.api.geocode(address)
+            logger.debug("Geocoded %r: %s", address, result)
+            return self._result(address, result)
 
-    def _run(self, tool_input: Dict[str, Any]) -> str:
-        print("Tool input is ", tool_input)
-        # address = tool_input['address']
-        print("Address is ", tool_input)
+    async def _arun(self, tool_input: Dict[str, Any]) -> GeocodeHit:
         address = tool_input
-        result = self.api.geocode(address)
-        print("Geocode result is ", result)
-        if result.get('items'):
-            item = result['items'][0]
-            return f"Coordinates for '{address}': Latitude {item['position']['lat']}, Longitude {item['position']['lng']}"
-        return f"Unable to geocode the address: {address}"
+        with tracer.span("tool.geocode", address=address):
+            result = await self.api.ageocode(address)
+            logger.debug("Geocoded %r: %s", address, result)
+            return self._result(address, result)
 
-    async def _arun(self, tool_input: Dict[str, Any]) -> str:
-        return self._run(tool_input)
\ No newline at end of file
+    def _result(self, address: str, result: Dict[str, Any]) -> GeocodeHit:
+        if not result.get('items'):
+            raise ValueError(f"Unable to geocode the address: {address}")
+        item = result['items'][0]
+        return GeocodeHit(address, item['title'], item['position']['lat'], item['position']['lng'],
+                          result if self.debug else None)
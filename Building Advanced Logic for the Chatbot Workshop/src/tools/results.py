@@ -0,0 +1,49 @@
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+# Compact records returned by the tools. ``raw`` holds the HERE response only
+# when the tool runs with debug enabled.
+
+
+class GeocodeHit(NamedTuple):
+    address: str
+    title: str
+    lat: float
+    lng: float
+    raw: Optional[Dict[str, Any]] = None
+
+    @property
+    def position(self) -> str:
+        return f"{self.lat},{self.lng}"
+
+
+class Route(NamedTuple):
+    origin: str
+    destination: str
+    length_m: float
+    duration_s: float
+    raw: Optional[Dict[str, Any]] = None
+
+
+class Place(NamedTuple):
+    title: str
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+
+    @property
+    def position(self) -> Optional[str]:
+        if self.lat is None or self.lng is None:
+            return None
+        return f"{self.lat},{self.lng}"
+
+
+class PlaceList(NamedTuple):
+    query: str
+    places: Tuple[Place, ...]
+    raw: Optional[Dict[str, Any]] = None
+
+
+def place_from_item(item: Dict[str, Any]) -> Place:
+    position = item.get('position')
+    if position is None:
+        return Place(item['title'])
+    return Place(item['title'], position['lat'], position['lng'])
@@ -1,36 +1,85 @@
+import asyncio
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Type
-from api.here import HereAPI
-from typing import Dict, Any
+from api.here import HereAPI, RouteMatrix
+from tools.results import Route
+from utils.config import Config
+from utils.tracing import propagate, tracer
+from typing import Dict, Any, List
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 from typing import Type
 from api.here import HereAPI
 
+logger = logging.getLogger(__name__)
+
 class RouteInput(BaseModel):
     route_query: str = Field(..., description="The origin and destination of the route, separated by ' to '. For example: 'New York to Los Angeles'")
 
 class RouteTool(BaseTool):
     name = "route"
     description = "Useful for calculating a route between two locations and getting the distance and travel time. Input should be in the format 'origin to destination'."
-    args_schema = RouteInput
+    args_schema: Type[BaseModel] = RouteInput
     api: HereAPI
+    debug: bool = Config.DEBUG
 
-    def _run(self, tool_input: Dict[str, Any]) -> str:
-        print("Tool input is ", tool_input)
+    def _run(self, tool_input: Dict[str, Any]) -> Route:
         """Params is  {'origin': 'Berlin, Germany', 'destination': 'Munich, Germany'}
 """
         origin, destination = tool_input['origin'], tool_input['destination']
-        print("Origin is ", origin)
-        print("Destination is ", destination)
-        result = self.api.calculate_route(origin, destination)
-        print("Result is ", result)
-        if result.get('routes'):
-            route = result['routes'][0]
-            summary = route['sections'][0]['summary']
-            return f"Route from {origin} to {destination}: Distance {summary['length']/1000:.2f} km, Duration {summary['duration']/3600:.2f} hours"
-        return f"Unable to calculate route from {origin} to {destination}"
-
-    async def _arun(self, tool_input: Dict[str, Any]) -> str:
-        return self._run(tool_input)
\ No newline at end of file
+        with tracer.span("tool.route", origin=origin, destination=destination):
+            result = self.api.calculate_route(origin, destination)
+            logger.debug("Route from %r to %r: %s", origin, destination, result)
+            return self._result(origin, destination, result)
+
+    async def _arun(self, tool_input: Dict[str, Any]) -> Route:
+        origin, destination = tool_input['origin'], tool_input['destination']
+        with tracer.span("tool.route", origin=origin, destination=destination):
+            result = await self.api.acalculate_route(origin, destination)
+            logger.debug("Route from %r to %r: %s", origin, destination, result)
+            return self._result(origin, destination, result)
+
+    def matrix(self, origins: List[str], destinations: List[str]) -> RouteMatrix:
+        """Travel-time/distance matrix for many origins and destinations;
+        addresses are geocoded once each, coordinates are used as is."""
+        with tracer.span("tool.route_matrix", origins=len(origins), destinations=len(destinations)):
+            addresses = _addresses(origins + destinations)
+            with ThreadPoolExecutor(max_workers=self.api.max_connections_per_host) as pool:
+                results = list(pool.map(propagate(self.api.geocode), addresses))
+            positions = self._positions(addresses, results)
+            return self.api.route_matrix([positions.get(place, place) for place in origins],
+                                         [positions.get(place, place) for place in destinations])
+
+    async def amatrix(self, origins: List[str], destinations: List[str]) -> RouteMatrix:
+        with tracer.span("tool.route_matrix", origins=len(origins), destinations=len(destinations)):
+            addresses = _addresses(origins + destinations)
+            results = await asyncio.gather(*(self.api.ageocode(address) for address in addresses))
+            positions = self._positions(addresses, results)
+            return await self.api.aroute_matrix([positions.get(place, place) for place in origins],
+                                                [positions.get(place, place) for place in destinations])
+
+    def _positions(self, addresses: List[str], results: List[Dict[str, Any]]) -> Dict[str, str]:
+        positions = {}
+        for address, result in zip(addresses, results):
+            if not result.get('items'):
+                raise ValueError(f"Unable to geocode the address: {address}")
+            position = result['items'][0]['position']
+            positions[address] = f"{position['lat']},{position['lng']}"
+        return positions
+
+    def _result(self, origin: str, destination: str, result: Dict[str, Any]) -> Route:
+        if not result.get('routes'):
+            raise ValueError(f"Unable to calculate route from {origin} to {destination}")
+        summary = result['routes'][0]['sections'][0]['summary']
+        return Route(origin, destination, summary['length'], summary['duration'], result if self.debug else None)
+
+
+_LAT_LON = re.compile(r"^\s*-?\d+(?:\.\d+)?\s*,\s*-?\d+(?:\.\d+)?\s*$")
+
+
+def _addresses(places: List[str]) -> List[str]:
+    return [place for place in dict.fromkeys(places) if not _LAT_LON.match(place)]
@@ -1,3 +1,136 @@
+from os import getenv
+
+
 class Config:
-    HERE_API_KEY = "API_KEY"
-    MODEL_PATH = "MODEL_PATH"
+    # Keeps the raw HERE responses on tool results.
+    DEBUG = getenv("DEBUG", "0") == "1"
+
+    # Tracing spans for every pipeline stage, fed into the /metrics
+    # histograms and kept for /traces. Set TRACE_EXPORT_PATH (JSON lines)
+    # and/or TRACE_OTLP_ENDPOINT (e.g. http://collector:4318/v1/traces) to
+    # export them as OTLP/JSON.
+    TRACING_ENABLED = getenv("TRACING_ENABLED", "1") == "1"
+    TRACE_SERVICE_NAME = getenv("TRACE_SERVICE_NAME", "navigation-assistant")
+    TRACE_EXPORT_PATH = getenv("TRACE_EXPORT_PATH", "")
+    TRACE_OTLP_ENDPOINT = getenv("TRACE_OTLP_ENDPOINT", "")
+    TRACE_BUFFER_SIZE = int(getenv("TRACE_BUFFER_SIZE", "2048"))
+    TRACE_FLUSH_INTERVAL = float(getenv("TRACE_FLUSH_INTERVAL", "2"))
+
+    HERE_API_KEY = getenv("HERE_API_KEY", "API_KEY")
+    MODEL_PATH = getenv("MODEL_PATH", "MODEL_PATH")
+
+    HERE_GEOCODE_URL = getenv("HERE_GEOCODE_URL", "https://geocode.search.hereapi.com/v1/geocode")
+    HERE_ROUTE_URL = getenv("HERE_ROUTE_URL", "https://router.hereapi.com/v8/routes")
+    HERE_DISCOVER_URL = getenv("HERE_DISCOVER_URL", "https://discover.search.hereapi.com/v1/discover")
+    HERE_AUTOSUGGEST_URL = getenv("HERE_AUTOSUGGEST_URL", "https://autosuggest.search.hereapi.com/v1/autosuggest")
+
+    # Matrix routing for HereAPI.route_matrix; an empty URL falls back to
+    # concurrent single-route calls. Larger matrices are split into blocks.
+    HERE_MATRIX_URL = getenv("HERE_MATRIX_URL", "https://matrix.router.hereapi.com/v8/matrix")
+    HERE_MATRIX_MAX_ORIGINS = int(getenv("HERE_MATRIX_MAX_ORIGINS", "15"))
+    HERE_MATRIX_MAX_DESTINATIONS = int(getenv("HERE_MATRIX_MAX_DESTINATIONS", "100"))
+
+    HERE_TIMEOUT = float(getenv("HERE_TIMEOUT", "10"))
+    HERE_MAX_CONNECTIONS = int(getenv("HERE_MAX_CONNECTIONS", "100"))
+    HERE_MAX_CONNECTIONS_PER_HOST = int(getenv("HERE_MAX_CONNECTIONS_PER_HOST", "10"))
+    # Requests per second across all async HERE calls; 0 means unlimited.
+    HERE_RATE_LIMIT = float(getenv("HERE_RATE_LIMIT", "0"))
+
+    # Records processed concurrently by batch.py and /query/batch.
+    BATCH_CONCURRENCY = int(getenv("BATCH_CONCURRENCY", "16"))
+
+    # Model backend from models/registry.py: "llama" runs MODEL_PATH with
+    # llama.cpp; "stub" answers with canned YAML from STUB_LLM_RESPONSES after
+    # STUB_LLM_DELAY_MS (see loadtest.py). Setting LLM_QUANTIZATION (e.g.
+    # Q4_K_M, Q8_0) fetches that GGUF from LLM_HF_REPO instead of MODEL_PATH.
+    # On CPU-only nodes set LLM_GPU_LAYERS=0. LLM_PROMPT_BATCH_SIZE is
+    # llama.cpp's n_batch, the prompt tokens evaluated per forward pass.
+    # "ollama" sends prompts to OLLAMA_MODEL on OLLAMA_BASE_URL, "bedrock" to
+    # BEDROCK_MODEL_ID in AWS_REGION, and "gpt4all" runs MODEL_PATH with
+    # GPT4All; for these LLM_SLOTS is the number of prompts in flight.
+    LLM_BACKEND = getenv("LLM_BACKEND", "llama")
+    LLM_QUANTIZATION = getenv("LLM_QUANTIZATION", "")
+    LLM_HF_REPO = getenv("LLM_HF_REPO", "MaziyarPanahi/Mistral-7B-Instruct-v0.3-GGUF")
+    OLLAMA_BASE_URL = getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    OLLAMA_MODEL = getenv("OLLAMA_MODEL", "mistral")
+    BEDROCK_MODEL_ID = getenv("BEDROCK_MODEL_ID", "mistral.mistral-7b-instruct-v0:2")
+    AWS_REGION = getenv("AWS_REGION", "us-east-1")
+    LLM_CONTEXT_LENGTH = int(getenv("LLM_CONTEXT_LENGTH", "8048"))
+    LLM_PROMPT_BATCH_SIZE = int(getenv("LLM_PROMPT_BATCH_SIZE", "512"))
+    LLM_GPU_LAYERS = int(getenv("LLM_GPU_LAYERS", "35"))
+    LLM_MAX_TOKENS = int(getenv("LLM_MAX_TOKENS", "8000"))
+    STUB_LLM_RESPONSES = getenv("STUB_LLM_RESPONSES", "")
+    STUB_LLM_DELAY_MS = float(getenv("STUB_LLM_DELAY_MS", "200"))
+
+    # Local LLM batching: each prompt starts on the first of LLM_SLOTS
+    # llama.cpp contexts to free up and returns as soon as it is done.
+    # LLM_THREADS=0 splits the CPU cores evenly between the slots. Every slot
+    # costs its own KV cache (about 1 GB for Mistral 7B at the default
+    # 8048-token context) and, with LLM_GPU_LAYERS > 0, its own copy of the
+    # offloaded layers in VRAM (about 4 GB for all 35 at Q4_K_M); on a GPU
+    # with room for only one copy set LLM_SLOTS=1.
+    LLM_SLOTS = int(getenv("LLM_SLOTS", "2"))
+    LLM_THREADS = int(getenv("LLM_THREADS", "0"))
+    # Directory for the saved KV state of the static system-prompt prefix;
+    # empty keeps it in memory only.
+    LLM_PREFIX_CACHE_DIR = getenv("LLM_PREFIX_CACHE_DIR", "")
+    # Generate tool selections against utils/grammar.py instead of free text;
+    # LLM_CONSTRAINED_MAX_TOKENS is set with the plan settings below.
+    LLM_CONSTRAINED_DECODING = getenv("LLM_CONSTRAINED_DECODING", "1") == "1"
+    # llama.cpp's own logging and echoing generated tokens to stdout.
+    LLM_VERBOSE = getenv("LLM_VERBOSE", "0") == "1"
+
+    # Warm-up generation run in the background after startup; /ready only
+    # reports ready once it has finished.
+    WARMUP_ENABLED = getenv("WARMUP_ENABLED", "1") == "1"
+    WARMUP_QUERY = getenv("WARMUP_QUERY", "What are the coordinates of Berlin?")
+    WARMUP_MAX_TOKENS = int(getenv("WARMUP_MAX_TOKENS", "8"))
+
+    # Inference workers only wait on the batching scheduler, so keep a few
+    # prompts queued for each slot to pick up the moment it frees; 0 means
+    # four per slot of the current model, resized when POST /model swaps it.
+    INFERENCE_WORKERS = int(getenv("INFERENCE_WORKERS", "0"))
+    # Bearer token POST /model requires; swapping is disabled while unset.
+    MODEL_ADMIN_TOKEN = getenv("MODEL_ADMIN_TOKEN", "")
+    INFERENCE_QUEUE_SIZE = int(getenv("INFERENCE_QUEUE_SIZE", "8"))
+    INFERENCE_RETRY_AFTER = int(getenv("INFERENCE_RETRY_AFTER", "5"))
+
+    # Multi-step tool plans: the LLM may return up to PLAN_MAX_STEPS dependent
+    # tool calls; each step is abandoned after PLAN_STEP_TIMEOUT seconds.
+    PLAN_MAX_STEPS = int(getenv("PLAN_MAX_STEPS", "8"))
+    PLAN_STEP_TIMEOUT = float(getenv("PLAN_STEP_TIMEOUT", "15"))
+    # Token cap on a constrained tool selection. A completion cut off by it
+    # is not valid YAML, so by default it leaves room for a full plan of
+    # PLAN_MAX_STEPS steps; utils/grammar.py rejects a cap that does not.
+    LLM_CONSTRAINED_MAX_TOKENS = int(getenv("LLM_CONSTRAINED_MAX_TOKENS", str(32 + 64 * PLAN_MAX_STEPS)))
+
+    # Regex fast path that answers obvious queries without the LLM. LLM
+    # decisions are appended to ROUTER_DECISION_LOG for `python -m agents.router`.
+    ROUTER_ENABLED = getenv("ROUTER_ENABLED", "1") == "1"
+    ROUTER_THRESHOLD = float(getenv("ROUTER_THRESHOLD", "0.9"))
+    ROUTER_DECISION_LOG = getenv("ROUTER_DECISION_LOG", "")
+
+    # Reuses NavigationResults for paraphrased queries. Results older than
+    # SEMANTIC_CACHE_RESULT_TTL re-run the tool call but skip the LLM.
+    SEMANTIC_CACHE_ENABLED = getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+    SEMANTIC_CACHE_MODEL = getenv("SEMANTIC_CACHE_MODEL", "all-MiniLM-L6-v2")
+    SEMANTIC_CACHE_THRESHOLD = float(getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+    SEMANTIC_CACHE_SIZE = int(getenv("SEMANTIC_CACHE_SIZE", "2048"))
+    SEMANTIC_CACHE_RESULT_TTL = float(getenv("SEMANTIC_CACHE_RESULT_TTL", "900"))
+
+    # Directory built by `python -m api.poi_index build`; discover and
+    # autosuggest answer from it and only call HERE on a local miss.
+    POI_INDEX_PATH = getenv("POI_INDEX_PATH", "")
+
+    # Result cache in front of HERE. TTLs are in seconds; 0 disables caching
+    # for that endpoint. HERE_CACHE_PATH enables the on-disk SQLite tier.
+    HERE_CACHE_SIZE = int(getenv("HERE_CACHE_SIZE", "1024"))
+    HERE_CACHE_PATH = getenv("HERE_CACHE_PATH", "")
+    HERE_CACHE_COORD_PRECISION = int(getenv("HERE_CACHE_COORD_PRECISION", "4"))
+    HERE_CACHE_TTLS = {
+        "geocode": float(getenv("HERE_CACHE_TTL_GEOCODE", str(7 * 24 * 3600))),
+        "route": float(getenv("HERE_CACHE_TTL_ROUTE", "3600")),
+        "matrix": float(getenv("HERE_CACHE_TTL_MATRIX", "3600")),
+        "discover": float(getenv("HERE_CACHE_TTL_DISCOVER", str(24 * 3600))),
+        "autosuggest": float(getenv("HERE_CACHE_TTL_AUTOSUGGEST", str(24 * 3600))),
+    }
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class ExecutorSaturated(Exception):
+    pass
+
+
+class InferenceExecutor:
+    """Runs blocking LLM calls on a fixed pool of worker threads.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    wait for a worker; anything beyond that is rejected with
+    ``ExecutorSaturated`` instead of piling up behind the model.
+    """
+
+    def __init__(self, max_workers: int = 1, max_queue: int = 8, window: int = 256):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._failed = 0
+        self._waits = deque(maxlen=window)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(
+                    f"Inference queue is full ({self.max_queue} waiting, {self.max_workers} running)"
+                )
+            self._pending += 1
+            self._submitted += 1
+        enqueued_at = time.monotonic()
+
+        def job():
+            with self._lock:
+                self._waits.append(time.monotonic() - enqueued_at)
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        # The slot is held until the pool is done with the job, not until
+        # the awaiting task is; a cancelled caller must not free it early.
+        future = self._pool.submit(job)
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wrap_future(future)
+            with self._lock:
+                self._completed += 1
+            return result
+        except asyncio.CancelledError:
+            # Drops the job if it is still queued; a running one finishes.
+            future.cancel()
+            raise
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+
+    def resize(self, max_workers: int):
+        """Runs new calls on a pool of ``max_workers``; calls already handed
+        to the old pool finish there."""
+        with self._lock:
+            old, self._pool = self._pool, ThreadPoolExecutor(max_workers=max_workers,
+                                                             thread_name_prefix="inference")
+            self.max_workers = max_workers
+        old.shutdown(wait=False)
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+        stats["wait_seconds"] = {
+            "avg": sum(waits) / len(waits) if waits else 0.0,
+            "p50": waits[len(waits) // 2] if waits else 0.0,
+            "p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "max": waits[-1] if waits else 0.0,
+        }
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,35 @@
+from utils.config import Config
+
+# A plan step with typical params takes about 40 tokens; the four-step
+# example plan in the prompt is about 160.
+MIN_TOKENS_PER_STEP = 40
+
+
+def plan_rule(max_steps: int, max_tokens: int) -> str:
+    if max_steps < 1:
+        raise ValueError(f"PLAN_MAX_STEPS must be at least 1, got {max_steps}")
+    if max_tokens < MIN_TOKENS_PER_STEP * max_steps + 16:
+        raise ValueError(f"LLM_CONSTRAINED_MAX_TOKENS={max_tokens} is too small for plans of "
+                         f"PLAN_MAX_STEPS={max_steps} steps; use at least {MIN_TOKENS_PER_STEP * max_steps + 16}")
+    return 'plan        ::= "action: plan\\nsteps:\\n" step' + " step?" * (max_steps - 1)
+
+
+# GBNF grammar for NavigationAgent tool selection. It accepts exactly the
+# action/params YAML the agent parses, with double-quoted values so every
+# completion is valid YAML with string params, and it ends as soon as the
+# last param line is written. Plans are capped at PLAN_MAX_STEPS steps.
+NAVIGATION_GRAMMAR = r'''
+root        ::= geocode | route | search | plan
+geocode     ::= "action: geocode\nparams:\n    address: " string "\n"
+route       ::= "action: route\nparams:\n    origin: " string "\n    destination: " string "\n"
+search      ::= "action: " ("discover" | "autosuggest") "\nparams:\n    q: " string "\n" at?
+at          ::= "    at: \"" coordinate "," coordinate "\"\n"
+{plan}
+step        ::= "    - id: " ident "\n      action: " tool "\n      params:\n" param param? param?
+param       ::= "          " key ": " string "\n"
+key         ::= "address" | "origin" | "destination" | "q" | "at"
+tool        ::= "geocode" | "route" | "discover" | "autosuggest"
+ident       ::= [a-z] [a-z0-9_]*
+coordinate  ::= "-"? [0-9]+ ("." [0-9]+)?
+string      ::= "\"" ([^"\\\n] | "\\" ["\\/bfnrt])+ "\""
+'''.replace("{plan}", plan_rule(Config.PLAN_MAX_STEPS, Config.LLM_CONSTRAINED_MAX_TOKENS))
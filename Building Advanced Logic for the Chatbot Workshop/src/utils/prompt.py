@@ -20,7 +20,7 @@ When responding to queries, you MUST follow these strict guidelines:
 
 1. ALWAYS use the exact tool names: 'geocode', 'route', 'discover', or 'autosuggest'.
 
-2. For EVERY query, you MUST respond in the following YAML format:
+2. For EVERY single-step query, you MUST respond in the following YAML format:
 
 ```yaml
 action: <either 'geocode', 'route', 'discover', or 'autosuggest'>
@@ -64,11 +64,21 @@ params:
 explanation: <explanation>
 ```
 
-7. If a query is ambiguous, choose the most likely action and explain your reasoning in the explanation field.
+7. If a query needs several tool calls (for example routes to places that first have to be found), respond with a plan instead. Each step has an id, and a param can use the result of an earlier step: $<id> is the first place that step found, $<id>.1 the second, and so on. Steps that do not depend on each other run at the same time.
+```yaml
+action: plan
+steps:
+    - id: <short name>
+      action: <'geocode', 'route', 'discover', or 'autosuggest'>
+      params:
+          <parameters for that action, may refer to $<id> of earlier steps>
+```
 
-8. NEVER use any other format or include any text outside of the YAML structure.
+8. If a query is ambiguous, choose the most likely action and explain your reasoning in the explanation field.
 
-9. ALWAYS include full details in the params to ensure accurate results.
+9. NEVER use any other format or include any text outside of the YAML structure.
+
+10. ALWAYS include full details in the params to ensure accurate results.
 
 Examples:
 
@@ -109,6 +119,31 @@ params:
     q: Ber
 explanation: The user is looking for suggestions based on an incomplete input, which is best handled by the autosuggest tool.
 ```
-{Retrieved context}
 
-Remember, ALWAYS use this YAML format and ONLY use the tool names 'geocode', 'route', 'discover', and 'autosuggest'. Your response should NEVER contain any text outside of this YAML structure."""
\ No newline at end of file
+User query: "Route from Hotel Adlon to the two nearest museums"
+Response:
+```yaml
+action: plan
+steps:
+    - id: hotel
+      action: geocode
+      params:
+          address: Hotel Adlon Kempinski, Unter den Linden 77, 10117 Berlin, Germany
+    - id: museums
+      action: discover
+      params:
+          q: museum
+          at: $hotel
+    - id: route1
+      action: route
+      params:
+          origin: $hotel
+          destination: $museums
+    - id: route2
+      action: route
+      params:
+          origin: $hotel
+          destination: $museums.1
+```
+
+Remember, ALWAYS use this YAML format and ONLY use the tool names 'geocode', 'route', 'discover', and 'autosuggest' (or 'plan' for several of them). Your response should NEVER contain any text outside of this YAML structure."""
\ No newline at end of file
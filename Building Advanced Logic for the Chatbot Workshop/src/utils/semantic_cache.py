@@ -0,0 +1,156 @@
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class SentenceTransformerEmbedder:
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def __call__(self, text: str) -> np.ndarray:
+        return self.model.encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+class SemanticCacheEntry:
+    __slots__ = ("query", "action", "params", "raw_output", "result", "updated_at")
+
+    def __init__(self, query: str, action: str, params: Dict[str, Any], raw_output: str, result: Any):
+        self.query = query
+        self.action = action
+        self.params = params
+        self.raw_output = raw_output
+        self.result = result
+        self.updated_at = time.time()
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of NavigationResults keyed on query embeddings.
+
+    Embeddings live in a fixed-size matrix (``max_entries`` rows) and the
+    least recently used row is overwritten when it is full. A match also has
+    to be the same request, with ``parse`` (e.g. the router's regex tier)
+    reading the params out of both queries where it can, so that "Berlin to
+    Munich" is never served for "Berlin to Hamburg" or "Munich to Berlin".
+    """
+
+    def __init__(self, embed: Callable[[str], np.ndarray], threshold: float = 0.92,
+                 max_entries: int = 2048, result_ttl: float = 900,
+                 parse: Optional[Callable[[str], Any]] = None):
+        self.embed = embed
+        self.parse = parse
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.result_ttl = result_ttl
+        self._matrix: Optional[np.ndarray] = None
+        self._entries: Dict[int, SemanticCacheEntry] = {}
+        self._lru: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._similarities = Counter()
+
+    def lookup(self, embedding: np.ndarray, query: str) -> Optional[SemanticCacheEntry]:
+        with self._lock:
+            self._counts["lookups"] += 1
+            if not self._entries:
+                self._counts["misses"] += 1
+                return None
+            rows = np.fromiter(self._entries.keys(), dtype=np.int64)
+            similarities = self._matrix[rows] @ embedding
+            best = int(np.argmax(similarities))
+            row, similarity = int(rows[best]), float(similarities[best])
+            self._similarities[f"{min(similarity, 0.999) // 0.05 * 0.05:.2f}"] += 1
+
+            entry = self._entries[row]
+            if similarity < self.threshold:
+                self._counts["misses"] += 1
+                return None
+            if not _same_request(query, entry, self.parse):
+                self._counts["guard_rejections"] += 1
+                return None
+            self._lru.move_to_end(row)
+            self._counts["hits"] += 1
+            return entry
+
+    def is_fresh(self, entry: SemanticCacheEntry) -> bool:
+        return time.time() - entry.updated_at < self.result_ttl
+
+    def refresh(self, entry: SemanticCacheEntry, result: Any):
+        with self._lock:
+            entry.result = result
+            entry.updated_at = time.time()
+            self._counts["refreshes"] += 1
+
+    def add(self, embedding: np.ndarray, query: str, result: Any):
+        entry = SemanticCacheEntry(query, result.action, result.params or {}, result.raw_response, result)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+            if len(self._entries) < self.max_entries:
+                row = len(self._entries)
+            else:
+                row, _ = self._lru.popitem(last=False)
+                self._counts["evictions"] += 1
+            self._matrix[row] = embedding
+            self._entries[row] = entry
+            self._lru[row] = None
+            self._lru.move_to_end(row)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counts["lookups"]
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hit_rate": self._counts["hits"] / lookups if lookups else 0.0,
+                "counts": dict(self._counts),
+                "best_similarity_histogram": dict(sorted(self._similarities.items())),
+            }
+
+
+_TOKEN = re.compile(r"\w+")
+
+
+def _same_request(query: str, entry: SemanticCacheEntry, parse: Optional[Callable[[str], Any]]) -> bool:
+    """Whether ``query`` asks for the same thing as the cached ``entry``.
+
+    When ``parse`` reads the action and params (e.g. origin and destination)
+    from both queries, they have to agree word for word; when it reads only
+    one of them the roles cannot be compared and it is not a match.
+    Otherwise the words the user typed in the cached query that ended up in
+    its params (the LLM may have expanded "Berlin" to "Berlin, Germany")
+    must all be in ``query``.
+    """
+    if parse is not None:
+        parsed, cached = parse(query), parse(entry.query)
+        if parsed is not None and cached is not None:
+            return parsed.action == cached.action and \
+                {key: _words(value) for key, value in parsed.params.items()} == \
+                {key: _words(value) for key, value in cached.params.items()}
+        if parsed is not None or cached is not None:
+            return False
+    return _mentions_params(query, entry.query, entry.params)
+
+
+def _words(text: str) -> set:
+    return {token for token in _TOKEN.findall(str(text).lower()) if len(token) > 2}
+
+
+def _mentions_params(query: str, cached_query: str, params: Dict[str, Any]) -> bool:
+    tokens = _words(query)
+    typed = _words(cached_query)
+    return all(_words(value) & typed <= tokens for value in _param_values(params))
+
+
+def _param_values(params: Dict[str, Any]) -> List[str]:
+    if "steps" in params:
+        # A plan matches if the query mentions every step's own params;
+        # "$step" references are resolved at run time.
+        return [value for step in params["steps"] for value in _param_values(step.get("params") or {})]
+    return [str(value) for key, value in params.items() if key != "at" and value and "$" not in str(value)]
@@ -0,0 +1,191 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import requests
+
+from utils.config import Config
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_SPAN_SECONDS = REGISTRY.histogram(
+    "navigation_span_duration_seconds", "Duration of each traced pipeline stage.", ("span", "status"))
+
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The span in the OTLP/JSON encoding."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """Collects nested timing spans for the query pipeline.
+
+    The active span lives in a context variable, so spans opened in awaited
+    coroutines and tasks nest under the caller's; work handed to a thread
+    pool has to be wrapped with ``propagate``. Every finished span feeds the
+    ``navigation_span_duration_seconds`` histogram, is kept in a ring of
+    recent spans and, when configured, is exported as OTLP/JSON to a
+    JSON-lines file and/or an OTLP/HTTP collector.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = Config.TRACING_ENABLED,
+        service_name: str = Config.TRACE_SERVICE_NAME,
+        export_path: str = Config.TRACE_EXPORT_PATH,
+        otlp_endpoint: str = Config.TRACE_OTLP_ENDPOINT,
+        buffer_size: int = Config.TRACE_BUFFER_SIZE,
+        flush_interval: float = Config.TRACE_FLUSH_INTERVAL,
+    ):
+        self.enabled = enabled
+        self.service_name = service_name
+        self.export_path = export_path
+        self.otlp_endpoint = otlp_endpoint
+        self.flush_interval = flush_interval
+        self._recent: "deque[Span]" = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._pending: List[Span] = []
+        self._flusher: Optional[threading.Thread] = None
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = _current.get()
+        span = Span(name, parent.trace_id if parent else os.urandom(16).hex(),
+                    parent.span_id if parent else None, attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current.reset(token)
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        _SPAN_SECONDS.observe(span.duration, span=span.name, status="error" if span.error else "ok")
+        with self._lock:
+            self._recent.append(span)
+            if self.export_path or self.otlp_endpoint:
+                self._pending.append(span)
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name="trace-export", daemon=True)
+                    self._flusher.start()
+
+    def export(self, spans: Optional[Iterable[Span]] = None) -> Dict[str, Any]:
+        """An OTLP/JSON ExportTraceServiceRequest for ``spans`` (default: the
+        recent ones)."""
+        if spans is None:
+            with self._lock:
+                spans = list(self._recent)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "navigation"}, "spans": [span.to_dict() for span in spans]}],
+        }]}
+
+    def recent(self, trace_id: Optional[str] = None) -> List[Span]:
+        with self._lock:
+            spans = list(self._recent)
+        return [span for span in spans if trace_id is None or span.trace_id == trace_id]
+
+    def flush(self):
+        with self._lock:
+            spans, self._pending = self._pending, []
+        if not spans:
+            return
+        payload = self.export(spans)
+        if self.export_path:
+            with open(self.export_path, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+        if self.otlp_endpoint:
+            try:
+                requests.post(self.otlp_endpoint, json=payload, timeout=5)
+            except requests.RequestException as e:
+                logger.warning("Trace export to %s failed: %s", self.otlp_endpoint, e)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Trace export failed")
+
+
+def propagate(fn: Callable) -> Callable:
+    """Binds ``fn`` to the caller's context so spans it opens on another
+    thread nest under the caller's span."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time.
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+tracer = Tracer()
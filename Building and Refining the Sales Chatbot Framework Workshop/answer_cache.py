@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain.chains import RetrievalQA
+from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.documents import Document
+
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "db/answer_cache.sqlite")
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))  # Cosine similarity for a hit
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(re.sub(r"[^\w\s%$.,]", " ", question.lower()).split()).rstrip(".")
+
+
+def chunk_signature(docs: List[Document]) -> List[str]:
+    """Identifies the exact context an answer was based on: the id of each
+    chunk plus a hash of the text the prompt got from it."""
+    return sorted(
+        f"{doc.metadata.get('filename')}#{doc.metadata.get('chunk_index')}-{doc.metadata.get('last_chunk_index')}:"
+        f"{hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest()[:16]}"
+        for doc in docs
+    )
+
+
+class AnswerCache:
+    """Answers on disk in SQLite, found by question embedding similarity
+    among the entries built from the same retrieved chunks.
+
+    As the key includes the chunk hashes, an answer stops matching as soon
+    as ingestion changes any chunk it was based on; ``prune`` then deletes
+    such entries for good.
+    """
+
+    def __init__(self, embeddings, path: str = ANSWER_CACHE_PATH, similarity: float = ANSWER_CACHE_SIMILARITY):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.embeddings = embeddings
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers "
+            "(id INTEGER PRIMARY KEY, question TEXT, embedding BLOB, chunks TEXT, chunk_hashes TEXT, answer TEXT)")
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(normalize_question(question)), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def get(self, question: str, docs: List[Document]) -> Optional[str]:
+        vector = self._embed(question)
+        with self._lock:
+            rows = self._db.execute("SELECT embedding, answer FROM answers WHERE chunks = ?",
+                                    (json.dumps(chunk_signature(docs)),)).fetchall()
+            best, answer = -1.0, None
+            for embedding, cached in rows:
+                score = float(np.dot(vector, np.frombuffer(embedding, dtype=np.float32)))
+                if score > best:
+                    best, answer = score, cached
+            if best >= self.similarity:
+                self.hits += 1
+                return answer
+            self.misses += 1
+            return None
+
+    def put(self, question: str, docs: List[Document], answer: str):
+        # Packed context merges chunks; each lists all the chunks it holds.
+        chunk_hashes = sorted({chunk_hash for doc in docs
+                               for chunk_hash in doc.metadata.get("chunk_hashes", [doc.metadata.get("chunk_hash")])
+                               if chunk_hash})
+        vector = self._embed(question)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO answers (question, embedding, chunks, chunk_hashes, answer) VALUES (?, ?, ?, ?, ?)",
+                (question, vector.tobytes(), json.dumps(chunk_signature(docs)), json.dumps(chunk_hashes), answer))
+            self._db.commit()
+
+    def prune(self, vectorstore) -> int:
+        """Deletes answers based on chunks that are no longer stored."""
+        stored = {metadata.get("chunk_hash") for metadata in vectorstore.get(include=["metadatas"])["metadatas"]}
+        with self._lock:
+            stale = [answer_id for answer_id, chunk_hashes in self._db.execute("SELECT id, chunk_hashes FROM answers")
+                     if not set(json.loads(chunk_hashes)) <= stored]
+            self._db.executemany("DELETE FROM answers WHERE id = ?", [(answer_id,) for answer_id in stale])
+            self._db.commit()
+        return len(stale)
+
+
+class CachedRetrievalQA(RetrievalQA):
+    """RetrievalQA that answers from ``answer_cache`` when the same question
+    was asked about the same chunks; the result says whether it was
+    ``cached``."""
+
+    answer_cache: Any
+
+    def _call(self, inputs: Dict[str, Any],
+              run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, Any]:
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs[self.input_key]
+        docs = self._get_docs(question, run_manager=_run_manager)
+        answer = self.answer_cache.get(question, docs)
+        cached = answer is not None
+        if not cached:
+            answer = self.combine_documents_chain.run(
+                input_documents=docs, question=question, callbacks=_run_manager.get_child())
+            self.answer_cache.put(question, docs, answer)
+        result = {self.output_key: answer, "cached": cached}
+        if self.return_source_documents:
+            result["source_documents"] = docs
+        return result
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    from langchain_chroma import Chroma
+
+    from embeddings import EmbeddingService
+    from ingestion import ingest_file
+    from llms import StubChatModel
+
+    parser = argparse.ArgumentParser(description="Ask a question set twice through the answer cache, offline.")
+    parser.add_argument("questions", help="JSON lines with a 'question'")
+    parser.add_argument("files", nargs="+", help="Documents to index")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("-k", type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.questions) as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings = EmbeddingService(args.model, cache_path=os.path.join(tmp, "embeddings.sqlite"))
+        vectorstore = Chroma(persist_directory=tmp, embedding_function=embeddings, collection_name="documents")
+        for path in args.files:
+            with open(path, "rb") as f:
+                file_type = "application/pdf" if path.endswith(".pdf") else "text/plain"
+                ingest_file(vectorstore, os.path.basename(path), file_type, f.read(), 1000, 200)
+
+        llm = StubChatModel()
+        cache = AnswerCache(embeddings, path=os.path.join(tmp, "answers.sqlite"))
+        chain = CachedRetrievalQA.from_chain_type(
+            llm=llm, retriever=vectorstore.as_retriever(search_kwargs={"k": args.k}), answer_cache=cache)
+        for round_name, asked in (("first", questions), ("repeated", [q.upper() + "  " for q in questions])):
+            calls = llm.calls
+            for question in asked:
+                chain.invoke({"query": question})
+            print(f"{round_name:9} round: {llm.calls - calls} LLM calls, hit rate so far {cache.hit_rate:.0%}")
+
+        # Changing a document invalidates the answers based on it.
+        ingest_file(vectorstore, os.path.basename(args.files[0]), "text/plain", b"Replaced content.", 1000, 200)
+        print(f"pruned {cache.prune(vectorstore)} answers after re-ingesting {os.path.basename(args.files[0])}")
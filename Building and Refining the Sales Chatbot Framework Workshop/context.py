@@ -0,0 +1,126 @@
+import logging
+from typing import Any, List, NamedTuple, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from retrieval import estimate_tokens, tokenize
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_SIMILARITY = 0.9  # Word-set Jaccard similarity above which a chunk counts as a duplicate
+
+
+class PackingStats(NamedTuple):
+    chunks_in: int
+    chunks_out: int
+    tokens_in: int
+    tokens_out: int
+    merged: int
+    duplicates: int
+    dropped: int
+
+    @property
+    def saved(self) -> float:
+        return 1 - self.tokens_out / self.tokens_in if self.tokens_in else 0.0
+
+
+def _end(doc: Document) -> int:
+    return doc.metadata["start_index"] + len(doc.page_content)
+
+
+def _chunk_hashes(doc: Document) -> List[str]:
+    if "chunk_hashes" in doc.metadata:
+        return list(doc.metadata["chunk_hashes"])
+    return [doc.metadata["chunk_hash"]] if "chunk_hash" in doc.metadata else []
+
+
+def merge_adjacent(docs: List[Document]) -> Tuple[List[Document], int]:
+    """Joins chunks that follow each other in the same file into one,
+    writing the text they overlap on only once. A merged chunk lists the
+    hashes of all the chunks it was built from in ``chunk_hashes``."""
+    positioned = [doc for doc in docs if "chunk_index" in doc.metadata and "start_index" in doc.metadata]
+    others = [doc for doc in docs if "chunk_index" not in doc.metadata or "start_index" not in doc.metadata]
+    positioned.sort(key=lambda doc: (doc.metadata.get("filename", ""), doc.metadata["chunk_index"]))
+    merged: List[Document] = []
+    count = 0
+    for doc in positioned:
+        previous = merged[-1] if merged else None
+        if (previous is not None and previous.metadata.get("filename") == doc.metadata.get("filename")
+                and previous.metadata["last_chunk_index"] + 1 == doc.metadata["chunk_index"]):
+            overlap = max(_end(previous) - doc.metadata["start_index"], 0)
+            previous.page_content += ("" if overlap else "\n") + doc.page_content[overlap:]
+            previous.metadata["last_chunk_index"] = doc.metadata["chunk_index"]
+            previous.metadata["chunk_hashes"] += _chunk_hashes(doc)
+            previous.metadata["relevance_score"] = max(previous.metadata["relevance_score"],
+                                                       doc.metadata["relevance_score"])
+            count += 1
+        else:
+            merged.append(Document(page_content=doc.page_content,
+                                   metadata={**doc.metadata, "last_chunk_index": doc.metadata["chunk_index"],
+                                             "chunk_hashes": _chunk_hashes(doc)}))
+    return merged + others, count
+
+
+def pack_context(docs: List[Document], token_budget: int) -> Tuple[List[Document], PackingStats]:
+    """Fits retrieved chunks into ``token_budget`` tokens of prompt context.
+
+    Adjacent and overlapping chunks of a file are merged, near-duplicates
+    of a more relevant chunk are dropped, and the rest are taken in order of
+    relevance while they fit. Relevance is ``metadata["relevance_score"]``
+    when the retriever sets it, otherwise the retrieval order.
+    """
+    scored = [Document(page_content=doc.page_content,
+                       metadata={**doc.metadata, "relevance_score": doc.metadata.get("relevance_score", -rank)})
+              for rank, doc in enumerate(docs)]
+    merged, merge_count = merge_adjacent(scored)
+    merged.sort(key=lambda doc: doc.metadata["relevance_score"], reverse=True)
+
+    kept: List[Document] = []
+    kept_words = []
+    duplicates = dropped = 0
+    tokens = 0
+    for doc in merged:
+        words = set(tokenize(doc.page_content))
+        if any(len(words & other) / max(len(words | other), 1) >= DUPLICATE_SIMILARITY for other in kept_words):
+            duplicates += 1
+            continue
+        doc_tokens = estimate_tokens(doc.page_content)
+        if tokens + doc_tokens > token_budget:
+            if kept:
+                dropped += 1
+                continue
+            # Always keep the most relevant chunk, cut down to the budget.
+            doc.page_content = doc.page_content[:token_budget * 4]
+            doc_tokens = estimate_tokens(doc.page_content)
+        kept.append(doc)
+        kept_words.append(words)
+        tokens += doc_tokens
+
+    stats = PackingStats(
+        chunks_in=len(docs),
+        chunks_out=len(kept),
+        tokens_in=sum(estimate_tokens(doc.page_content) for doc in docs),
+        tokens_out=tokens,
+        merged=merge_count,
+        duplicates=duplicates,
+        dropped=dropped,
+    )
+    return kept, stats
+
+
+class ContextPacker(BaseRetriever):
+    """Wraps a retriever so that a chain's "stuff" step gets packed context."""
+
+    retriever: Any
+    token_budget: int = 1500
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        packed, stats = pack_context(docs, self.token_budget)
+        logger.info(
+            "Context for %r: %d chunks, %d tokens -> %d chunks, %d tokens (%.0f%% saved; %d merged, "
+            "%d duplicates, %d over budget)", query, stats.chunks_in, stats.tokens_in, stats.chunks_out,
+            stats.tokens_out, stats.saved * 100, stats.merged, stats.duplicates, stats.dropped)
+        return packed
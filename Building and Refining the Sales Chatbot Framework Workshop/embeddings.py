@@ -0,0 +1,223 @@
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch, onnx or onnx-int8
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "db/embedding_cache.sqlite")  # Empty disables the cache
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))  # Largest batch per model call
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5"))  # How long a batch waits to fill up
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))  # Batches encoded concurrently
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # Intra-op threads per batch, 0 for the default
+
+ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"  # Quantized export shipped in the sentence-transformers repos
+
+
+def load_encoder(model_name: str, backend: str, threads: int = 0):
+    """A SentenceTransformer on CPU, running on torch or onnxruntime."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(model_name, device="cpu")
+    if backend in ("onnx", "onnx-int8"):
+        model_kwargs = {}
+        if backend == "onnx-int8":
+            model_kwargs["file_name"] = ONNX_INT8_FILE
+        if threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = threads
+            model_kwargs["session_options"] = session_options
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+class EmbeddingCache:
+    """Vectors on disk in SQLite, keyed by the hash of the model and text."""
+
+    def __init__(self, path: str, namespace: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay under SQLite's limit on query parameters.
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()])
+            self._db.commit()
+
+
+class EmbeddingService(Embeddings):
+    """Embeddings shared by every session of the app.
+
+    Texts from concurrent callers are queued and encoded together in
+    batches of up to ``batch_size``, each batch waiting at most
+    ``max_wait_ms`` for more texts to arrive. Vectors are cached on disk by
+    text hash, so a chunk or question is only ever embedded once per model.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = EMBEDDING_BACKEND,
+        cache_path: str = EMBEDDING_CACHE_PATH,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_MAX_WAIT_MS,
+        workers: int = EMBEDDING_WORKERS,
+        threads: int = EMBEDDING_THREADS,
+        normalize: bool = True,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.normalize = normalize
+        self.encoder = load_encoder(model_name, backend, threads)
+        self.cache = EmbeddingCache(cache_path, f"{model_name}:{backend}:{normalize}") if cache_path else None
+        self.batches = 0
+        self.texts_encoded = 0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._batch_loop, name=f"embedding-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _next_batch(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.perf_counter(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                vectors = self.encoder.encode([text for text, _ in batch], batch_size=len(batch),
+                                              normalize_embeddings=self.normalize, convert_to_numpy=True)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts_encoded += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector.tolist())
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.key(text) for text in texts] if self.cache else list(texts)
+        found = self.cache.get_many(keys) if self.cache else {}
+        # Each distinct missing text is queued once, even if repeated.
+        futures: Dict[str, Future] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in futures:
+                futures[key] = Future()
+                self._queue.put((text, futures[key]))
+        computed = {key: future.result() for key, future in futures.items()}
+        if self.cache and computed:
+            self.cache.put_many(computed)
+        return [found[key] if key in found else computed[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> Dict[str, float]:
+        stats = {
+            "batches": self.batches,
+            "texts_encoded": self.texts_encoded,
+            "mean_batch_size": round(self.texts_encoded / self.batches, 1) if self.batches else 0.0,
+        }
+        if self.cache:
+            lookups = self.cache.hits + self.cache.misses
+            stats["cache_hit_rate"] = round(self.cache.hits / lookups, 3) if lookups else 0.0
+        return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    from ingestion import extract_pages, make_text_splitter
+    from pypdf import PdfReader
+
+    parser = argparse.ArgumentParser(description="Compare embedding throughput against HuggingFaceEmbeddings.")
+    parser.add_argument("files", nargs="+", help="PDF or text files to chunk and embed")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backend", action="append", dest="backends",
+                        help="torch, onnx or onnx-int8; repeatable (default: torch)")
+    parser.add_argument("--callers", type=int, default=8, help="Concurrent callers embedding single queries")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args()
+
+    text_splitter = make_text_splitter(args.chunk_size, args.chunk_overlap)
+    chunks = []
+    for path in args.files:
+        if path.endswith(".pdf"):
+            pages = extract_pages(path, 0, len(PdfReader(path).pages))
+        else:
+            with open(path) as f:
+                pages = [f.read()]
+        chunks.extend(text_splitter.split_text("\n".join(pages)))
+    queries = [chunk[:200] for chunk in chunks]
+    print(f"{len(chunks)} chunks from {len(args.files)} files")
+
+    def measure(name: str, embeddings: Embeddings):
+        started = time.perf_counter()
+        embeddings.embed_documents(chunks)
+        documents_s = time.perf_counter() - started
+        # Concurrent single-query calls, as from several chat sessions.
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.callers) as pool:
+            list(pool.map(embeddings.embed_query, queries))
+        queries_s = time.perf_counter() - started
+        print(f"{name:32} documents {len(chunks) / documents_s:8.1f} chunks/s   "
+              f"queries {len(queries) / queries_s:8.1f} queries/s")
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    measure("HuggingFaceEmbeddings", HuggingFaceEmbeddings(
+        model_name=args.model, model_kwargs={"device": "cpu"}, encode_kwargs={"normalize_embeddings": True}))
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends or ["torch"]:
+            service = EmbeddingService(args.model, backend=backend, cache_path=os.path.join(tmp, f"{backend}.sqlite"))
+            measure(f"EmbeddingService[{backend}] cold", service)
+            measure(f"EmbeddingService[{backend}] cached", service)
+            print(f"{'':32} {service.stats()}")
@@ -0,0 +1,287 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from pypdf import PdfReader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+INGEST_WORKERS = os.cpu_count() or 2  # Processes extracting PDF pages in parallel
+PAGES_PER_TASK = 16  # Pages each extraction task handles
+EMBED_BATCH_SIZE = 64  # Chunks per embedding/add_texts call
+
+
+class IngestResult(NamedTuple):
+    filename: str
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    skipped: bool = False  # the whole file was already indexed
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.deleted)
+
+    def summary(self) -> str:
+        if self.skipped:
+            return "already up to date"
+        return f"{self.added} new, {self.updated} updated, {self.unchanged} unchanged, {self.deleted} removed chunks"
+
+
+class IngestionJob:
+    """Progress of one file through the pipeline, read by the UI while a
+    worker thread updates it."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.state = "queued"  # queued, running, done or failed
+        self.pages_total = 0
+        self.pages_done = 0
+        self.chunks_done = 0
+        self.result: Optional[IngestResult] = None
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+    @property
+    def progress(self) -> float:
+        if self.state == "done":
+            return 1.0
+        return self.pages_done / self.pages_total if self.pages_total else 0.0
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def pages_per_s(self) -> float:
+        return self.pages_done / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks_done / self.elapsed if self.elapsed else 0.0
+
+    def describe(self) -> str:
+        if self.state == "queued":
+            return f"{self.filename}: queued"
+        if self.state == "failed":
+            return f"Error processing {self.filename}: {self.error}"
+        rates = f"{self.pages_per_s:.1f} pages/s, {self.chunks_per_s:.1f} chunks/s"
+        if self.state == "done":
+            return f"Processed {self.filename}: {self.result.summary()} ({rates})"
+        return f"{self.filename}: {self.pages_done}/{self.pages_total} pages, {self.chunks_done} chunks ({rates})"
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def extract_pages(path: str, start: int, stop: int) -> List[str]:
+    """Runs in an extraction worker process."""
+    pdf_reader = PdfReader(path)
+    return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+def iter_pages(path: str, file_type: str, job: IngestionJob,
+               executor: Optional[Executor] = None) -> Iterator[str]:
+    """Yields the file's pages in order; with an ``executor`` all page ranges
+    are extracted in parallel, ahead of the caller consuming them."""
+    if file_type != "application/pdf":
+        job.pages_total = 1
+        with open(path, "rb") as f:
+            yield f.read().decode()
+        return
+    job.pages_total = len(PdfReader(path).pages)
+    ranges = [(start, min(start + PAGES_PER_TASK, job.pages_total))
+              for start in range(0, job.pages_total, PAGES_PER_TASK)]
+    if executor is None:
+        for start, stop in ranges:
+            yield from extract_pages(path, start, stop)
+        return
+    futures = [executor.submit(extract_pages, path, start, stop) for start, stop in ranges]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def make_text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""],
+        add_start_index=True
+    )
+
+
+def make_chunk_id(file_key: str, chunk_hash: str, seen: Dict[str, int]) -> str:
+    """Stable Chroma id: the file plus the chunk's content hash, with a
+    counter for chunks that repeat within the file."""
+    seen[chunk_hash] = seen.get(chunk_hash, 0) + 1
+    return f"{file_key}-{chunk_hash[:32]}-{seen[chunk_hash]}"
+
+
+def ingest_file(vectorstore, filename: str, file_type: str, data: bytes,
+                chunk_size: int, chunk_overlap: int, job: Optional[IngestionJob] = None,
+                executor: Optional[Executor] = None, batch_size: int = EMBED_BATCH_SIZE) -> IngestResult:
+    """Brings the file's chunks in ``vectorstore`` up to date with ``data``.
+
+    Chunks are keyed on their content hash, so only chunks that are new
+    are embedded, chunks that moved just get their metadata updated and
+    chunks no longer in the file are deleted. An unchanged file is
+    recognised from its hash without being read at all; the hash is only
+    stamped on the chunks once everything else is stored, so an ingestion
+    that stopped part way is redone on the next upload. Pages are split
+    as they are extracted and the chunks are stored in batches of
+    ``batch_size``, recording progress on ``job``.
+    """
+    job = job or IngestionJob(filename)
+    file_hash = content_hash(data)
+    existing = vectorstore.get(where={"filename": filename}, include=["metadatas"])
+    existing_metadata = dict(zip(existing["ids"], existing["metadatas"]))
+    if existing_metadata and all(meta.get("file_hash") == file_hash for meta in existing_metadata.values()):
+        job.chunks_done = len(existing_metadata)
+        return IngestResult(filename, unchanged=len(existing_metadata), skipped=True)
+
+    text_splitter = make_text_splitter(chunk_size, chunk_overlap)
+    file_key = content_hash(filename.encode("utf-8"))[:12]
+    seen: Dict[str, int] = {}
+    ids = set()
+    new_texts, new_metadatas, new_ids = [], [], []
+    moved_metadatas, moved_ids = [], []
+    stamp_metadatas, stamp_ids = [], []
+    added = updated = 0
+
+    def flush():
+        nonlocal added, updated
+        if moved_ids:
+            # Same text, so the stored embedding is still valid.
+            vectorstore._collection.update(ids=moved_ids, metadatas=moved_metadatas)
+        if new_ids:
+            vectorstore.add_texts(texts=new_texts, metadatas=new_metadatas, ids=new_ids)
+        added += len(new_ids)
+        updated += len(moved_ids)
+        job.chunks_done += len(new_ids) + len(moved_ids)
+        for pending in (new_texts, new_metadatas, new_ids, moved_metadatas, moved_ids):
+            pending.clear()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Extraction workers read the file from disk rather than each
+        # being sent a copy of it.
+        path = os.path.join(tmp, "upload")
+        with open(path, "wb") as f:
+            f.write(data)
+
+        offset = 0
+        for page_number, page in enumerate(iter_pages(path, file_type, job, executor)):
+            for chunk in text_splitter.create_documents([page]):
+                chunk_hash = content_hash(chunk.page_content.encode("utf-8"))
+                chunk_id = make_chunk_id(file_key, chunk_hash, seen)
+                metadata = {
+                    "filename": filename,
+                    "type": file_type,
+                    "chunk_hash": chunk_hash,
+                    "chunk_index": len(ids),
+                    "page": page_number,
+                    "start_index": offset + chunk.metadata["start_index"],
+                }
+                ids.add(chunk_id)
+                stored = existing_metadata.get(chunk_id)
+                if stored is None or stored.get("file_hash") != file_hash:
+                    stamp_metadatas.append({**metadata, "file_hash": file_hash})
+                    stamp_ids.append(chunk_id)
+                if stored is None:
+                    new_texts.append(chunk.page_content)
+                    new_metadatas.append(metadata)
+                    new_ids.append(chunk_id)
+                elif {key: value for key, value in stored.items() if key != "file_hash"} != metadata:
+                    moved_metadatas.append(metadata)
+                    moved_ids.append(chunk_id)
+                else:
+                    job.chunks_done += 1
+            # Pages are joined with a newline, as in the original extraction.
+            offset += len(page) + 1
+
+            if len(new_ids) + len(moved_ids) >= batch_size:
+                flush()
+            if not new_ids and not moved_ids:
+                job.pages_done = page_number + 1
+        flush()
+        job.pages_done = job.pages_total
+
+    removed = sorted(set(existing_metadata) - ids)
+    if removed:
+        vectorstore.delete(ids=removed)
+    # Marks the file as fully ingested, so this goes last.
+    for start in range(0, len(stamp_ids), batch_size):
+        vectorstore._collection.update(ids=stamp_ids[start:start + batch_size],
+                                       metadatas=stamp_metadatas[start:start + batch_size])
+    return IngestResult(filename, added=added, updated=updated,
+                        unchanged=len(ids) - added - updated, deleted=len(removed))
+
+
+class IngestionPipeline:
+    """Ingests uploads in the background so the app stays responsive.
+
+    Files are processed one at a time on a worker thread while their pages
+    are extracted by a pool of processes. Jobs are keyed on file name and
+    content, so submitting the same upload again returns the existing job.
+    ``on_change`` is called with the result of each job that added, updated
+    or removed chunks.
+    """
+
+    def __init__(self, vectorstore, chunk_size: int, chunk_overlap: int,
+                 workers: int = INGEST_WORKERS, batch_size: int = EMBED_BATCH_SIZE,
+                 on_change: Optional[Callable[[IngestResult], None]] = None):
+        self.vectorstore = vectorstore
+        self.on_change = on_change
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = batch_size
+        # Spawned rather than forked, as the app process is multi-threaded.
+        self._extractors = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestion")
+        self._lock = threading.Lock()
+        self.jobs: Dict[str, IngestionJob] = {}
+
+    def submit(self, filename: str, file_type: str, data: bytes) -> IngestionJob:
+        file_key = f"{filename}:{content_hash(data)}"
+        with self._lock:
+            job = self.jobs.get(file_key)
+            if job is None or job.state == "failed":
+                job = self.jobs[file_key] = IngestionJob(filename)
+                self._runner.submit(self._run, job, file_type, data)
+        return job
+
+    def _run(self, job: IngestionJob, file_type: str, data: bytes):
+        job.state = "running"
+        job.started = time.perf_counter()
+        try:
+            job.result = ingest_file(self.vectorstore, job.filename, file_type, data,
+                                     self.chunk_size, self.chunk_overlap, job=job,
+                                     executor=self._extractors, batch_size=self.batch_size)
+            job.state = "done"
+            if job.result.changed and self.on_change is not None:
+                self.on_change(job.result)
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+        finally:
+            job.finished = time.perf_counter()
+
+    def shutdown(self):
+        self._runner.shutdown(wait=True)
+        self._extractors.shutdown()
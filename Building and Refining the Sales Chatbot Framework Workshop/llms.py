@@ -0,0 +1,34 @@
+import os
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel, SimpleChatModel
+from langchain_core.messages import BaseMessage
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "bedrock")  # bedrock, or stub to run offline
+
+
+class StubChatModel(SimpleChatModel):
+    """Offline stand-in for Bedrock that answers with the end of the prompt,
+    counting its calls."""
+
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+              run_manager: Any = None, **kwargs: Any) -> str:
+        self.calls += 1
+        prompt = messages[-1].content if messages else ""
+        return f"Stub answer to: {' '.join(prompt.split())[-200:]}"
+
+
+def create_chat_model(model_id: str, temperature: float, region: str, backend: str = LLM_BACKEND) -> BaseChatModel:
+    if backend == "bedrock":
+        from langchain_aws import ChatBedrock
+
+        return ChatBedrock(model_id=model_id, model_kwargs={"temperature": temperature}, region_name=region)
+    if backend == "stub":
+        return StubChatModel()
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,79 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from langchain.chains import LLMChain
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain.prompts import PromptTemplate
+from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.messages import BaseMessage
+
+from retrieval import estimate_tokens
+
+# Words that only make sense with the earlier conversation ("what about it?",
+# "and the cost?"); questions without them are used as-is.
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|she|him|her|his|there|above|previous|earlier|"
+    r"same|again|more|else|also|other|another|former|latter|my|me|i|we|our|you said)\b"
+    r"|^(and|but|so|or|what about|how about|why)\b",
+    re.IGNORECASE,
+)
+MIN_STANDALONE_WORDS = 4  # Shorter questions are assumed to be follow-ups
+
+SHORTEN_SUMMARY_PROMPT = PromptTemplate.from_template(
+    "Shorten this summary of a conversation to at most {max_words} words, keeping the facts most likely "
+    "to matter for later questions.\n\nSummary:\n{summary}\n\nShorter summary:"
+)
+
+
+def needs_history(question: str) -> bool:
+    return len(question.split()) < MIN_STANDALONE_WORDS or bool(FOLLOW_UP_PATTERN.search(question.strip()))
+
+
+def count_tokens(messages: List[BaseMessage]) -> int:
+    return sum(estimate_tokens(message.content) for message in messages)
+
+
+class SummarizingMemory(ConversationSummaryBufferMemory):
+    """Conversation memory for one session whose size stays flat.
+
+    The last ``max_turns`` turns are kept verbatim; older turns, and recent
+    ones while the buffer is over ``max_token_limit`` tokens including the
+    summary, are folded into a running summary with one LLM call. The
+    latest turn is always kept. A summary that outgrows what the kept turns
+    leave of the budget, but at least a quarter of it, is shortened with
+    another LLM call and cut off if that is not enough.
+    """
+
+    max_turns: int = 5
+
+    def prune(self) -> None:
+        buffer = self.chat_memory.messages
+        pruned_memory = []
+        # A turn is a question and its answer.
+        while len(buffer) > 2 and (len(buffer) > 2 * self.max_turns or
+                                   estimate_tokens(self.moving_summary_buffer) + count_tokens(buffer) >
+                                   self.max_token_limit):
+            pruned_memory.extend(buffer[:2])
+            del buffer[:2]
+        if pruned_memory:
+            self.moving_summary_buffer = self.predict_new_summary(pruned_memory, self.moving_summary_buffer)
+        budget = max(self.max_token_limit - count_tokens(buffer), self.max_token_limit // 4)
+        if estimate_tokens(self.moving_summary_buffer) > budget:
+            self.moving_summary_buffer = self._shorten(self.moving_summary_buffer, budget)
+
+    def _shorten(self, summary: str, budget: int) -> str:
+        # About three words per four tokens.
+        chain = LLMChain(llm=self.llm, prompt=SHORTEN_SUMMARY_PROMPT)
+        shortened = chain.predict(summary=summary, max_words=budget * 3 // 4).strip()
+        return shortened[:budget * 4]
+
+
+class CondenseQuestionChain(LLMChain):
+    """Rewrites a follow-up question into a standalone one, skipping the
+    LLM call for questions that already stand on their own."""
+
+    def _call(self, inputs: Dict[str, Any],
+              run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, str]:
+        if not needs_history(inputs["question"]):
+            return {self.output_key: inputs["question"]}
+        return super()._call(inputs, run_manager)
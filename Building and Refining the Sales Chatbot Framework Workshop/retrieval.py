@@ -0,0 +1,171 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from rank_bm25 import BM25Okapi
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")  # Empty disables reranking
+RRF_K = 60  # Rank offset in reciprocal rank fusion; damps the weight of the top ranks
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count, at about four characters per token."""
+    return len(text) // 4
+
+
+def doc_key(doc: Document) -> Tuple[Any, Any]:
+    # Chunks from older ingestions have no chunk_index; fall back to the text.
+    return doc.metadata.get("filename"), doc.metadata.get("chunk_index", doc.page_content)
+
+
+def load_reranker(model_name: str = RERANK_MODEL):
+    if not model_name:
+        return None
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name, device="cpu")
+
+
+class BM25Index:
+    """A BM25 index over every chunk in the vector store, built on the
+    first search and rebuilt on the next one after ``invalidate``, which
+    ingestion calls when it adds, removes or updates chunks."""
+
+    def __init__(self, vectorstore):
+        self.vectorstore = vectorstore
+        self._lock = threading.Lock()
+        self._stale = True
+        self._bm25: Optional[BM25Okapi] = None
+        self._docs: List[Document] = []
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+
+    def refresh(self):
+        with self._lock:
+            if not self._stale:
+                return
+            stored = self.vectorstore.get(include=["documents", "metadatas"])
+            self._docs = [Document(page_content=text, metadata=metadata)
+                          for text, metadata in zip(stored["documents"], stored["metadatas"])]
+            self._bm25 = BM25Okapi([tokenize(doc.page_content) for doc in self._docs]) if self._docs else None
+            self._stale = False
+
+    def search(self, query: str, k: int) -> List[Document]:
+        self.refresh()
+        with self._lock:
+            if self._bm25 is None:
+                return []
+            scores = self._bm25.get_scores(tokenize(query))
+            ranked = sorted(range(len(self._docs)), key=lambda i: scores[i], reverse=True)
+            return [self._docs[i] for i in ranked[:k] if scores[i] > 0]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], rrf_k: int = RRF_K) -> List[Document]:
+    scores: Dict[Tuple[Any, Any], float] = {}
+    docs: Dict[Tuple[Any, Any], Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [Document(page_content=docs[key].page_content,
+                     metadata={**docs[key].metadata, "relevance_score": scores[key]})
+            for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses BM25 and vector search with reciprocal rank fusion, then has a
+    cross-encoder rerank the candidates down to ``top_k`` chunks. Each
+    returned chunk carries its score in ``metadata["relevance_score"]``."""
+
+    vectorstore: Any
+    index: Any
+    reranker: Any = None
+    candidates: int = 20
+    top_k: int = 4
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, reranker=None, **kwargs) -> "HybridRetriever":
+        return cls(vectorstore=vectorstore, index=BM25Index(vectorstore), reranker=reranker, **kwargs)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        fused = reciprocal_rank_fusion([
+            self.vectorstore.similarity_search(query, k=self.candidates),
+            self.index.search(query, self.candidates),
+        ])
+        if self.reranker is None or not fused:
+            return fused[:self.top_k]
+        scores = self.reranker.predict([(query, doc.page_content) for doc in fused])
+        for doc, score in zip(fused, scores):
+            doc.metadata["relevance_score"] = float(score)
+        return sorted(fused, key=lambda doc: doc.metadata["relevance_score"], reverse=True)[:self.top_k]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import tempfile
+
+    from langchain_chroma import Chroma
+
+    from embeddings import EmbeddingService
+    from ingestion import ingest_file
+
+    parser = argparse.ArgumentParser(description="Measure recall@k and context tokens per answer for each retriever.")
+    parser.add_argument("questions", help="JSON lines with a 'question' and the 'evidence' strings that answer it")
+    parser.add_argument("files", nargs="+", help="Documents to index")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--baseline-k", type=int, default=10, help="k of the plain vector retriever")
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.questions) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    def normalized(text: str) -> str:
+        return " ".join(text.split())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vectorstore = Chroma(persist_directory=tmp, embedding_function=EmbeddingService(args.model),
+                             collection_name="documents")
+        for path in args.files:
+            with open(path, "rb") as f:
+                file_type = "application/pdf" if path.endswith(".pdf") else "text/plain"
+                ingest_file(vectorstore, os.path.basename(path), file_type, f.read(),
+                            args.chunk_size, args.chunk_overlap)
+
+        retrievers = {
+            f"vector k={args.baseline_k}": vectorstore.as_retriever(search_kwargs={"k": args.baseline_k}),
+            f"hybrid k={args.top_k}": HybridRetriever.from_vectorstore(
+                vectorstore, candidates=args.candidates, top_k=args.top_k),
+        }
+        reranker = load_reranker()
+        if reranker is not None:
+            retrievers[f"hybrid+rerank k={args.top_k}"] = HybridRetriever.from_vectorstore(
+                vectorstore, reranker=reranker, candidates=args.candidates, top_k=args.top_k)
+
+        print(f"{'retriever':28} {'recall@k':>9} {'tokens/answer':>14}")
+        for name, retriever in retrievers.items():
+            found, tokens = 0, 0
+            for case in cases:
+                docs = retriever.invoke(case["question"])
+                context = normalized(" ".join(doc.page_content for doc in docs))
+                found += all(evidence in context for evidence in case["evidence"])
+                tokens += sum(estimate_tokens(doc.page_content) for doc in docs)
+            print(f"{name:28} {found / len(cases):>9.1%} {tokens / len(cases):>14.0f}")
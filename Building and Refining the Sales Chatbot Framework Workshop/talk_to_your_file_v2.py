@@ -5,6 +5,8 @@ import sys
 
 # Configure logging and warnings before any imports
 logging.getLogger().setLevel(logging.ERROR)
+logging.basicConfig(format="%(asctime)s %(name)s: %(message)s")
+logging.getLogger("context").setLevel(logging.INFO)  # Per-question prompt context sizes
 warnings.filterwarnings('ignore')
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
@@ -14,33 +16,37 @@ os.environ["TORCH_SHOW_CPP_STACKTRACES"] = "0"
 import streamlit as st
 import boto3
 import json
-from pypdf import PdfReader
-from io import BytesIO
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_aws import ChatBedrock
-from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 
+from answer_cache import AnswerCache, CachedRetrievalQA
+from embeddings import EmbeddingService
+from context import ContextPacker
+from ingestion import IngestionPipeline
+from llms import create_chat_model
+from retrieval import HybridRetriever, load_reranker
+
 # Configuration
 PERSIST_DIR = "db"  # ChromaDB persistence directory
 CHUNK_SIZE = 1000   # Size of text chunks
 CHUNK_OVERLAP = 200  # Overlap between chunks
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Model for embeddings
-NUM_CHUNKS = 10  # Number of relevant chunks to retrieve
+NUM_CHUNKS = 4  # Number of chunks passed to the LLM after reranking
+NUM_CANDIDATES = 20  # Candidates from each of BM25 and vector search
+CONTEXT_TOKEN_BUDGET = 1500  # Most prompt tokens spent on document context
 BEDROCK_MODEL = "anthropic.claude-sonnet-4-20250514-v1:0"
 AWS_REGION = "us-east-1"
 TEMPERATURE = 0.1
 
-# Initialize embeddings and vectorstore
+# Initialize embeddings, batched and cached on disk; see embeddings.py for the backend settings
+@st.cache_resource(show_spinner=False)
+def init_embeddings():
+    return EmbeddingService(EMBEDDING_MODEL)
+
+# Initialize vectorstore
 @st.cache_resource(show_spinner=False)
 def init_vectorstore():
-    embeddings = HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL,
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    embeddings = init_embeddings()
     
     os.makedirs(PERSIST_DIR, exist_ok=True)
     vectorstore = Chroma(
@@ -51,17 +57,55 @@ def init_vectorstore():
     
     return vectorstore
 
-# Initialize LLM
+# Initialize hybrid BM25 + vector retrieval with reranking
 @st.cache_resource(show_spinner=False)
-def init_llm():
-    return ChatBedrock(
-        model_id=BEDROCK_MODEL,
-        model_kwargs={"temperature": TEMPERATURE},
-        region_name=AWS_REGION
+def init_retriever():
+    return HybridRetriever.from_vectorstore(
+        init_vectorstore(),
+        reranker=load_reranker(),
+        candidates=NUM_CANDIDATES,
+        top_k=NUM_CHUNKS
     )
 
+# Initialize LLM; LLM_BACKEND=stub answers offline
+@st.cache_resource(show_spinner=False)
+def init_llm():
+    return create_chat_model(BEDROCK_MODEL, TEMPERATURE, AWS_REGION)
+
+# Initialize answer cache, shared by all sessions and kept on disk
+@st.cache_resource(show_spinner=False)
+def init_answer_cache():
+    return AnswerCache(init_embeddings())
+
+# Initialize background ingestion, shared by all sessions
+@st.cache_resource(show_spinner=False)
+def init_pipeline():
+    vectorstore = init_vectorstore()
+    answer_cache = init_answer_cache()
+    index = init_retriever().index
+
+    def on_change(result):
+        # Rebuild BM25 on the next query, and forget answers based on
+        # chunks that ingestion removed
+        index.invalidate()
+        if result.deleted:
+            answer_cache.prune(vectorstore)
+
+    return IngestionPipeline(vectorstore, CHUNK_SIZE, CHUNK_OVERLAP, on_change=on_change)
+
+# Show per-file ingestion progress, refreshed without rerunning the page
+@st.fragment(run_every=1)
+def show_ingestion_progress():
+    for job in st.session_state.ingestion_jobs.values():
+        if job.state == "failed":
+            st.error(job.describe())
+        elif job.state == "done":
+            st.success(job.describe())
+        else:
+            st.progress(job.progress, text=job.describe())
+
 # Create QA Chain
-def create_qa_chain(vectorstore, llm):
+def create_qa_chain(retriever, llm, answer_cache):
     prompt_template = """Use the following pieces of context to answer the question. 
     If you don't know the answer, just say that you don't know, don't try to make up an answer.
     
@@ -78,10 +122,11 @@ def create_qa_chain(vectorstore, llm):
         input_variables=["context", "question"]
     )
     
-    chain = RetrievalQA.from_chain_type(
+    chain = CachedRetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
-        retriever=vectorstore.as_retriever(search_kwargs={"k": NUM_CHUNKS}),
+        retriever=ContextPacker(retriever=retriever, token_budget=CONTEXT_TOKEN_BUDGET),
+        answer_cache=answer_cache,
         return_source_documents=True,
         chain_type_kwargs={"prompt": PROMPT},
         verbose=True
@@ -95,15 +140,18 @@ if 'initialized' not in st.session_state:
     st.session_state.vectorstore = None
     st.session_state.llm = None
     st.session_state.qa_chain = None
-    st.session_state.processed_files = set()
+    st.session_state.pipeline = None
+    st.session_state.ingestion_jobs = {}
 
 # Initialize components if not already done
 if st.session_state.vectorstore is None:
     st.session_state.vectorstore = init_vectorstore()
     st.session_state.llm = init_llm()
+    st.session_state.pipeline = init_pipeline()
     st.session_state.qa_chain = create_qa_chain(
-        st.session_state.vectorstore,
-        st.session_state.llm
+        init_retriever(),
+        st.session_state.llm,
+        init_answer_cache()
     )
 
 # Streamlit UI
@@ -118,34 +166,14 @@ uploaded_files = st.file_uploader(
 
 if uploaded_files:
     for file in uploaded_files:
-        if file.name not in st.session_state.processed_files:
-            with st.spinner(f"Processing {file.name}..."):
-                try:
-                    # Process file content
-                    if file.type == "application/pdf":
-                        pdf_reader = PdfReader(BytesIO(file.read()))
-                        content = "\n".join(page.extract_text() for page in pdf_reader.pages)
-                    else:
-                        content = file.read().decode()
-                    
-                    # Split text
-                    text_splitter = RecursiveCharacterTextSplitter(
-                        chunk_size=CHUNK_SIZE,
-                        chunk_overlap=CHUNK_OVERLAP,
-                        separators=["\n\n", "\n", " ", ""]
-                    )
-                    chunks = text_splitter.split_text(content)
-                    
-                    # Add to vectorstore
-                    st.session_state.vectorstore.add_texts(
-                        texts=chunks,
-                        metadatas=[{"filename": file.name, "type": file.type}] * len(chunks)
-                    )
-                    
-                    st.session_state.processed_files.add(file.name)
-                    st.success(f"Processed {file.name}")
-                except Exception as e:
-                    st.error(f"Error processing {file.name}: {str(e)}")
+        # Ingested in the background; the same upload maps to the same job
+        st.session_state.ingestion_jobs[file.name] = st.session_state.pipeline.submit(
+            file.name,
+            file.type,
+            file.getvalue()
+        )
+
+show_ingestion_progress()
 
 # Question answering using chat input
 if question := st.chat_input("Ask a question about your documents"):
@@ -158,6 +186,10 @@ if question := st.chat_input("Ask a question about your documents"):
         # Show answer and sources
         st.write("### Answer")
         st.write(answer)
+        st.caption(
+            f"{'Answered from cache' if result['cached'] else 'Answered by the LLM'} · "
+            f"cache hit rate {init_answer_cache().hit_rate:.0%}"
+        )
         
         with st.expander("View sources"):
             for doc in source_docs:
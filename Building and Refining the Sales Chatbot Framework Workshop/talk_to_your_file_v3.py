@@ -1,16 +1,20 @@
 import os
+import logging
+
+logging.basicConfig(format="%(asctime)s %(name)s: %(message)s")
+logging.getLogger("context").setLevel(logging.INFO)  # Per-question prompt context sizes
 
 # Now import everything else
 import streamlit as st
-from pypdf import PdfReader
-from io import BytesIO
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationalRetrievalChain
 from langchain_community.chat_models import BedrockChat
 from langchain.prompts import ChatPromptTemplate
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from embeddings import EmbeddingService
+from context import ContextPacker
+from ingestion import IngestionPipeline
+from memory import CondenseQuestionChain, SummarizingMemory
 
 # Configuration
 PERSIST_DIR = "db"  # ChromaDB persistence directory
@@ -18,10 +22,12 @@ CHUNK_SIZE = 1000   # Size of text chunks
 CHUNK_OVERLAP = 200  # Overlap between chunks
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Model for embeddings
 NUM_CHUNKS = 3  # Number of relevant chunks to retrieve
+CONTEXT_TOKEN_BUDGET = 1000  # Most prompt tokens spent on document context
 BEDROCK_MODEL = "anthropic.claude-3-sonnet-20240229-v1:0"  # Claude model version
 AWS_REGION = "us-east-1"  # AWS region for Bedrock
 TEMPERATURE = 0.7  # Temperature for response generation
 MAX_HISTORY = 5  # Maximum number of conversation turns to remember
+MEMORY_TOKEN_BUDGET = 800  # Most prompt tokens spent on the summary and remembered turns
 
 # Initialize ChromaDB with persistence
 os.makedirs(PERSIST_DIR, exist_ok=True)
@@ -38,11 +44,8 @@ def init_chat_model():
 # Initialize embeddings
 @st.cache_resource(show_spinner=False)
 def init_embeddings():
-    return HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL,
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'normalize_embeddings': True}
-    )
+    # Batched and cached on disk; see embeddings.py for the backend settings
+    return EmbeddingService(EMBEDDING_MODEL)
 
 # Initialize ChromaDB and create retriever
 @st.cache_resource(show_spinner=False)
@@ -62,11 +65,30 @@ def init_chromadb():
     
     return vectorstore
 
-# Initialize conversation memory
+# Initialize background ingestion, shared by all sessions
 @st.cache_resource(show_spinner=False)
-def init_memory():
-    return ConversationBufferMemory(
+def init_pipeline():
+    return IngestionPipeline(init_chromadb(), CHUNK_SIZE, CHUNK_OVERLAP)
+
+# Show per-file ingestion progress, refreshed without rerunning the page
+@st.fragment(run_every=1)
+def show_ingestion_progress():
+    for job in st.session_state.ingestion_jobs.values():
+        if job.state == "failed":
+            st.error(job.describe())
+        elif job.state == "done":
+            st.success(job.describe())
+        else:
+            st.progress(job.progress, text=job.describe())
+
+# Initialize conversation memory, one per session
+def init_memory(llm):
+    return SummarizingMemory(
+        llm=llm,
+        max_turns=MAX_HISTORY,
+        max_token_limit=MEMORY_TOKEN_BUDGET,
         memory_key="chat_history",
+        input_key="question",
         return_messages=True,
         output_key="answer"
     )
@@ -93,7 +115,7 @@ def create_conversation_chain(llm, retriever, memory):
 
     PROMPT = ChatPromptTemplate.from_template(template)
 
-    return ConversationalRetrievalChain.from_llm(
+    chain = ConversationalRetrievalChain.from_llm(
         llm=llm,
         retriever=retriever,
         memory=memory,
@@ -101,6 +123,14 @@ def create_conversation_chain(llm, retriever, memory):
         return_source_documents=True,
         verbose=True
     )
+    
+    # Standalone questions skip the question-condensing LLM call
+    chain.question_generator = CondenseQuestionChain(
+        llm=llm,
+        prompt=chain.question_generator.prompt
+    )
+    
+    return chain
 
 # Initialize session state
 if 'chat_history' not in st.session_state:
@@ -110,15 +140,19 @@ if 'vectorstore' not in st.session_state:
     vectorstore = init_chromadb()
     st.session_state.vectorstore = vectorstore
     st.session_state.llm = init_chat_model()
-    st.session_state.memory = init_memory()
+    st.session_state.memory = init_memory(st.session_state.llm)
     st.session_state.chain = create_conversation_chain(
         st.session_state.llm,
-        vectorstore.as_retriever(search_kwargs={"k": NUM_CHUNKS}),
+        ContextPacker(
+            retriever=vectorstore.as_retriever(search_kwargs={"k": NUM_CHUNKS}),
+            token_budget=CONTEXT_TOKEN_BUDGET
+        ),
         st.session_state.memory
     )
 
-if 'processed_files' not in st.session_state:
-    st.session_state.processed_files = set()
+if 'ingestion_jobs' not in st.session_state:
+    st.session_state.pipeline = init_pipeline()
+    st.session_state.ingestion_jobs = {}
 
 # Streamlit UI
 st.title("🤖 AI Assistant & Document Chat")
@@ -142,31 +176,14 @@ with st.sidebar:
     
     if uploaded_files:
         for file in uploaded_files:
-            if file.name not in st.session_state.processed_files:
-                with st.spinner(f"Processing {file.name}..."):
-                    # Read file
-                    if file.type == "application/pdf":
-                        pdf_reader = PdfReader(BytesIO(file.read()))
-                        content = "\n".join(page.extract_text() for page in pdf_reader.pages)
-                    else:
-                        content = file.read().decode()
-                    
-                    # Split text
-                    text_splitter = RecursiveCharacterTextSplitter(
-                        chunk_size=CHUNK_SIZE,
-                        chunk_overlap=CHUNK_OVERLAP,
-                        separators=["\n\n", "\n", " ", ""]
-                    )
-                    chunks = text_splitter.split_text(content)
-                    
-                    # Add to vectorstore
-                    st.session_state.vectorstore.add_texts(
-                        texts=chunks,
-                        metadatas=[{"filename": file.name, "type": file.type}] * len(chunks)
-                    )
-                    
-                    st.session_state.processed_files.add(file.name)
-                    st.success(f"Processed {file.name}")
+            # Ingested in the background; the same upload maps to the same job
+            st.session_state.ingestion_jobs[file.name] = st.session_state.pipeline.submit(
+                file.name,
+                file.type,
+                file.getvalue()
+            )
+    
+    show_ingestion_progress()
     
     if st.button("Clear Chat History"):
         st.session_state.chat_history = []